@@ -0,0 +1,125 @@
+"""
+Écriture différée (write-behind) de la date de dernière activité (`gendate`).
+
+Un login réussi ne fait plus d'UPDATE + commit : il enregistre la date en
+mémoire, et un thread vide le tampon toutes les ACTIVITY_FLUSH_MS en un
+seul `UPDATE ... FROM (VALUES ...)`. Plusieurs logins du même compte entre
+deux vidages ne coûtent qu'une ligne, et un compte déjà actif depuis moins
+de ACTIVITY_GRANULARITY_S secondes n'est pas réécrit du tout.
+"""
+
+import atexit
+import os
+import threading
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+import db
+
+FLUSH_QUERY = """
+    UPDATE users AS u
+    SET gendate = v.gendate
+    FROM (VALUES %s) AS v(id, gendate)
+    WHERE u.id = v.id AND (u.gendate IS NULL OR u.gendate < v.gendate)
+"""
+
+
+class ActivityBuffer:
+    """Tampon user_id -> dernière activité, vidé périodiquement par un thread"""
+
+    def __init__(self, get_connection=db.get_db_connection, flush_interval=0.2, granularity=60.0):
+        self._get_connection = get_connection
+        self.flush_interval = flush_interval
+        self.granularity = timedelta(seconds=granularity)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._stats = {'recorded': 0, 'skipped': 0, 'coalesced': 0, 'flushes': 0, 'rows': 0, 'errors': 0}
+
+    def record(self, user_id, when, stored=None):
+        """Note l'activité ; ignorée si la valeur en base est déjà assez récente"""
+        if stored is not None and when - stored < self.granularity:
+            self._stats['skipped'] += 1
+            return
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is not None:
+                self._stats['coalesced'] += 1
+            if previous is None or previous < when:
+                self._pending[user_id] = when
+            self._stats['recorded'] += 1
+        self._ensure_started()
+
+    def flush(self):
+        """Écrit le tampon en une instruction ; en cas d'échec il est réinjecté"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            conn = None
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                rows = sorted(batch.items())  # ordre stable des verrous de ligne
+                execute_values(cursor, FLUSH_QUERY, rows, template="(%s, %s::timestamp)",
+                               page_size=len(rows))
+                conn.commit()
+                cursor.close()
+            except Exception:
+                self._stats['errors'] += 1
+                with self._lock:
+                    for user_id, when in batch.items():
+                        current = self._pending.get(user_id)
+                        if current is None or current < when:
+                            self._pending[user_id] = when
+                return 0
+            finally:
+                if conn is not None:
+                    conn.close()
+            self._stats['flushes'] += 1
+            self._stats['rows'] += len(batch)
+            return len(batch)
+
+    def close(self):
+        """Arrête le thread et vide le tampon (arrêt du processus)"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        return dict(self._stats, pending=self.pending())
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            if self._stopped:
+                return
+            self.flush()
+
+
+def from_env():
+    """ActivityBuffer configuré par l'environnement (ACTIVITY_*)"""
+    return ActivityBuffer(
+        flush_interval=float(os.getenv('ACTIVITY_FLUSH_MS', '200')) / 1000.0,
+        granularity=float(os.getenv('ACTIVITY_GRANULARITY_S', '60')),
+    )
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime, timedelta
+import psycopg2
+from activity import ActivityBuffer
+
+
+class TestActivityBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.cursor.return_value.connection.encoding = 'UTF8'
+        self.buffer = ActivityBuffer(get_connection=lambda: self.conn, granularity=60)
+        self.buffer._ensure_started = lambda: None  # vidage piloté par le test
+
+    def test_recent_activity_skipped(self):
+        """Valeur en base plus récente que la granularité : aucune écriture"""
+        now = datetime.now()
+        self.buffer.record(1, now, stored=now - timedelta(seconds=10))
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(self.buffer.stats()['skipped'], 1)
+
+    def test_logins_coalesced_to_latest(self):
+        now = datetime.now()
+        self.buffer.record(1, now)
+        self.buffer.record(1, now + timedelta(seconds=1))
+        self.buffer.record(1, now - timedelta(seconds=1))
+        self.buffer.record(2, now)
+        self.assertEqual(self.buffer.pending(), 2)
+        self.assertEqual(self.buffer.stats()['coalesced'], 2)
+        self.assertEqual(self.buffer._pending[1], now + timedelta(seconds=1))
+
+    def test_flush_is_one_statement(self):
+        """Un seul UPDATE ... FROM (VALUES ...) pour tout le tampon"""
+        now = datetime.now()
+        for user_id in range(250):
+            self.buffer.record(user_id, now)
+        cursor = self.conn.cursor.return_value
+        cursor.mogrify.side_effect = lambda template, args: b"(1, now())"
+
+        self.assertEqual(self.buffer.flush(), 250)
+
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertIn(b"FROM (VALUES", cursor.execute.call_args.args[0])
+        self.conn.commit.assert_called_once()
+        self.conn.close.assert_called_once()
+        self.assertEqual(self.buffer.pending(), 0)
+
+    def test_failed_flush_requeues(self):
+        now = datetime.now()
+        self.buffer.record(1, now)
+        self.conn.cursor.return_value.mogrify.side_effect = psycopg2.OperationalError("down")
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(), 1)
+        self.assertEqual(self.buffer.stats()['errors'], 1)
+
+    def test_close_flushes_pending(self):
+        self.buffer.record(1, datetime.now())
+        self.conn.cursor.return_value.mogrify.side_effect = lambda template, args: b"(1, now())"
+        self.buffer.close()
+        self.assertEqual(self.buffer.pending(), 0)
+        self.conn.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import unittest
+
+import codec
+
+Sample = codec.struct('Sample', ('name', str, ''), ('count', int, None), ('flag', bool, False))
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_struct_from_json(self):
+        """Décodage direct des octets, chaînes nettoyées, valeurs par défaut"""
+        sample = Sample.from_json(b'{"name": " alice ", "count": "3"}')
+        self.assertEqual(tuple(sample), ('alice', 3, False))
+        self.assertEqual(Sample.from_json(b''), Sample('', None, False))
+
+    def test_struct_rejects_invalid_types(self):
+        for body, message in ((b'[1]', "request body must be a JSON object"),
+                              (b'{"name": 1}', "name must be a string"),
+                              (b'{"count": true}', "count must be an integer"),
+                              (b'{"count": "x"}', "count must be an integer"),
+                              (b'{"flag": "yes"}', "flag must be a boolean")):
+            with self.assertRaisesRegex(codec.ValidationError, message):
+                Sample.from_json(body)
+
+    def test_invalid_utf8_is_decode_error(self):
+        with self.assertRaises(codec.DecodeError):
+            codec.loads(b'{"name": "\xff"}')
+
+    def test_response_bytes(self):
+        """Corps en bytes compacts, non-ASCII conservé"""
+        resp = codec.error(409, "déjà activé", code=7)
+        self.assertEqual(resp["statusCode"], 409)
+        self.assertIsInstance(resp["body"], bytes)
+        self.assertEqual(json.loads(resp["body"]), {"error": "déjà activé", "success": False, "code": 7})
+        self.assertEqual(json.loads(codec.INVALID_JSON["body"])["error"], "Invalid JSON in request body")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import unittest
+import threading
+from unittest.mock import patch
+import psycopg2
+import psycopg2.extensions
+from db import ConnectionPool, PoolTimeout, ReplicaRouter, execute_prepared, is_replica, parse_replica_hosts
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (self.conn.lag,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+        self.autocommit = False
+        self.lag = 0.0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+
+        def connect():
+            conn = FakeConnection()
+            self.opened.append(conn)
+            return conn
+
+        self.connect = connect
+
+    def test_close_returns_connection_to_pool(self):
+        """Une connexion rendue est réutilisée sans nouvelle poignée de main"""
+        pool = ConnectionPool(self.connect, maxsize=2)
+        conn = pool.getconn()
+        conn.close()
+        conn = pool.getconn()
+        conn.close()
+        self.assertEqual(len(self.opened), 1)
+        self.assertFalse(self.opened[0].closed)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_open_transaction_rolled_back_on_release(self):
+        """Une transaction laissée ouverte par un handler est annulée au retour"""
+        pool = ConnectionPool(self.connect, maxsize=1)
+        conn = pool.getconn()
+        self.opened[0].status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        conn.close()
+        self.assertEqual(self.opened[0].rollbacks, 1)
+
+    def test_unhealthy_idle_connection_replaced(self):
+        """La vérification au checkout remplace une connexion morte"""
+        pool = ConnectionPool(self.connect, maxsize=1, check_idle=0)
+        pool.getconn().close()
+        self.opened[0].broken = True
+        conn = pool.getconn()
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.stats()['unhealthy'], 1)
+        conn.close()
+
+    def test_max_lifetime_recycles_connection(self):
+        """Une connexion trop ancienne est fermée au lieu d'être réutilisée"""
+        pool = ConnectionPool(self.connect, maxsize=1, max_lifetime=0)
+        pool.getconn().close()
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.stats()['recycled'], 1)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_invalidate_recycles_idle_and_in_use(self):
+        """Mot de passe changé : connexions inactives fermées, celles en usage au retour"""
+        pool = ConnectionPool(self.connect, maxsize=2)
+        idle, busy = pool.getconn(), pool.getconn()
+        idle.close()
+        pool.invalidate()
+        self.assertTrue(self.opened[0].closed)
+        busy.close()
+        self.assertTrue(self.opened[1].closed)
+        pool.getconn().close()
+        self.assertEqual(len(self.opened), 3)
+        self.assertEqual(pool.stats()['invalidated'], 2)
+
+    def test_exhausted_pool_times_out(self):
+        """Pool plein : attente bornée puis PoolTimeout (une psycopg2.Error)"""
+        pool = ConnectionPool(self.connect, maxsize=1, timeout=0.05)
+        conn = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertTrue(issubclass(PoolTimeout, psycopg2.Error))
+        conn.close()
+
+    def test_waiter_gets_released_connection(self):
+        """Un thread en attente récupère la connexion rendue par un autre"""
+        pool = ConnectionPool(self.connect, maxsize=1, timeout=2)
+        conn = pool.getconn()
+        got = []
+        t = threading.Thread(target=lambda: got.append(pool.getconn()))
+        t.start()
+        conn.close()
+        t.join()
+        self.assertEqual(len(got), 1)
+        self.assertEqual(len(self.opened), 1)
+        got[0].close()
+
+    def test_failed_connect_frees_slot(self):
+        """Un échec de connexion ne consomme pas de place dans le pool"""
+        def failing():
+            raise psycopg2.OperationalError("could not connect")
+        pool = ConnectionPool(failing, maxsize=1)
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    @patch('db.TRANSACTION_POOLING', False)  # comportement du mode session
+    def test_statement_prepared_once_per_connection(self):
+        """PREPARE au premier usage d'une connexion physique, EXECUTE seul ensuite"""
+        pool = ConnectionPool(self.connect, maxsize=1)
+        for _ in range(3):
+            conn = pool.getconn()
+            conn.autocommit = True
+            execute_prepared(conn, conn.cursor(), 'lookup', "SELECT $1", ('bob',))
+            conn.close()
+        executed = self.opened[0].executed
+        self.assertEqual(executed[0], "PREPARE lookup AS SELECT $1")
+        self.assertEqual(executed[1:], ["EXECUTE lookup (%s)"] * 3)
+        self.assertFalse(self.opened[0].autocommit)  # rétabli au retour dans le pool
+
+
+class TestReplicaRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.down = set()
+        self.lag = {}
+
+        def connector(name):
+            def connect():
+                if name in self.down:
+                    raise psycopg2.OperationalError(f"could not connect to {name}")
+                conn = FakeConnection()
+                conn.name = name
+                conn.lag = self.lag.get(name, 0.0)
+                return conn
+            return connect
+
+        self.primary = ConnectionPool(connector('primary'), maxsize=2)
+        self.router = ReplicaRouter(
+            self.primary,
+            [(name, ConnectionPool(connector(name), maxsize=2, replica=True)) for name in ('r1', 'r2')],
+            max_lag=1.0, retry=60.0, check_interval=0.0,
+        )
+
+    def read(self):
+        conn = self.router.getconn(readonly=True)
+        name = conn.name
+        replica = is_replica(conn)
+        conn.close()
+        return name, replica
+
+    def test_reads_round_robin_over_replicas_writes_on_primary(self):
+        self.assertEqual({self.read() for _ in range(4)}, {('r1', True), ('r2', True)})
+        conn = self.router.getconn()
+        self.assertEqual(conn.name, 'primary')
+        self.assertFalse(is_replica(conn))
+        conn.close()
+        stats = self.router.stats()
+        self.assertEqual((stats['replica'], stats['primary'], stats['fallback']), (4, 1, 0))
+
+    def test_unreachable_replica_skipped_then_primary_fallback(self):
+        self.down.add('r1')
+        self.assertEqual({self.read() for _ in range(4)}, {('r2', True)})
+        self.assertEqual(self.router.stats()['replica_errors'], 1)  # écarté pour `retry` secondes
+        self.assertEqual(self.router.stats()['replicas_healthy'], 1)
+
+        self.down.add('r2')
+        self.assertEqual(self.read(), ('r2', True))  # connexion déjà ouverte dans son pool
+        self.router._replicas[1].pool.invalidate()
+        self.assertEqual(self.read(), ('primary', False))
+        stats = self.router.stats()
+        self.assertEqual((stats['fallback'], stats['replicas_healthy']), (1, 0))
+
+    def test_lagging_replica_skipped(self):
+        self.lag['r1'] = 5.0
+        self.assertEqual({self.read() for _ in range(4)}, {('r2', True)})
+        stats = self.router.stats()
+        self.assertEqual(stats['replica_lagging'], 1)
+        self.assertEqual(stats['replica_max_lag'], 5.0)
+
+    def test_parse_replica_hosts(self):
+        self.assertEqual(parse_replica_hosts(" db-r1:5433, db-r2 ,"), [('db-r1', '5433'), ('db-r2', None)])
+        self.assertEqual(parse_replica_hosts(None), [])
+        with self.assertRaises(ValueError):
+            parse_replica_hosts("db-r1:abc")
+
+
+if __name__ == '__main__':
+    unittest.main()
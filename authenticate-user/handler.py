@@ -1,69 +1,85 @@
-import json
+import logging
 import os
 import psycopg2
-import hashlib
-import pyotp
 from datetime import datetime, timedelta
-import base64, secrets
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-
-def get_db_connection():
-    """Établit une connexion à la base de données PostgreSQL"""
-    db_password = os.getenv('DB_PASSWORD')
-    if db_password is None:
-        for p in ('/var/openfaas/secrets/DB_PASSWORD', '/var/openfaas/secrets/db-creds'):
-            try:
-                with open(p, 'r', encoding='utf-8') as fp:
-                    db_password = fp.read().strip()
-                    break
-            except FileNotFoundError:
-                continue
-        else:
-            db_password = 'password'
-
-    return psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'mspr_db'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=db_password,
-        port=os.getenv('DB_PORT', '5432')
-    )
-
-def hash_password(password):
-    """Hash le mot de passe avec SHA-512"""
-    return hashlib.sha512(password.encode()).hexdigest()
-
-# --- AES-256-GCM setup (même clé que generate-2fa) ---
-_RAW_KEY_B64 = os.getenv('MFA_KEY_B64')
-# Si la variable n'est pas définie, lire le secret monté "mfa-key"
-if not _RAW_KEY_B64:
-    for p in ('/var/openfaas/secrets/MFA_KEY_B64', '/var/openfaas/secrets/mfa-key'):
-        try:
-            with open(p, 'r', encoding='utf-8') as fp:
-                _RAW_KEY_B64 = fp.read().strip()
-                break
-        except FileNotFoundError:
-            continue
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from db import (execute_prepared, get_db_connection, is_replica, pool_stats, reread_connection, routing_stats,
+                transaction)
+from passwords import Overloaded, available_cpus, hash_password, needs_rehash, verify_password
+from totp_cache import TotpCache
+import activity
+import codec
+import jsonlog
+import metrics
+import mfa_keys
+import ratelimit
+import secretstore
+import userfilter
+
+log = logging.getLogger('authenticate-user')
+metrics.register_gauges('db_pool', pool_stats)
+metrics.register_gauges('db_routing', routing_stats)
+metrics.register_gauges('secrets', secretstore.stats)
+
+# TOTP déchiffrés des utilisateurs récemment connectés
+TOTP_CACHE = TotpCache(
+    maxsize=int(os.getenv('TOTP_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('TOTP_CACHE_TTL', '300')),
+)
+metrics.register_gauges('totp_cache', TOTP_CACHE.stats)
+
+# Seaux à jetons par IP et par utilisateur (None si RATE_LIMIT_ENABLED=false)
+RATE_LIMITER = ratelimit.from_env('authenticate-user')
+
+# Dates de dernière activité écrites en différé, en lot
+ACTIVITY = activity.from_env()
+
+# Filtre de Bloom des utilisateurs existants (construit au premier appel)
+USER_FILTER = userfilter.from_env() if userfilter.enabled() else None
+
+# Mode lot : nombre maximal d'identifiants par appel, threads de vérification
+BATCH_MAX = int(os.getenv('AUTH_BATCH_MAX', '100'))
+BATCH_WORKERS = int(os.getenv('AUTH_BATCH_WORKERS', str(available_cpus())))
+
+_dummy_hash = None
+_batch_executor = None
 
-if not _RAW_KEY_B64:
-    raise ValueError("Environment variable MFA_KEY_B64 missing for decrypting 2FA secret (env var or secret)")
-AES_KEY = base64.b64decode(_RAW_KEY_B64)
-if len(AES_KEY) != 32:
-    raise ValueError("MFA_KEY_B64 must decode to 32 bytes")
+def dummy_hash():
+    """Hash au format courant utilisé pour les utilisateurs inconnus (temps constant)"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(18))
+    return _dummy_hash
 
-def decrypt_secret(enc_b64: str) -> str:
-    """Décrypte nonce+ciphertext base64 en secret TOTP"""
-    data = base64.b64decode(enc_b64)
-    nonce, ct = data[:12], data[12:]
-    return AESGCM(AES_KEY).decrypt(nonce, ct, None).decode()
+def decrypt_secret(stored: str) -> str:
+    """Valeur `mfa` stockée -> secret TOTP (clé désignée par le préfixe, voir mfa_keys)"""
+    return mfa_keys.keyring().decrypt(stored)
+
+def load_totp(user_id, mfa_secret):
+    """TOTP prêt à l'emploi pour la valeur `mfa` stockée (cache, sinon déchiffrement)"""
+    totp = TOTP_CACHE.get(user_id, mfa_secret)
+    if totp is None:
+        # Trousseau chargé au premier secret 2FA, pas à l'import (démarrage à froid)
+        started = metrics.clock()
+        mfa_plain = decrypt_secret(mfa_secret)
+        metrics.since('decrypt', started)
+        import pyotp  # import différé : seuls les comptes 2FA en ont besoin
+        totp = pyotp.TOTP(mfa_plain)
+        TOTP_CACHE.put(user_id, mfa_secret, totp)
+    return totp
 
 def verify_totp(secret, token):
-    """Vérifie le code TOTP 2FA"""
+    """Vérifie le code TOTP 2FA (secret base32 ou objet pyotp.TOTP)"""
     if not secret or not token:
         return False
     
     try:
-        totp = pyotp.TOTP(secret)
+        import pyotp
+        totp = secret if isinstance(secret, pyotp.TOTP) else pyotp.TOTP(secret)
         return totp.verify(token, valid_window=1)  # Permet une fenêtre de tolérance de 30 secondes
     except Exception:
         return False
@@ -76,178 +92,375 @@ def is_account_expired(gendate, inactive_months=6):
     expiration_date = gendate + timedelta(days=inactive_months * 30)
     return datetime.now() > expiration_date
 
-def mark_account_expired(cursor, user_id):
-    """Marque un compte comme expiré"""
-    cursor.execute("""
-        UPDATE users 
-        SET expired = %s 
-        WHERE id = %s
-    """, (True, user_id))
+# Requête typée : chaînes, espaces de début et de fin retirés
+Credentials = codec.struct('Credentials', ('username', str, ''), ('password', str, ''), ('totp_code', str, ''))
 
-def handle(event, context):
+# Réponses constantes, encodées une seule fois
+MISSING_CREDENTIALS = codec.error(400, "Username and password are required")
+INVALID_CREDENTIALS = codec.error(401, "Invalid username or password")
+ACCOUNT_EXPIRED = codec.error(403, "Account has expired due to inactivity (6 months)",
+                              expired=True, message="Please contact administrator to reactivate your account")
+TOTP_DECRYPT_FAILED = codec.error(500, "Failed to decrypt 2FA secret")
+TOTP_REQUIRED = codec.error(400, "2FA code is required", requires_2fa=True)
+INVALID_TOTP = codec.error(401, "Invalid 2FA code", requires_2fa=True)
+SERVER_BUSY = codec.response(503, {"error": "Server busy, please retry", "success": False},
+                             headers={"Retry-After": "1"})
+
+def parse_body(event):
+    """Corps JSON de la requête, décodé depuis ses octets ({} s'il est vide)"""
+    return codec.loads(getattr(event, 'body', None))
+
+def credentials_from(body):
+    """Identifiants (username, password, totp_code) validés d'un objet JSON"""
+    return Credentials.from_dict(body)
+
+def parse_credentials(event):
+    """Extrait (username, password, totp_code) du corps JSON de la requête"""
+    return credentials_from(parse_body(event))
+
+def check_user(user, password, totp_code):
+    """
+    Contrôles applicatifs sur la ligne `users` déjà chargée (sans accès base).
+
+    Renvoie la réponse d'erreur, ou None si l'authentification réussit.
+    """
+    if not user:
+        # Même coût qu'un mauvais mot de passe : l'existence du compte ne fuit pas par le temps
+        started = metrics.clock()
+        verify_password(password, dummy_hash())
+        metrics.since('verify_password', started)
+        return INVALID_CREDENTIALS
+
+    user_id, db_username, db_password, mfa_secret, gendate, is_expired = user
+
+    # Compte expiré : le drapeau est posé par la fonction expire-accounts ; un compte
+    # inactif pas encore balayé est refusé de la même façon, sans écriture ici
+    if is_expired or is_account_expired(gendate):
+        return ACCOUNT_EXPIRED
+
+    # Tous formats : $scrypt$/$argon2id$ et anciens SHA-256/SHA-512 hexadécimaux
+    started = metrics.clock()
+    valid = verify_password(password, db_password)
+    metrics.since('verify_password', started)
+    if not valid:
+        jsonlog.event(log, 'auth.failure', reason='password', user_id=user_id)
+        return INVALID_CREDENTIALS
+
+    # Vérifier la 2FA si elle est configurée
+    if mfa_secret:
+        try:
+            totp = load_totp(user_id, mfa_secret)
+        except Exception:
+            jsonlog.event(log, 'auth.totp_decrypt_failed', level=logging.ERROR, user_id=user_id)
+            return TOTP_DECRYPT_FAILED
+
+        if not totp_code:
+            metrics.set_outcome('requires_2fa')
+            return TOTP_REQUIRED
+
+        started = metrics.clock()
+        valid = verify_totp(totp, totp_code)
+        metrics.since('verify_totp', started)
+        if not valid:
+            return INVALID_TOTP
+
+    return None
+
+def success_response(user):
+    """Réponse 200 après authentification réussie"""
+    user_id, username, _, mfa_secret, _, _ = user
+    jsonlog.event(log, 'auth.success', user_id=user_id, has_2fa=bool(mfa_secret))
+    started = metrics.clock()
+    response = codec.response(200, {
+        "success": True,
+        "username": username,
+        "user_id": user_id,
+        "message": "Authentication successful",
+        "has_2fa": bool(mfa_secret),
+        "last_activity": datetime.now().isoformat()
+    })
+    metrics.since('encode', started)
+    return response
+
+def database_error_response(exc):
+    """Réponse 500 pour une erreur PostgreSQL"""
+    jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(exc))
+    return codec.error(500, f"Database error: {str(exc)}")
+
+def error_response(exc):
+    """Traduit une exception inattendue en réponse d'erreur"""
+    if isinstance(exc, Overloaded):
+        return SERVER_BUSY
+    if isinstance(exc, codec.DecodeError):
+        return codec.INVALID_JSON
+    if isinstance(exc, codec.ValidationError):
+        return codec.error(400, str(exc))
+    log.error('internal error', exc_info=exc)
+    return codec.error(500, f"Internal server error: {str(exc)}")
+
+# Préparée une fois par connexion du pool (PREPARE auth_lookup), puis EXECUTE
+AUTH_LOOKUP = """
+    SELECT id, username, password, mfa, gendate, expired
+    FROM users
+    WHERE username = $1
+"""
+
+def lookup_user(conn, cursor, username):
+    """Ligne de l'utilisateur (id, username, password, mfa, gendate, expired) ou None"""
+    execute_prepared(conn, cursor, 'auth_lookup', AUTH_LOOKUP, (username,))
+    return cursor.fetchone()
+
+def fetch_user(username, readonly=False):
+    """
+    (ligne de l'utilisateur ou None, lu sur un réplica) ; la connexion est
+    rendue au pool avant toute vérification de mot de passe. Sans `readonly`,
+    lecture sur le primaire (confirmation d'un résultat de réplica).
+    """
+    conn = get_db_connection(readonly=True) if readonly else reread_connection()
     try:
-        # Parse le body de la requête
-        if hasattr(event, 'body'):
-            body = json.loads(event.body) if event.body else {}
-        else:
-            body = {}
-        
-        username = body.get('username', '').strip()
-        password = body.get('password', '').strip()
-        totp_code = body.get('totp_code', '').strip()
-        
-        if not username or not password:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({
-                    "error": "Username and password are required",
-                    "success": False
-                })
-            }
-        
-        # Connexion à la base de données
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Récupérer les informations de l'utilisateur
-        cursor.execute("""
-            SELECT id, username, password, mfa, gendate, expired 
-            FROM users 
-            WHERE username = %s
-        """, (username,))
-        
-        user = cursor.fetchone()
-        
-        if not user:
+        with transaction(conn), metrics.phase('select'):
+            cursor = conn.cursor()
+            user = lookup_user(conn, cursor, username)
             cursor.close()
-            conn.close()
-            return {
-                "statusCode": 401,
-                "body": json.dumps({
-                    "error": "Invalid username or password",
-                    "success": False
-                })
-            }
-        
-        user_id, db_username, db_password, mfa_secret, gendate, is_expired = user
-        
-        # Vérifier si le compte est expiré ou doit être marqué comme tel
-        if is_expired or is_account_expired(gendate):
-            if not is_expired:
-                mark_account_expired(cursor, user_id)
-                conn.commit()
-            
+        return user, is_replica(conn)
+    finally:
+        conn.close()
+
+def store_rehash(user_id, new_hash):
+    """Migration du hash vers le format courant, toujours sur le primaire"""
+    conn = get_db_connection()
+    try:
+        with transaction(conn):
+            cursor = conn.cursor()
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user_id))
             cursor.close()
-            conn.close()
-            return {
-                "statusCode": 403,
-                "body": json.dumps({
-                    "error": "Account has expired due to inactivity (6 months)",
-                    "success": False,
-                    "expired": True,
-                    "message": "Please contact administrator to reactivate your account"
-                })
-            }
-        
-        # Support des anciens comptes SHA-256 (64 hex) et nouveaux SHA-512 (128 hex)
-        if len(db_password) == 64:
-            hashed_input_password = hashlib.sha256(password.encode()).hexdigest()
-        else:
-            hashed_input_password = hash_password(password)  # SHA-512
+    finally:
+        conn.close()
+
+def confirm_on_primary(user, response, totp_code):
+    """
+    Résultat obtenu sur un réplica à relire sur le primaire : un refus peut
+    venir d'une écriture pas encore répliquée (compte créé, mot de passe
+    changé, compte réactivé), un code 2FA fourni pour un compte sans 2FA d'un
+    enrôlement récent.
+    """
+    return response is not None or bool(totp_code and not user[3])
+
+# Mode lot : toutes les lignes en une requête, préparée comme auth_lookup
+AUTH_LOOKUP_BATCH = """
+    SELECT id, username, password, mfa, gendate, expired
+    FROM users
+    WHERE username = ANY($1)
+"""
 
-        if hashed_input_password != db_password:
-            print("DEBUG auth mismatch:", username, hashed_input_password[:16], db_password[:16])
+REHASH_BATCH = """
+    UPDATE users AS u
+    SET password = v.password
+    FROM (VALUES %s) AS v(id, password)
+    WHERE u.id = v.id
+"""
+
+def lookup_batch(names, readonly=False):
+    """
+    ({username: ligne}, lu sur un réplica) en une requête ; la connexion est
+    rendue au pool avant le calcul des hashs. Sans `readonly`, lecture sur le
+    primaire (confirmation d'un résultat de réplica).
+    """
+    conn = get_db_connection(readonly=True) if readonly else reread_connection()
+    try:
+        with transaction(conn), metrics.phase('select'):
+            cursor = conn.cursor()
+            execute_prepared(conn, cursor, 'auth_lookup_batch', AUTH_LOOKUP_BATCH, (sorted(names),))
+            users = {row[1]: row for row in cursor.fetchall()}
             cursor.close()
-            conn.close()
-            return {
-                "statusCode": 401,
-                "body": json.dumps({
-                    "error": "Invalid username or password",
-                    "success": False
-                })
-            }
-        
-        # Vérifier la 2FA si elle est configurée
-        if mfa_secret:
-            # Décrypter le secret si chiffré (longueur base64 > 32 typiquement)
-            try:
-                if len(mfa_secret) > 40:
-                    mfa_plain = decrypt_secret(mfa_secret)
-                else:
-                    mfa_plain = mfa_secret  # secret non chiffré legacy
-            except Exception:
-                cursor.close(); conn.close()
-                return {"statusCode":500,"body":json.dumps({"error":"Failed to decrypt 2FA secret","success":False})}
-            
-            if not totp_code:
-                cursor.close()
-                conn.close()
-                return {
-                    "statusCode": 400,
-                    "body": json.dumps({
-                        "error": "2FA code is required",
-                        "success": False,
-                        "requires_2fa": True
-                    })
-                }
-            
-            if not verify_totp(mfa_plain, totp_code):
-                cursor.close()
-                conn.close()
-                return {
-                    "statusCode": 401,
-                    "body": json.dumps({
-                        "error": "Invalid 2FA code",
-                        "success": False,
-                        "requires_2fa": True
-                    })
-                }
-        
-        # Authentification réussie - mettre à jour la date de dernière activité
-        cursor.execute("""
-            UPDATE users 
-            SET gendate = %s 
-            WHERE id = %s
-        """, (datetime.now(), user_id))
-        
-        conn.commit()
-        cursor.close()
+        return users, is_replica(conn)
+    finally:
         conn.close()
-        
-        print("DEBUG auth success", username)
-        return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "success": True,
-                "username": username,
-                "user_id": user_id,
-                "message": "Authentication successful",
-                "has_2fa": bool(mfa_secret),
-                "last_activity": datetime.now().isoformat()
-            })
-        }
-        
+
+def batch_executor():
+    """Threads de vérification du mode lot (les hashs passent par le pool de passwords)"""
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='auth-batch')
+    return _batch_executor
+
+def verify_item(user, password, totp_code):
+    """(réponse, nouveau hash ou None) pour un élément du lot"""
+    try:
+        response = check_user(user, password, totp_code)
+        if response is not None:
+            return response, None
+        new_hash = hash_password(password) if needs_rehash(user[2]) else None
+        return success_response(user), new_hash
+    except Exception as e:
+        return error_response(e), None
+
+def batch_result(username, response):
+    """Élément de la réponse du lot : corps de la réponse unitaire + son code"""
+    return dict(codec.loads(response["body"]), username=username, statusCode=response["statusCode"])
+
+def handle_batch(event, items):
+    """
+    Vérifie une liste d'identifiants : un seul SELECT ... = ANY($1), hashs et
+    TOTP vérifiés en parallèle, résultats dans l'ordre de la liste. Les dates
+    d'activité des succès partent ensemble dans le tampon d'activité (un seul
+    UPDATE au prochain vidage) ; les hashs à migrer en un seul UPDATE. Le
+    SELECT peut être servi par un réplica : les éléments refusés sont alors
+    relus ensemble sur le primaire.
+    """
+    if not isinstance(items, list) or not items or len(items) > BATCH_MAX:
+        return codec.error(400, f"credentials must be a non-empty list of at most {BATCH_MAX} items")
+
+    # Un jeton d'IP par identifiant du lot (autant que d'appels unitaires), puis
+    # limite par utilisateur (et par IP) pour chaque élément
+    client_ip = None
+    if RATE_LIMITER is not None:
+        denied = RATE_LIMITER.check(event, cost=len(items))
+        if denied is not None:
+            return denied
+        client_ip = RATE_LIMITER.client_ip(event)
+
+    credentials = [('', '', '')] * len(items)
+    responses = [None] * len(items)
+    pending = []
+    for i, item in enumerate(items):
+        try:
+            credentials[i] = username, password, _ = tuple(credentials_from(item))
+        except codec.ValidationError as e:
+            responses[i] = codec.error(400, str(e))
+            continue
+        if not username or not password:
+            responses[i] = MISSING_CREDENTIALS
+            continue
+        denied = RATE_LIMITER.check_username(username, client_ip) if RATE_LIMITER is not None else None
+        if denied is not None:
+            responses[i] = denied
+        else:
+            pending.append(i)
+
+    names = {credentials[i][0] for i in pending}
+    if USER_FILTER is not None:
+        USER_FILTER.start()
+        names = {name for name in names if USER_FILTER.might_exist(name)}
+
+    users, from_replica = {}, False
+    if names:
+        started = metrics.clock()
+        users, from_replica = lookup_batch(names, readonly=True)
+        if USER_FILTER is not None:
+            USER_FILTER.observe_lookup(metrics.clock() - started)
+    elif pending and USER_FILTER is not None:
+        USER_FILTER.pad()  # tous refusés par le filtre : même attente qu'une lecture
+
+    executor = batch_executor()
+    futures = {i: executor.submit(jsonlog.in_context(verify_item), users.get(credentials[i][0]), *credentials[i][1:])
+               for i in pending}
+    new_hashes = {}
+    for i, future in futures.items():
+        responses[i], new_hashes[i] = future.result()
+
+    # Lecture d'un réplica : refus et 2FA absente confirmés sur le primaire,
+    # vérifiés à nouveau seulement si la ligne y est différente
+    if from_replica:
+        retry = [i for i in pending
+                 if confirm_on_primary(users.get(credentials[i][0]),
+                                       None if responses[i]["statusCode"] == 200 else responses[i],
+                                       credentials[i][2])]
+        if retry:
+            primary_users, _ = lookup_batch({credentials[i][0] for i in retry})
+            retry = [i for i in retry if primary_users.get(credentials[i][0]) != users.get(credentials[i][0])]
+            users.update({credentials[i][0]: primary_users.get(credentials[i][0]) for i in retry})
+            futures = {i: executor.submit(jsonlog.in_context(verify_item), users.get(credentials[i][0]),
+                                          *credentials[i][1:])
+                       for i in retry}
+            for i, future in futures.items():
+                responses[i], new_hashes[i] = future.result()
+
+    rehash = {}
+    now = datetime.now()
+    for i in pending:
+        new_hash = new_hashes[i]
+        if responses[i]["statusCode"] == 200:
+            user = users[credentials[i][0]]
+            ACTIVITY.record(user[0], now, user[4])
+            if new_hash is not None:
+                rehash[user[0]] = new_hash
+
+    if rehash:
+        conn = get_db_connection()
+        try:
+            with transaction(conn):
+                cursor = conn.cursor()
+                execute_values(cursor, REHASH_BATCH, sorted(rehash.items()), page_size=len(rehash))
+                cursor.close()
+        finally:
+            conn.close()
+
+    return codec.response(200, {
+        "success": True,
+        "results": [batch_result(c[0], r) for c, r in zip(credentials, responses)]
+    })
+
+def handle(event, context):
+    try:
+        body = parse_body(event)
+        if isinstance(body, dict) and 'credentials' in body:
+            return handle_batch(event, body['credentials'])
+
+        username, password, totp_code = credentials_from(body)
+
+        # Refus avant tout hash ou accès base
+        if RATE_LIMITER is not None:
+            denied = RATE_LIMITER.check(event, username)
+            if denied is not None:
+                return denied
+
+        if not username or not password:
+            return MISSING_CREDENTIALS
+
+        # Utilisateur certainement inexistant : rejet sans toucher à PostgreSQL,
+        # après l'attente d'une lecture moyenne (le refus ne répond pas plus vite)
+        if USER_FILTER is not None:
+            USER_FILTER.start()
+            if not USER_FILTER.might_exist(username):
+                USER_FILTER.pad()
+                return check_user(None, password, totp_code)
+
+        # Récupérer les informations de l'utilisateur : un réplica si
+        # DB_REPLICA_HOSTS en déclare un de sain, sinon le primaire. Lecture
+        # seule en autocommit (derrière un pooler en mode transaction :
+        # BEGIN/SELECT/COMMIT) ; la connexion retourne au pool avant le hash,
+        # le pool ne reste pas vide le temps d'un scrypt
+        started = metrics.clock()
+        user, on_replica = fetch_user(username, readonly=True)
+        if USER_FILTER is not None:
+            USER_FILTER.observe_lookup(metrics.clock() - started)
+
+        response = check_user(user, password, totp_code)
+
+        # Réplica éventuellement en retard : un refus (ou une 2FA absente alors
+        # qu'un code est fourni) est confirmé sur le primaire
+        if on_replica and confirm_on_primary(user, response, totp_code):
+            primary_user, _ = fetch_user(username)
+            if primary_user != user:
+                user = primary_user
+                response = check_user(user, password, totp_code)
+        if response is not None:
+            return response
+
+        # Authentification réussie - date de dernière activité écrite en différé
+        ACTIVITY.record(user[0], datetime.now(), user[4])
+
+        # Migration du hash : connexion reprise seulement pour l'UPDATE
+        if needs_rehash(user[2]):
+            started = metrics.clock()
+            new_hash = hash_password(password)
+            metrics.since('hash_password', started)
+            store_rehash(user[0], new_hash)
+
+        return success_response(user)
+
     except psycopg2.Error as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": f"Database error: {str(e)}",
-                "success": False
-            })
-        }
-    except json.JSONDecodeError:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({
-                "error": "Invalid JSON in request body",
-                "success": False
-            })
-        }
+        return database_error_response(e)
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": f"Internal server error: {str(e)}",
-                "success": False
-            })
-        } 
\ No newline at end of file
+        return error_response(e)
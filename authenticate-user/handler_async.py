@@ -0,0 +1,316 @@
+"""
+Variante asyncio de authenticate-user pour le point d'entrée ASGI (asgi.py).
+
+Même logique métier que handler.handle() (check_user, réponses), mais les
+accès PostgreSQL passent par des pools asyncpg : une requête en attente de la
+base ne bloque plus un thread, seulement une coroutine.
+
+Routage comme db.py : le SELECT du login va à un réplica sain de
+DB_REPLICA_HOSTS (tourniquet, retard mesuré, réplica écarté DB_REPLICA_RETRY
+secondes sur erreur ou retard), sinon au primaire ; un refus lu sur un
+réplica est relu sur le primaire. Quand le secret DB_PASSWORD change, les
+pools sont recréés au prochain emprunt et les anciens fermés une fois leurs
+connexions rendues.
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime
+
+import asyncpg
+
+import handler
+import jsonlog
+import db
+import metrics
+import secretstore
+from db import get_db_password, parse_replica_hosts
+from passwords import hash_password, needs_rehash
+from handler import (MISSING_CREDENTIALS, check_user, confirm_on_primary, credentials_from,
+                     database_error_response, error_response, parse_body, success_response)
+
+USER_QUERY = """
+    SELECT id, username, password, mfa, gendate, expired
+    FROM users
+    WHERE username = $1
+"""
+
+# Ancien pool laissé à ses emprunts en cours avant d'être coupé (secondes)
+RETIRE_TIMEOUT = 30.0
+
+_pool = None
+_replicas = None
+_pool_lock = None
+_generation = 0         # incrémenté à chaque changement du secret DB_PASSWORD
+_pool_generation = 0
+_replicas_generation = 0
+_retiring = set()
+
+
+def _password_changed(names):
+    """Appelé par le thread de surveillance des secrets : pools recréés au prochain emprunt"""
+    global _generation
+    _generation += 1
+
+
+secretstore.on_change(('DB_PASSWORD',), _password_changed)
+
+
+def _lock():
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    return _pool_lock
+
+
+def create_pool(host=None, port=None, min_size=None):
+    """Pool asyncpg vers `host` (DB_HOST par défaut) avec le mot de passe courant"""
+    return asyncpg.create_pool(
+        host=host or os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'mspr_db'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=get_db_password(),
+        port=int(port or os.getenv('DB_PORT', '5432')),
+        min_size=int(os.getenv('DB_ASYNC_POOL_MIN', '1')) if min_size is None else min_size,
+        max_size=int(os.getenv('DB_ASYNC_POOL_MAX', '20')),
+        max_inactive_connection_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        # Pooler en mode transaction : pas de requêtes préparées nommées gardées par session
+        statement_cache_size=0 if db.TRANSACTION_POOLING else 100,
+    )
+
+
+def _retire(pools):
+    """Ferme en arrière-plan des pools remplacés, coupés après RETIRE_TIMEOUT"""
+    async def close(pool):
+        try:
+            await asyncio.wait_for(pool.close(), RETIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pool.terminate()
+
+    for pool in pools:
+        task = asyncio.ensure_future(close(pool))
+        _retiring.add(task)
+        task.add_done_callback(_retiring.discard)
+
+
+async def get_pool():
+    """Pool du primaire, créé au premier appel dans la boucle courante, recréé si DB_PASSWORD change"""
+    global _pool, _pool_generation
+    if _pool is None or _pool_generation != _generation:
+        async with _lock():
+            generation = _generation
+            if _pool is None or _pool_generation != generation:
+                pool = await create_pool()
+                if _pool is not None:
+                    _retire([_pool])
+                _pool, _pool_generation = pool, generation
+    return _pool
+
+
+async def get_replicas():
+    """Routeur des réplicas de DB_REPLICA_HOSTS (sans connexion ouverte d'avance), recréé comme le primaire"""
+    global _replicas, _replicas_generation
+    if _replicas is None or _replicas_generation != _generation:
+        async with _lock():
+            generation = _generation
+            if _replicas is None or _replicas_generation != generation:
+                replicas = []
+                for host, port in parse_replica_hosts(os.getenv('DB_REPLICA_HOSTS')):
+                    pool = await create_pool(host, port, min_size=0)
+                    replicas.append((f"{host}:{port or os.getenv('DB_PORT', '5432')}", pool))
+                router = ReplicaRouter(
+                    replicas,
+                    max_lag=float(os.getenv('DB_REPLICA_MAX_LAG', '1')),
+                    retry=float(os.getenv('DB_REPLICA_RETRY', '30')),
+                    check_interval=float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5')),
+                    timeout=float(os.getenv('DB_REPLICA_TIMEOUT', '1')),
+                )
+                if _replicas is not None:
+                    router.carry_stats(_replicas)
+                    _retire(_replicas.pools())
+                _replicas, _replicas_generation = router, generation
+    return _replicas
+
+
+class _Replica:
+    """Pool asyncpg d'un réplica et son état de santé (boucle d'événements seule)"""
+
+    __slots__ = ('name', 'pool', 'down_until', 'checked_at', 'lag')
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag = 0.0
+
+
+class ReplicaRouter:
+    """
+    Équivalent asyncio de db.ReplicaRouter pour les lectures : réplicas sains
+    en tourniquet, retard mesuré au plus toutes les `check_interval` secondes,
+    réplica écarté `retry` secondes sur erreur, délai ou retard > `max_lag`.
+    None si aucun réplica n'a répondu : la lecture revient au primaire.
+    """
+
+    def __init__(self, replicas, max_lag=1.0, retry=30.0, check_interval=5.0, timeout=1.0):
+        self.max_lag = max_lag
+        self.retry = retry
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._replicas = [_Replica(name, pool) for name, pool in replicas]
+        self._next = itertools.count()
+        self._stats = {'primary': 0, 'replica': 0, 'fallback': 0, 'replica_errors': 0,
+                       'replica_lagging': 0, 'primary_rereads': 0}
+
+    async def fetchrow(self, query, *args):
+        """(ligne, vrai) lue sur un réplica sain, ou None si aucun n'a répondu"""
+        if not self._replicas:
+            return None
+        now = time.monotonic()
+        start = next(self._next) % len(self._replicas)
+        for replica in self._replicas[start:] + self._replicas[:start]:
+            if replica.down_until > now:
+                continue
+            try:
+                async with replica.pool.acquire(timeout=self.timeout) as conn:
+                    if time.monotonic() - replica.checked_at >= self.check_interval:
+                        replica.lag = float(await conn.fetchval(db.ReplicaRouter.LAG_QUERY))
+                        replica.checked_at = time.monotonic()
+                        if replica.lag > self.max_lag:
+                            self._mark_down(replica, 'replica_lagging')
+                            continue
+                    row = await conn.fetchrow(query, *args)
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError):
+                self._mark_down(replica, 'replica_errors')
+                continue
+            self._stats['replica'] += 1
+            return row, True
+        self._stats['fallback'] += 1
+        return None
+
+    def count(self, key):
+        self._stats[key] += 1
+
+    def _mark_down(self, replica, reason):
+        replica.down_until = time.monotonic() + self.retry
+        replica.checked_at = 0.0  # retard remesuré au retour
+        self._stats[reason] += 1
+
+    def pools(self):
+        return [replica.pool for replica in self._replicas]
+
+    def carry_stats(self, previous):
+        """Compteurs repris du routeur remplacé (les jauges restent monotones)"""
+        self._stats = dict(previous._stats)
+
+    def stats(self):
+        now = time.monotonic()
+        return dict(self._stats, replicas=len(self._replicas),
+                    replicas_healthy=sum(1 for r in self._replicas if r.down_until <= now),
+                    replica_max_lag=max((r.lag for r in self._replicas), default=0.0))
+
+
+metrics.register_gauges('db_async_routing', lambda: _replicas.stats() if _replicas is not None else {})
+
+
+async def fetch_user(username, readonly=False):
+    """
+    (ligne de l'utilisateur ou None, lu sur un réplica) ; la connexion est
+    rendue au pool avant toute vérification de mot de passe. Sans `readonly`,
+    lecture sur le primaire (confirmation d'un résultat de réplica).
+    """
+    replicas = await get_replicas()
+    if readonly:
+        result = await replicas.fetchrow(USER_QUERY, username)
+        if result is not None:
+            row, on_replica = result
+            return (tuple(row) if row else None), on_replica
+        replicas.count('primary')
+    else:
+        replicas.count('primary_rereads')
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(USER_QUERY, username)
+    return (tuple(row) if row else None), False
+
+
+async def shutdown():
+    """Ferme les pools (appelé à l'arrêt du serveur ASGI)"""
+    global _pool, _replicas
+    pools = [] if _pool is None else [_pool]
+    if _replicas is not None:
+        pools += _replicas.pools()
+    _pool = _replicas = None
+    for pool in pools:
+        await pool.close()
+    if _retiring:
+        await asyncio.gather(*_retiring, return_exceptions=True)
+
+
+async def handle(event, context):
+    try:
+        body = parse_body(event)
+        if isinstance(body, dict) and 'credentials' in body:
+            # Mode lot : chemin synchrone (pool psycopg2, threads de vérification)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, jsonlog.in_context(handler.handle_batch), event, body['credentials'])
+
+        username, password, totp_code = credentials_from(body)
+
+        # Refus avant tout hash ou accès base
+        if handler.RATE_LIMITER is not None:
+            denied = handler.RATE_LIMITER.check(event, username)
+            if denied is not None:
+                return denied
+
+        if not username or not password:
+            return MISSING_CREDENTIALS
+
+        loop = asyncio.get_running_loop()
+
+        # Utilisateur certainement inexistant : rejet sans toucher à PostgreSQL
+        user_filter = handler.USER_FILTER
+        if user_filter is not None:
+            user_filter.start()
+            if not user_filter.might_exist(username):
+                # Même attente qu'une lecture en base : le refus ne répond pas plus vite
+                await asyncio.sleep(user_filter.lookup_seconds)
+                return await loop.run_in_executor(None, jsonlog.in_context(check_user), None, password, totp_code)
+
+        # Connexion rendue au pool avant le hash : un scrypt ne la monopolise pas
+        started = metrics.clock()
+        user, on_replica = await fetch_user(username, readonly=True)
+        if user_filter is not None:
+            user_filter.observe_lookup(metrics.clock() - started)
+
+        # Vérification du hash hors de la boucle d'événements
+        response = await loop.run_in_executor(None, jsonlog.in_context(check_user), user, password, totp_code)
+
+        # Réplica éventuellement en retard : refus (ou 2FA absente) confirmé sur le primaire
+        if on_replica and confirm_on_primary(user, response, totp_code):
+            primary_user, _ = await fetch_user(username)
+            if primary_user != user:
+                user = primary_user
+                response = await loop.run_in_executor(None, jsonlog.in_context(check_user), user, password,
+                                                      totp_code)
+        if response is not None:
+            return response
+
+        # Authentification réussie - date de dernière activité écrite en différé
+        handler.ACTIVITY.record(user[0], datetime.now(), user[4])
+
+        if needs_rehash(user[2]):
+            new_hash = await loop.run_in_executor(None, hash_password, password)
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE users SET password = $1 WHERE id = $2", new_hash, user[0])
+
+        return success_response(user)
+
+    except (asyncpg.PostgresError, OSError) as e:
+        return database_error_response(e)
+    except Exception as e:
+        return error_response(e)
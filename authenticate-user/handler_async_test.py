@@ -0,0 +1,151 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import json
+from datetime import datetime
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # hash calculés dans le thread de test
+os.environ.setdefault('USER_FILTER_ENABLED', 'false')  # pas de thread d'écoute PostgreSQL
+import handler_async
+from handler import hash_password
+
+
+def make_pool(row):
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value=row)
+    conn.execute = AsyncMock()
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire.return_value = acquire
+    return pool, conn
+
+
+class TestAuthenticateUserAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_handle_missing_credentials(self):
+        """Identifiants manquants : 400 sans toucher au pool"""
+        event = MagicMock()
+        event.body = json.dumps({})
+        with patch('handler_async.get_pool', new=AsyncMock()) as get_pool:
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 400)
+        get_pool.assert_not_called()
+
+    async def test_handle_user_not_found(self):
+        """Utilisateur inexistant : 401"""
+        pool, conn = make_pool(None)
+        event = MagicMock()
+        event.body = json.dumps({"username": "nonexistent", "password": "password"})
+        with patch('handler_async.get_pool', new=AsyncMock(return_value=pool)):
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 401)
+        conn.execute.assert_not_called()
+
+    async def test_filtered_unknown_user_waits_lookup_time(self):
+        """Nom absent du filtre : 401 sans pool, après l'attente d'une lecture moyenne"""
+        event = MagicMock()
+        event.body = json.dumps({"username": "ghost", "password": "password"})
+        with patch('handler.USER_FILTER') as user_filter, \
+                patch('handler_async.get_pool', new=AsyncMock()) as get_pool, \
+                patch('handler_async.asyncio.sleep', new=AsyncMock()) as sleep:
+            user_filter.might_exist.return_value = False
+            user_filter.lookup_seconds = 0.004
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 401)
+        sleep.assert_awaited_once_with(0.004)
+        get_pool.assert_not_called()
+
+    async def test_handle_success_updates_activity(self):
+        """Authentification réussie : 200 et activité confiée au tampon différé"""
+        row = (7, "alice", hash_password("secret"), None, datetime.now(), False)
+        pool, conn = make_pool(row)
+        event = MagicMock()
+        event.body = json.dumps({"username": "alice", "password": "secret"})
+        with patch('handler_async.get_pool', new=AsyncMock(return_value=pool)), \
+                patch('handler.ACTIVITY') as activity:
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 200)
+        self.assertEqual(json.loads(result["body"])["user_id"], 7)
+        conn.execute.assert_not_called()
+        self.assertEqual(activity.record.call_args.args[0], 7)
+
+    async def test_handle_releases_connection_while_hashing(self):
+        """Connexion rendue avant la vérification, reprise seulement pour l'UPDATE du rehash"""
+        import hashlib
+        import handler
+        row = (3, "legacy", hashlib.sha512(b"secret").hexdigest(), None, datetime.now(), False)
+        pool, conn = make_pool(row)
+        acquire = pool.acquire.return_value
+        verify, rehash_password = handler.verify_password, handler_async.hash_password
+
+        def released(function):
+            def call(*args):
+                self.assertEqual(acquire.__aenter__.await_count, acquire.__aexit__.await_count,
+                                 "connection held while hashing")
+                return function(*args)
+            return call
+
+        event = MagicMock()
+        event.body = json.dumps({"username": "legacy", "password": "secret"})
+        with patch('handler_async.get_pool', new=AsyncMock(return_value=pool)), \
+                patch('handler.ACTIVITY'), patch('handler.verify_password', released(verify)), \
+                patch('handler_async.hash_password', released(rehash_password)):
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 200)
+        self.assertEqual(pool.acquire.call_count, 2)
+        self.assertIn("SET password", conn.execute.call_args.args[0])
+
+    async def test_read_on_replica_refusal_confirmed_on_primary(self):
+        """Compte absent du réplica (création pas encore répliquée) : relu et accepté sur le primaire"""
+        row = (9, "fresh", hash_password("secret"), None, datetime.now(), False)
+        replica_pool, replica_conn = make_pool(None)
+        replica_conn.fetchval = AsyncMock(return_value=0.2)
+        primary_pool, _ = make_pool(row)
+        router = handler_async.ReplicaRouter([("replica-1:5432", replica_pool)])
+        event = MagicMock()
+        event.body = json.dumps({"username": "fresh", "password": "secret"})
+        with patch('handler_async.get_replicas', new=AsyncMock(return_value=router)), \
+                patch('handler_async.get_pool', new=AsyncMock(return_value=primary_pool)), \
+                patch('handler.ACTIVITY'):
+            result = await handler_async.handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 200)
+        replica_conn.fetchrow.assert_awaited_once()
+        primary_pool.acquire.assert_called_once()
+        stats = router.stats()
+        self.assertEqual((stats["replica"], stats["primary_rereads"], stats["replica_max_lag"]), (1, 1, 0.2))
+
+    async def test_lagging_replica_falls_back_to_primary(self):
+        replica_pool, replica_conn = make_pool(None)
+        replica_conn.fetchval = AsyncMock(return_value=5.0)
+        primary_pool, _ = make_pool(None)
+        router = handler_async.ReplicaRouter([("replica-1:5432", replica_pool)], max_lag=1.0)
+        with patch('handler_async.get_replicas', new=AsyncMock(return_value=router)), \
+                patch('handler_async.get_pool', new=AsyncMock(return_value=primary_pool)):
+            user, on_replica = await handler_async.fetch_user("ghost", readonly=True)
+            self.assertEqual((user, on_replica), (None, False))
+            await handler_async.fetch_user("ghost", readonly=True)  # réplica écarté : pas de nouvel essai
+        replica_conn.fetchrow.assert_not_called()
+        self.assertEqual(replica_conn.fetchval.await_count, 1)
+        stats = router.stats()
+        self.assertEqual((stats["replica_lagging"], stats["fallback"], stats["replicas_healthy"]), (1, 2, 0))
+
+    async def test_password_change_recreates_pool(self):
+        """Secret DB_PASSWORD remplacé : nouveau pool au prochain emprunt, ancien fermé"""
+        old, new = MagicMock(close=AsyncMock()), MagicMock(close=AsyncMock())
+        create = AsyncMock(side_effect=[old, new])
+        with patch('handler_async._pool', None), patch('handler_async.asyncpg.create_pool', create), \
+                patch('handler_async.get_db_password', side_effect=["before", "after"]):
+            self.assertIs(await handler_async.get_pool(), old)
+            self.assertIs(await handler_async.get_pool(), old)
+            handler_async._password_changed({'DB_PASSWORD'})
+            self.assertIs(await handler_async.get_pool(), new)
+            await asyncio.gather(*handler_async._retiring)
+        self.assertEqual([c.kwargs["password"] for c in create.call_args_list], ["before", "after"])
+        old.close.assert_awaited_once()
+        new.close.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
+import os
 import unittest
 from unittest.mock import patch, MagicMock
 import json
 from datetime import datetime, timedelta
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # hash calculés dans le thread de test
+os.environ.setdefault('USER_FILTER_ENABLED', 'false')  # pas de thread d'écoute PostgreSQL
+os.environ.setdefault('MFA_KEY_B64', 'A' * 43 + '=')  # clé AES de test (32 octets nuls)
 from handler import handle, hash_password, verify_totp, is_account_expired
 
 class TestAuthenticateUser(unittest.TestCase):
@@ -12,7 +16,7 @@ class TestAuthenticateUser(unittest.TestCase):
         hashed = hash_password(password)
         self.assertIsInstance(hashed, str)
         self.assertNotEqual(password, hashed)
-        self.assertEqual(len(hashed), 64)  # SHA-256 produit un hash de 64 caractères
+        self.assertTrue(hashed.startswith("$scrypt$v=1$"))  # format versionné et salé
     
     def test_verify_totp_valid(self):
         """Test de vérification TOTP avec un secret valide"""
@@ -58,6 +62,16 @@ class TestAuthenticateUser(unittest.TestCase):
         self.assertFalse(body["success"])
         self.assertIn("Username and password are required", body["error"])
     
+    @patch('handler.get_db_connection')
+    def test_handle_invalid_field_type(self, mock_db):
+        """Champ de type inattendu : 400 sans accès à la base"""
+        event = MagicMock()
+        event.body = json.dumps({"username": ["admin"], "password": "x"}).encode()
+        result = handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 400)
+        self.assertEqual(json.loads(result["body"])["error"], "username must be a string")
+        mock_db.assert_not_called()
+
     @patch('handler.get_db_connection')
     def test_handle_user_not_found(self, mock_db):
         """Test avec utilisateur inexistant"""
@@ -81,5 +95,245 @@ class TestAuthenticateUser(unittest.TestCase):
         self.assertFalse(body["success"])
         self.assertIn("Invalid username or password", body["error"])
 
+    @patch('db.TRANSACTION_POOLING', False)  # comportement du mode session
+    @patch('handler.ACTIVITY')
+    @patch('handler.get_db_connection')
+    def test_handle_legacy_hash_rehashed_on_login(self, mock_db, mock_activity):
+        """Un ancien hash SHA-512 est migré vers le format courant après un login réussi"""
+        import hashlib
+        legacy = hashlib.sha512(b"password").hexdigest()
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1, "legacy", legacy, None, datetime.now(), False)
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.body = json.dumps({"username": "legacy", "password": "password"})
+
+        # Aucune connexion gardée pendant la vérification ni pendant le nouveau hash
+        import handler
+        verify, rehash_password = handler.verify_password, handler.hash_password
+
+        def released(function):
+            def call(*args):
+                self.assertEqual(mock_db.call_count, mock_conn.close.call_count, "connection held while hashing")
+                return function(*args)
+            return call
+
+        with patch('handler.verify_password', released(verify)), \
+                patch('handler.hash_password', released(rehash_password)):
+            result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        rehash = [c for c in mock_cursor.execute.call_args_list if "SET password" in c.args[0]]
+        self.assertEqual(len(rehash), 1)
+        self.assertTrue(rehash[0].args[1][0].startswith("$scrypt$"))
+        self.assertTrue(mock_conn.autocommit)  # UPDATE unique, sans commit explicite
+        mock_conn.commit.assert_not_called()
+        self.assertEqual(mock_conn.close.call_count, 2)  # SELECT, puis UPDATE sur une connexion reprise
+        self.assertEqual(mock_db.call_args_list[-1].kwargs, {})  # UPDATE sur le primaire
+
+    @patch('handler.ACTIVITY')
+    @patch('handler.reread_connection')
+    @patch('handler.get_db_connection')
+    def test_handle_replica_miss_reread_on_primary(self, mock_db, mock_reread, mock_activity):
+        """Compte absent du réplica (création pas encore répliquée) : relu sur le primaire"""
+        replica = MagicMock(replica=True)
+        replica.cursor.return_value.fetchone.return_value = None
+        primary = MagicMock()
+        primary.cursor.return_value.fetchone.return_value = (
+            7, "fresh", hash_password("password"), None, datetime.now(), False)
+        mock_db.return_value = replica
+        mock_reread.return_value = primary
+
+        event = MagicMock()
+        event.body = json.dumps({"username": "fresh", "password": "password"})
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        mock_db.assert_called_once_with(readonly=True)
+        replica.close.assert_called_once()
+        primary.close.assert_called_once()
+
+        # Succès sur le réplica, sans code 2FA fourni : pas de relecture
+        replica.cursor.return_value.fetchone.return_value = primary.cursor.return_value.fetchone.return_value
+        mock_reread.reset_mock()
+        self.assertEqual(handle(event, MagicMock())["statusCode"], 200)
+        mock_reread.assert_not_called()
+
+    @patch('handler.ACTIVITY')
+    @patch('handler.get_db_connection')
+    def test_handle_2fa_secret_decrypted_once(self, mock_db, mock_activity):
+        """Logins répétés : le secret TOTP n'est déchiffré qu'une fois (cache)"""
+        import handler
+        import pyotp
+        secret = pyotp.random_base32()
+        encrypted = handler.mfa_keys.keyring().encrypt(secret)
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (99, "mfa_user", hash_password("password"), encrypted, datetime.now(), False)
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+        handler.TOTP_CACHE.clear()
+
+        with patch('handler.decrypt_secret', wraps=handler.decrypt_secret) as decrypt:
+            for _ in range(3):
+                event = MagicMock()
+                event.body = json.dumps({"username": "mfa_user", "password": "password",
+                                         "totp_code": pyotp.TOTP(secret).now()})
+                self.assertEqual(handle(event, MagicMock())["statusCode"], 200)
+
+        decrypt.assert_called_once()
+
+    @patch('handler.verify_password')
+    @patch('handler.get_db_connection')
+    def test_handle_filtered_unknown_user(self, mock_db, mock_verify):
+        """Utilisateur absent du filtre : 401 sans base, mais avec le même calcul de hash"""
+        mock_verify.return_value = False
+        event = MagicMock()
+        event.body = json.dumps({"username": "ghost", "password": "password"})
+
+        with patch('handler.USER_FILTER') as user_filter:
+            user_filter.might_exist.return_value = False
+            result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 401)
+        self.assertIn("Invalid username or password", json.loads(result["body"])["error"])
+        mock_db.assert_not_called()
+        mock_verify.assert_called_once()
+        user_filter.pad.assert_called_once()  # temps d'une lecture en base
+
+    @patch('handler.verify_password')
+    @patch('handler.get_db_connection')
+    def test_handle_rate_limited(self, mock_db, mock_verify):
+        """Refus 429 avant tout calcul de hash ou accès base"""
+        from ratelimit import MemoryBackend, RateLimiter
+        limiter = RateLimiter(MemoryBackend(), user_rate=0.01, user_burst=1)
+        event = MagicMock()
+        event.body = json.dumps({"username": "target", "password": "guess"})
+        mock_db.return_value.cursor.return_value.fetchone.return_value = None
+
+        with patch('handler.RATE_LIMITER', limiter):
+            handle(event, MagicMock())
+            mock_db.reset_mock()
+            mock_verify.reset_mock()
+            result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 429)
+        self.assertIn("Retry-After", result["headers"])
+        mock_db.assert_not_called()
+        mock_verify.assert_not_called()
+
+    @patch('db.TRANSACTION_POOLING', False)  # comportement du mode session
+    @patch('handler.ACTIVITY')
+    @patch('handler.get_db_connection')
+    def test_handle_success_defers_activity_update(self, mock_db, mock_activity):
+        """Login réussi : aucune écriture synchrone, l'activité part dans le tampon"""
+        gendate = datetime.now() - timedelta(days=2)
+        mock_conn = MagicMock()
+        mock_conn.prepared = set()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (5, "bob", hash_password("password"), None, gendate, False)
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.body = json.dumps({"username": "bob", "password": "password"})
+        result = handle(event, MagicMock())
+        handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        self.assertTrue(statements[0].startswith("PREPARE auth_lookup"))
+        self.assertEqual(statements[1:], ["EXECUTE auth_lookup (%s)"] * 2)  # un aller-retour par login
+        self.assertTrue(mock_conn.autocommit)
+        mock_conn.commit.assert_not_called()
+        user_id, when, stored = mock_activity.record.call_args.args
+        self.assertEqual((user_id, stored), (5, gendate))
+
+    @patch('db.TRANSACTION_POOLING', False)  # comportement du mode session
+    @patch('handler.execute_values')
+    @patch('handler.ACTIVITY')
+    @patch('handler.get_db_connection')
+    def test_handle_batch_results_in_input_order(self, mock_db, mock_activity, mock_execute_values):
+        """Mode lot : un seul SELECT ... ANY, un résultat par élément dans l'ordre"""
+        import hashlib
+        recent = datetime.now() - timedelta(days=1)
+        rows = [
+            (1, "alice", hash_password("a-pass"), None, recent, False),
+            (2, "legacy", hashlib.sha512(b"l-pass").hexdigest(), None, recent, False),
+        ]
+        mock_conn = MagicMock()
+        mock_conn.prepared = set()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.body = json.dumps({"credentials": [
+            {"username": "legacy", "password": "l-pass"},
+            {"username": "ghost", "password": "x"},
+            {"username": "alice", "password": "wrong"},
+            {"username": "alice"},
+            {"username": "alice", "password": "a-pass"},
+        ]})
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        results = json.loads(result["body"])["results"]
+        self.assertEqual([r["username"] for r in results], ["legacy", "ghost", "alice", "alice", "alice"])
+        self.assertEqual([r["statusCode"] for r in results], [200, 401, 401, 400, 200])
+        lookups = [c for c in mock_cursor.execute.call_args_list if c.args[0].startswith("EXECUTE")]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(lookups[0].args[1], (["alice", "ghost", "legacy"],))
+        self.assertEqual(sorted(c.args[0] for c in mock_activity.record.call_args_list), [1, 2])
+        # Migration du hash SHA-512 en une seule instruction
+        mock_execute_values.assert_called_once()
+        (user_id, new_hash), = mock_execute_values.call_args.args[2]
+        self.assertEqual(user_id, 2)
+        self.assertTrue(new_hash.startswith("$scrypt$"))
+
+    @patch('handler.get_db_connection')
+    def test_handle_batch_charges_ip_per_credential(self, mock_db):
+        """Un lot consomme autant de jetons IP que d'identifiants"""
+        from ratelimit import MemoryBackend, RateLimiter
+        limiter = RateLimiter(MemoryBackend(), ip_rate=0.01, ip_burst=3)
+        event = MagicMock()
+        event.headers = {'X-Forwarded-For': '203.0.113.7'}
+        event.body = json.dumps({"credentials": [{"username": "u", "password": "p"}] * 2})
+        mock_db.return_value.cursor.return_value.fetchall.return_value = []
+
+        with patch('handler.RATE_LIMITER', limiter):
+            self.assertEqual(handle(event, MagicMock())["statusCode"], 200)
+            self.assertEqual(handle(event, MagicMock())["statusCode"], 429)
+            event.body = json.dumps({"credentials": [{"username": "u", "password": "p"}] * 4})
+            self.assertEqual(handle(event, MagicMock())["statusCode"], 429)
+
+    def test_handle_batch_too_large(self):
+        """Lot vide ou au-delà de AUTH_BATCH_MAX : 400"""
+        import handler
+        event = MagicMock()
+        event.body = json.dumps({"credentials": [{"username": "u", "password": "p"}] * (handler.BATCH_MAX + 1)})
+        self.assertEqual(handle(event, MagicMock())["statusCode"], 400)
+        event.body = json.dumps({"credentials": []})
+        self.assertEqual(handle(event, MagicMock())["statusCode"], 400)
+
+    def test_totp_cache_gauges_exposed(self):
+        import metrics
+        self.assertIn('function_totp_cache{key="hits"}', metrics.render())
+
+    def test_import_defers_2fa_dependencies(self):
+        """Démarrage à froid : ni cryptography, ni pyotp, ni clé AES à l'import"""
+        import subprocess
+        import sys
+        env = dict(os.environ, USER_FILTER_ENABLED='false')
+        env.pop('MFA_KEY_B64', None)
+        out = subprocess.run(
+            [sys.executable, '-c', "import handler, sys; print(sorted(m for m in ('cryptography', 'pyotp') if m in sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), '[]')
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
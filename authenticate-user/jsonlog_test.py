@@ -0,0 +1,69 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import unittest
+
+import jsonlog
+
+
+class TestJsonLog(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.records = queue.SimpleQueue()
+        self.handler = jsonlog._QueueHandler(self.records)
+        self.sampled = [0.5]
+        self.handler.addFilter(jsonlog.ContextFilter({'auth.success': 0.1}, rand=lambda: self.sampled[0]))
+        self.output = logging.StreamHandler(self.stream)
+        self.output.setFormatter(jsonlog.JsonFormatter())
+        self.log = logging.getLogger('jsonlog-test')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        self.log.handlers[:] = [self.handler]
+
+    def lines(self):
+        # Écriture faite ici à la place du thread QueueListener
+        while not self.records.empty():
+            self.output.handle(self.records.get())
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_event_with_request_id_from_headers(self):
+        """Une ligne JSON par événement, avec l'identifiant de requête entrant"""
+        self.assertEqual(jsonlog.bind_request({'X-Call-Id': 'call-42'}), 'call-42')
+        jsonlog.event(self.log, 'auth.failure', reason='password', user_id=7)
+        entry, = self.lines()
+        self.assertEqual(entry['event'], 'auth.failure')
+        self.assertEqual(entry['request_id'], 'call-42')
+        self.assertEqual((entry['reason'], entry['user_id']), ('password', 7))
+
+    def test_request_id_generated_without_header(self):
+        self.assertEqual(len(jsonlog.bind_request({})), 32)
+
+    def test_success_events_sampled_errors_kept(self):
+        """Échantillonnage des succès ; les niveaux WARNING et plus passent toujours"""
+        jsonlog.event(self.log, 'auth.success', user_id=1)             # 0.5 >= 0.1 : écarté
+        self.sampled[0] = 0.05
+        jsonlog.event(self.log, 'auth.success', user_id=2)             # retenu
+        self.sampled[0] = 0.99
+        jsonlog.event(self.log, 'auth.success', level=logging.ERROR, user_id=3)
+        self.assertEqual([e['user_id'] for e in self.lines()], [2, 3])
+
+    def test_exception_formatted_before_queue(self):
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError as e:
+            self.log.error('internal error', exc_info=e)
+        entry, = self.lines()
+        self.assertEqual(entry['level'], 'error')
+        self.assertIn('RuntimeError: boom', entry['exc'])
+
+    def test_parse_sampling(self):
+        rates = jsonlog.parse_sampling('auth.success=0.01, http.request=2')
+        self.assertEqual(rates['auth.success'], 0.01)
+        self.assertEqual(rates['http.request'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self._saved, metrics.REGISTRY = metrics.REGISTRY, self.registry
+
+    def tearDown(self):
+        metrics.REGISTRY = self._saved
+
+    def test_phases_recorded_under_request_outcome(self):
+        """Les phases d'une requête sont classées sous son issue à la clôture"""
+        timings = metrics.start()
+        with metrics.phase('select'):
+            pass
+        metrics.record('verify_password', 0.03)
+        self.assertEqual(self.registry.render().count('_count'), 0)  # rien avant la clôture
+        metrics.finish(timings, 401)
+
+        text = self.registry.render()
+        self.assertIn('function_phase_seconds_count{phase="select",outcome="401"} 1', text)
+        self.assertIn('function_phase_seconds_bucket{phase="verify_password",outcome="401",le="0.025"} 0', text)
+        self.assertIn('function_phase_seconds_bucket{phase="verify_password",outcome="401",le="0.05"} 1', text)
+        self.assertIn('function_phase_seconds_count{phase="total",outcome="401"} 1', text)
+
+    def test_handler_outcome_overrides_status(self):
+        timings = metrics.start()
+        metrics.set_outcome('requires_2fa')
+        metrics.finish(timings, 400)
+        self.assertIn('phase="total",outcome="requires_2fa"', self.registry.render())
+
+    def test_phase_outside_request(self):
+        metrics.record('batch', 20.0)
+        text = self.registry.render()
+        self.assertIn('function_phase_seconds_bucket{phase="batch",outcome="none",le="10.0"} 0', text)
+        self.assertIn('function_phase_seconds_bucket{phase="batch",outcome="none",le="+Inf"} 1', text)
+        self.assertIn('function_phase_seconds_sum{phase="batch",outcome="none"} 20.0', text)
+
+    def test_phase_without_tracing_creates_no_span(self):
+        """Traçage désactivé : la phase ne touche pas à tracing.py"""
+        with patch('tracing.ENABLED', False), patch('tracing.start_span') as start_span:
+            with metrics.phase('select') as measured:
+                pass
+        start_span.assert_not_called()
+        self.assertFalse(hasattr(measured, 'span'))
+        self.assertIn('phase="select",outcome="none"', self.registry.render())
+
+    def test_since_records_elapsed_phase(self):
+        timings = metrics.start()
+        with patch('tracing.ENABLED', False), patch('tracing.record_span') as record_span:
+            metrics.since('verify_totp', metrics.clock() - 0.002)
+        record_span.assert_not_called()
+        (name, seconds), = timings.phases
+        self.assertEqual(name, 'verify_totp')
+        self.assertGreaterEqual(seconds, 0.002)
+        metrics.finish(timings, 200)
+        self.assertIn('phase="verify_totp",outcome="200"', self.registry.render())
+
+    def test_gauges(self):
+        self.registry.register_gauges('db_pool', lambda: {'size': 3, 'label': 'x'})
+        self.registry.register_gauges('broken', lambda: 1 / 0)
+        text = self.registry.render()
+        self.assertIn('function_db_pool{key="size"} 3.0', text)
+        self.assertNotIn('label', text)
+        self.assertNotIn('broken', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import base64
+import os
+import unittest
+from unittest.mock import patch
+
+import mfa_keys
+
+
+class TestKeyring(unittest.TestCase):
+
+    def setUp(self):
+        self.old, self.new = os.urandom(32), os.urandom(32)
+        self.keyring = mfa_keys.Keyring({"k0": self.old, "k1": self.new}, "k1", legacy_id="k0")
+
+    def test_encrypt_prefixes_active_key(self):
+        stored = self.keyring.encrypt("JBSWY3DPEHPK3PXP")
+        self.assertTrue(stored.startswith("k1:"))
+        self.assertEqual(self.keyring.key_id(stored), "k1")
+        self.assertEqual(self.keyring.decrypt(stored), "JBSWY3DPEHPK3PXP")
+        first, second = self.keyring.encrypt_many(["A" * 32, "A" * 32])
+        self.assertNotEqual(first, second)  # nonces distincts
+
+    def test_legacy_formats(self):
+        """Valeurs sans préfixe : chiffré par la clé historique, ou Base32 en clair"""
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        nonce = os.urandom(12)
+        legacy = base64.b64encode(nonce + AESGCM(self.old).encrypt(nonce, b"SECRETSECRETSECRET", None)).decode()
+        self.assertEqual(self.keyring.key_id(legacy), "k0")
+        self.assertEqual(self.keyring.decrypt(legacy), "SECRETSECRETSECRET")
+        self.assertIsNone(self.keyring.key_id("JBSWY3DPEHPK3PXP"))
+        self.assertEqual(self.keyring.decrypt("JBSWY3DPEHPK3PXP"), "JBSWY3DPEHPK3PXP")
+
+        rewrapped = self.keyring.rewrap(legacy)
+        self.assertTrue(self.keyring.is_current(rewrapped))
+        self.assertEqual(self.keyring.decrypt(rewrapped), "SECRETSECRETSECRET")
+        self.assertIs(self.keyring.rewrap(rewrapped), rewrapped)
+
+    def test_unknown_key_id(self):
+        with self.assertRaises(mfa_keys.UnknownKeyId):
+            self.keyring.decrypt("k9:" + base64.b64encode(os.urandom(40)).decode())
+
+    def test_load_keyring_from_env(self):
+        env = {
+            "MFA_KEYS": f"k1:{base64.b64encode(self.new).decode()},k2:{base64.b64encode(os.urandom(32)).decode()}",
+            "MFA_KEY_B64": base64.b64encode(self.old).decode(),
+            "MFA_ACTIVE_KEY_ID": "",
+        }
+        with patch.dict(os.environ, env):
+            keyring = mfa_keys.load_keyring()
+        self.assertEqual(keyring.key_ids, ["k0", "k1", "k2"])
+        self.assertEqual((keyring.active_id, keyring.legacy_id), ("k2", "k0"))
+
+        with patch.dict(os.environ, dict(env, MFA_ACTIVE_KEY_ID="k3")):
+            with self.assertRaisesRegex(ValueError, "Active MFA key 'k3'"):
+                mfa_keys.load_keyring()
+
+    def test_reload_swaps_keyring_or_keeps_previous(self):
+        env = {"MFA_KEYS": f"k1:{base64.b64encode(self.new).decode()}", "MFA_ACTIVE_KEY_ID": "k1"}
+        with patch('mfa_keys._keyring', self.keyring):
+            with patch.dict(os.environ, dict(env, MFA_ACTIVE_KEY_ID="k3")):
+                with self.assertRaises(ValueError):
+                    mfa_keys.reload_keyring({"MFA_KEYS"})
+            self.assertIs(mfa_keys.keyring(), self.keyring)
+            with patch.dict(os.environ, env):
+                mfa_keys.reload_keyring({"MFA_KEYS"})
+            self.assertIsNot(mfa_keys.keyring(), self.keyring)
+            self.assertEqual(mfa_keys.keyring().active_id, "k1")
+
+
+if __name__ == '__main__':
+    unittest.main()
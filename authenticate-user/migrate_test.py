@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+import migrate
+from migrate import Migration, MigrationError, apply, load_migrations, pending
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql.strip(), self.conn.autocommit))
+        if 'FROM schema_migrations' in sql:
+            self.rows = [(version, name, checksum) for version, (name, checksum) in sorted(self.conn.applied.items())]
+        elif 'FROM pg_index' in sql:
+            self.rows = [(name,) for name in self.conn.invalid]
+        elif sql == migrate.RECORD:
+            self.conn.applied[params[0]] = (params[1], params[2])
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    """Connexion psycopg2 simulée : instructions relevées avec l'état autocommit"""
+
+    def __init__(self, applied=None, invalid=()):
+        self.applied = dict(applied or {})
+        self.invalid = list(invalid)
+        self.autocommit = False
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def migration(version, sql='SELECT 1;', name='step'):
+    return Migration(version, name, f'{version:04d}_{name}.sql', sql)
+
+
+class TestMigrate(unittest.TestCase):
+
+    def test_migrations_loaded_in_version_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ('0010_later.sql', '0002_second.sql', '0001_first.sql', 'README.txt'):
+                with open(os.path.join(directory, filename), 'w') as fp:
+                    fp.write('SELECT 1;')
+            self.assertEqual([(m.version, m.name) for m in load_migrations(directory)],
+                             [(1, 'first'), (2, 'second'), (10, 'later')])
+            with open(os.path.join(directory, '3_bad.sql'), 'w') as fp:
+                fp.write('SELECT 1;')
+            with self.assertRaisesRegex(MigrationError, "Invalid migration file name"):
+                load_migrations(directory)
+
+    def test_repository_migrations_are_consecutive(self):
+        versions = [m.version for m in load_migrations()]
+        self.assertEqual(versions, list(range(1, len(versions) + 1)))
+
+    def test_pending_skips_applied_migrations(self):
+        migrations = [migration(1), migration(2), migration(3)]
+        applied = {1: ('step', migrations[0].checksum)}
+        self.assertEqual([m.version for m in pending(migrations, applied)], [2, 3])
+        self.assertEqual(pending(migrations, {m.version: ('step', m.checksum) for m in migrations}), [])
+
+    def test_edited_applied_migration_stops_runner(self):
+        migrations = [migration(1, 'SELECT 2;'), migration(2)]
+        applied = {1: ('step', migration(1).checksum)}
+        with self.assertRaisesRegex(MigrationError, "0001_step was modified after being applied"):
+            pending(migrations, applied)
+
+    def test_history_divergence_stops_runner(self):
+        first, second = migration(1), migration(2)
+        with self.assertRaisesRegex(MigrationError, "is missing"):
+            pending([second], {1: ('step', first.checksum)})
+        with self.assertRaisesRegex(MigrationError, "older than the last applied one"):
+            pending([first, second], {2: ('step', second.checksum)})
+
+    def test_statements_split_concurrent_migration(self):
+        """0002 : une instruction par ';' de fin de ligne, commentaires retirés"""
+        index_migration = next(m for m in load_migrations() if m.version == 2)
+        self.assertFalse(index_migration.transactional)
+        statements = index_migration.statements()
+        self.assertEqual(len(statements), 7)
+        self.assertTrue(statements[0].startswith('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_username_auth_key'))
+        self.assertIn('INCLUDE (id, password, mfa, gendate, expired)', statements[0])
+        self.assertEqual(statements[-1], 'ALTER TABLE users SET (fillfactor = 85)')
+        self.assertFalse(any('--' in statement or statement.endswith(';') for statement in statements))
+
+    def test_no_transaction_migration_runs_in_autocommit(self):
+        conn = FakeConnection()
+        concurrent = migration(2, f"{migrate.NO_TRANSACTION}\n-- index\nCREATE INDEX CONCURRENTLY a ON t (x);\n"
+                                  "DROP INDEX CONCURRENTLY IF EXISTS b;\n")
+        apply(conn, concurrent)
+        self.assertEqual(conn.executed[:2], [('CREATE INDEX CONCURRENTLY a ON t (x)', True),
+                                             ('DROP INDEX CONCURRENTLY IF EXISTS b', True)])
+        self.assertTrue(all(autocommit for _, autocommit in conn.executed))
+        self.assertEqual(conn.commits, 0)
+        self.assertFalse(conn.autocommit)  # connexion rendue en mode transactionnel
+        self.assertIn(2, conn.applied)
+
+    def test_invalid_index_blocks_record(self):
+        conn = FakeConnection(invalid=['users_active_gendate_idx'])
+        with self.assertRaisesRegex(MigrationError, "users_active_gendate_idx"):
+            apply(conn, migration(2, f"{migrate.NO_TRANSACTION}\nCREATE INDEX CONCURRENTLY a ON t (x);"))
+        self.assertNotIn(2, conn.applied)
+        self.assertFalse(conn.autocommit)
+
+    def test_transactional_migration_commits_with_its_record(self):
+        conn = FakeConnection()
+        apply(conn, migration(1, 'CREATE TABLE t (x INT);'))
+        self.assertEqual([autocommit for _, autocommit in conn.executed], [False, False])
+        self.assertEqual(conn.commits, 1)
+        self.assertIn(1, conn.applied)
+
+    def test_migrate_applies_pending_in_order(self):
+        migrations = [migration(1, 'SELECT 1;', 'one'), migration(2, 'SELECT 2;', 'two'),
+                      migration(3, 'SELECT 3;', 'three')]
+        conn = FakeConnection(applied={1: ('one', migrations[0].checksum)})
+        out = io.StringIO()
+
+        self.assertEqual(migrate.migrate(conn, migrations, dry_run=True, out=out), 2)
+        self.assertEqual(out.getvalue().split(), ['pending', '0002_two', 'pending', '0003_three'])
+        self.assertEqual(sorted(conn.applied), [1])
+
+        out = io.StringIO()
+        self.assertEqual(migrate.migrate(conn, migrations, out=out), 2)
+        applied = [sql for sql, _ in conn.executed if sql in ('SELECT 2;', 'SELECT 3;')]
+        self.assertEqual(applied, ['SELECT 2;', 'SELECT 3;'])
+        self.assertEqual(sorted(conn.applied), [1, 2, 3])
+        self.assertEqual(migrate.migrate(conn, migrations, out=io.StringIO()), 0)
+        locks = [sql for sql, autocommit in conn.executed if 'pg_advisory' in sql and autocommit]
+        self.assertEqual(len(locks), 6)  # verrou et déverrouillage en autocommit, à chaque exécution
+
+
+if __name__ == '__main__':
+    unittest.main()
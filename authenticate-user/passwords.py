@@ -0,0 +1,407 @@
+"""
+Moteur de hachage des mots de passe partagé par authenticate-user et
+generate-password.
+
+- Registre de formats versionnés : chaque hash stocké porte un préfixe
+  (`$scrypt$v=1$...`, `$argon2id$...`) ; les anciens hash hexadécimaux
+  SHA-256 (64 caractères) et SHA-512 (128 caractères) restent reconnus.
+- Coût des KDF à mémoire dure fixé par la configuration
+  (PASSWORD_HASH_PARAMS, ex. "n=32768,r=8,p=1"), jamais sous le plancher du
+  format : identique sur tous les réplicas, il ne dépend pas d'une mesure de
+  temps au démarrage. `python passwords.py [budget_ms]` propose une valeur
+  pour la machine courante.
+- Migration au login seulement vers un coût strictement supérieur : un hash
+  plus coûteux que la cible n'est jamais réécrit plus faible.
+- Calcul dans un pool de processus borné avec contrôle d'admission : au-delà
+  de PASSWORD_HASH_MAX_PENDING calculs en attente, Overloaded est levée au
+  lieu d'empiler les requêtes. Un processus par CPU du conteneur (affinité et
+  quota cgroup, voir available_cpus), ou PASSWORD_HASH_WORKERS.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+try:
+    import argon2.low_level as argon2_ll
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # argon2-cffi est optionnel, scrypt est toujours disponible
+    argon2_ll = None
+
+
+class Overloaded(Exception):
+    """Trop de calculs de hash en attente : la requête doit être refusée (503)"""
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+# ---------------- Formats ----------------
+class HashFormat:
+    """Format de hash enregistré ; `cpu_bound` indique un calcul à déporter"""
+
+    name = None
+    cpu_bound = False
+    floor = None  # paramètres minimaux (et par défaut) des formats à coût
+
+    def identify(self, stored):
+        raise NotImplementedError
+
+    def hash(self, password, params):
+        raise NotImplementedError
+
+    def verify(self, password, stored):
+        raise NotImplementedError
+
+    def params(self, stored):
+        """Paramètres de coût encodés dans le hash (None pour les formats legacy)"""
+        return None
+
+    def cost(self, params):
+        """Coût relatif de paramètres (ordre total : sert à ne jamais migrer vers moins cher)"""
+        return 0
+
+    def calibrate(self, budget_s):
+        """Paramètres de coût tenant dans le budget de latence (outil, pas au démarrage)"""
+        return None
+
+
+class _LegacyHex(HashFormat):
+    digest = None
+    length = None
+
+    def identify(self, stored):
+        return len(stored) == self.length and all(c in '0123456789abcdef' for c in stored)
+
+    def hash(self, password, params=None):
+        return hashlib.new(self.digest, password.encode()).hexdigest()
+
+    def verify(self, password, stored):
+        return hmac.compare_digest(self.hash(password), stored)
+
+
+class Sha256Legacy(_LegacyHex):
+    """Anciens comptes : SHA-256 hexadécimal non salé"""
+    name = 'sha256'
+    digest = 'sha256'
+    length = 64
+
+
+class Sha512Legacy(_LegacyHex):
+    """Comptes créés par l'ancien generate-password : SHA-512 hexadécimal non salé"""
+    name = 'sha512'
+    digest = 'sha512'
+    length = 128
+
+
+class Scrypt(HashFormat):
+    """$scrypt$v=1$n=<N>,r=<r>,p=<p>$<sel>$<hash>"""
+    name = 'scrypt'
+    cpu_bound = True
+    prefix = '$scrypt$v=1$'
+    floor = {'n': 2 ** 14, 'r': 8, 'p': 1}
+
+    def identify(self, stored):
+        return stored.startswith(self.prefix)
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n, dklen=32)
+
+    def hash(self, password, params):
+        salt = secrets.token_bytes(16)
+        n, r, p = params['n'], params['r'], params['p']
+        dk = self._derive(password, salt, n, r, p)
+        return f"{self.prefix}n={n},r={r},p={p}${_b64(salt)}${_b64(dk)}"
+
+    def params(self, stored):
+        fields = stored[len(self.prefix):].split('$')[0]
+        return {k: int(v) for k, v in (item.split('=') for item in fields.split(','))}
+
+    def verify(self, password, stored):
+        fields, salt, dk = stored[len(self.prefix):].split('$')
+        params = self.params(stored)
+        expected = _unb64(dk)
+        actual = self._derive(password, _unb64(salt), params['n'], params['r'], params['p'])
+        return hmac.compare_digest(actual, expected)
+
+    def cost(self, params):
+        return params['n'] * params['r'] * params['p']
+
+    def calibrate(self, budget_s):
+        max_mem = int(os.getenv('PASSWORD_KDF_MAX_MEM_MB', '64')) * 1024 * 1024
+        params = dict(self.floor)
+        while True:
+            start = time.perf_counter()
+            self._derive('calibration', b'\0' * 16, **params)
+            elapsed = time.perf_counter() - start
+            bigger = params['n'] * 2
+            # Doubler N double le temps : on s'arrête avant de dépasser le budget
+            if elapsed * 2 > budget_s or 128 * params['r'] * bigger > max_mem:
+                return params
+            params['n'] = bigger
+
+
+class Argon2id(HashFormat):
+    """Encodage PHC standard d'argon2-cffi ($argon2id$v=19$m=...,t=...,p=...$...)"""
+    name = 'argon2id'
+    cpu_bound = True
+    prefix = '$argon2id$'
+    floor = {'t': 2, 'm': 64 * 1024, 'p': 1}
+
+    def identify(self, stored):
+        return stored.startswith(self.prefix)
+
+    def hash(self, password, params):
+        return argon2_ll.hash_secret(
+            password.encode(), secrets.token_bytes(16),
+            time_cost=params['t'], memory_cost=params['m'], parallelism=params['p'],
+            hash_len=32, type=argon2_ll.Type.ID).decode()
+
+    def params(self, stored):
+        fields = stored.split('$')[3]
+        return {k: int(v) for k, v in (item.split('=') for item in fields.split(','))}
+
+    def verify(self, password, stored):
+        try:
+            return argon2_ll.verify_secret(stored.encode(), password.encode(), argon2_ll.Type.ID)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def cost(self, params):
+        return params['m'] * params['t']
+
+    def calibrate(self, budget_s):
+        memory_kib = int(os.getenv('PASSWORD_KDF_MAX_MEM_MB', '64')) * 1024
+        params = {'t': 1, 'm': memory_kib, 'p': 1}
+        while True:
+            start = time.perf_counter()
+            self.hash('calibration', params)
+            elapsed = time.perf_counter() - start
+            if elapsed * (params['t'] + 1) / params['t'] > budget_s or params['t'] >= 10:
+                return params
+            params['t'] += 1
+
+
+FORMATS = {}
+
+
+def register_format(fmt):
+    """Ajoute un format au registre (le dernier enregistré est testé en premier)"""
+    FORMATS[fmt.name] = fmt
+    return fmt
+
+
+register_format(Sha256Legacy())
+register_format(Sha512Legacy())
+register_format(Scrypt())
+if argon2_ll is not None:
+    register_format(Argon2id())
+
+
+def identify(stored):
+    """Format d'un hash stocké, ou None s'il n'est pas reconnu"""
+    for fmt in reversed(list(FORMATS.values())):
+        if fmt.identify(stored):
+            return fmt
+    return None
+
+
+def parse_params(fmt, text):
+    """
+    "n=32768,r=8,p=1" -> paramètres de `fmt` ; vide : le plancher du format.
+    Lève ValueError pour une clé inconnue ou manquante, ou un coût sous le plancher.
+    """
+    if not text or not text.strip():
+        return dict(fmt.floor)
+    try:
+        params = {k.strip(): int(v) for k, v in (item.split('=') for item in text.split(','))}
+    except ValueError:
+        raise ValueError(f"PASSWORD_HASH_PARAMS must look like "
+                         f"{','.join(f'{k}={v}' for k, v in fmt.floor.items())}")
+    if set(params) != set(fmt.floor):
+        raise ValueError(f"PASSWORD_HASH_PARAMS for {fmt.name} needs exactly {', '.join(fmt.floor)}")
+    if any(params[k] < v for k, v in fmt.floor.items()):
+        raise ValueError(f"PASSWORD_HASH_PARAMS is below the {fmt.name} floor {fmt.floor}")
+    return params
+
+
+# Points d'entrée des processus de travail (doivent être importables par nom)
+def _hash_job(scheme, password, params):
+    return FORMATS[scheme].hash(password, params)
+
+
+def _verify_job(password, stored):
+    fmt = identify(stored)
+    return fmt is not None and fmt.verify(password, stored)
+
+
+# ---------------- Moteur ----------------
+CGROUP_DIR = '/sys/fs/cgroup'
+
+
+def _cgroup_cpu_limit(root=CGROUP_DIR):
+    """Quota CPU du cgroup en nombre de CPU (arrondi au-dessus), ou None sans limite"""
+    try:
+        # cgroup v2 : "quota période" ou "max période"
+        with open(os.path.join(root, 'cpu.max')) as fp:
+            quota, period = fp.read().split()[:2]
+        if quota == 'max':
+            return None
+    except (OSError, ValueError):
+        try:
+            # cgroup v1 : quota -1 = pas de limite
+            with open(os.path.join(root, 'cpu', 'cpu.cfs_quota_us')) as fp:
+                quota = fp.read().strip()
+            with open(os.path.join(root, 'cpu', 'cpu.cfs_period_us')) as fp:
+                period = fp.read().strip()
+        except OSError:
+            return None
+    quota, period = int(quota), int(period)
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, -(-quota // period))
+
+
+def available_cpus(root=CGROUP_DIR):
+    """
+    CPU utilisables par ce conteneur : os.cpu_count() compte ceux du nœud,
+    pas la limite du pod. Minimum de l'affinité (cpuset) et du quota cgroup.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # hors Linux
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit(root)
+    return max(1, min(cpus, limit) if limit is not None else cpus)
+
+
+class PasswordEngine:
+    """
+    Hache et vérifie les mots de passe avec le format courant.
+
+    workers=0 exécute les calculs dans le thread appelant (tests, outils).
+    """
+
+    def __init__(self, scheme='scrypt', params=None, workers=None,
+                 max_pending=None, queue_timeout=0.5):
+        if scheme not in FORMATS:
+            raise ValueError(f"Unknown password hash scheme '{scheme}'")
+        self.format = FORMATS[scheme]
+        self.params = dict(params or self.format.floor)
+        self.workers = available_cpus() if workers is None else workers
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._admission = threading.BoundedSemaphore(max_pending or max(1, self.workers) * 4)
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'rehash_needed': 0}
+
+    def hash(self, password):
+        """Hash au format courant (préfixe + paramètres + sel)"""
+        self._stats['hashed'] += 1
+        return self._run(_hash_job, self.format.name, password, self.params)
+
+    def verify(self, password, stored):
+        """Vérifie un mot de passe contre un hash stocké, quel que soit son format"""
+        self._stats['verified'] += 1
+        fmt = identify(stored or '')
+        if fmt is None:
+            return False
+        if not fmt.cpu_bound:
+            return fmt.verify(password, stored)
+        return self._run(_verify_job, password, stored)
+
+    def needs_rehash(self, stored):
+        """
+        Vrai si le hash doit être migré : autre format, ou coût strictement
+        inférieur au coût courant (jamais vers un coût plus faible).
+        """
+        fmt = identify(stored or '')
+        outdated = fmt is not self.format or fmt.cost(fmt.params(stored)) < fmt.cost(self.params)
+        if outdated:
+            self._stats['rehash_needed'] += 1
+        return outdated
+
+    def stats(self):
+        return dict(self._stats, scheme=self.format.name, params=self.params, workers=self.workers)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._admission.acquire(timeout=self.queue_timeout):
+            self._stats['rejected'] += 1
+            raise Overloaded("password hashing queue is full")
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._admission.release()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # Imports différés : inutiles au démarrage (pool créé au premier hash)
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+                    # forkserver : pas de fork d'un processus multi-threadé (waitress)
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('forkserver'))
+        return self._executor
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Moteur du processus, configuré au premier appel"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                workers = os.getenv('PASSWORD_HASH_WORKERS')
+                max_pending = os.getenv('PASSWORD_HASH_MAX_PENDING')
+                scheme = os.getenv('PASSWORD_HASH_SCHEME', 'scrypt')
+                if scheme not in FORMATS:
+                    raise ValueError(f"Unknown password hash scheme '{scheme}'")
+                _engine = PasswordEngine(
+                    scheme=scheme,
+                    params=parse_params(FORMATS[scheme], os.getenv('PASSWORD_HASH_PARAMS')),
+                    workers=int(workers) if workers is not None else None,
+                    max_pending=int(max_pending) if max_pending is not None else None,
+                    queue_timeout=float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '0.5')),
+                )
+    return _engine
+
+
+def hash_password(password):
+    """Hash un mot de passe au format courant"""
+    return get_engine().hash(password)
+
+
+def verify_password(password, stored):
+    """Vérifie un mot de passe contre un hash stocké (tous formats)"""
+    return get_engine().verify(password, stored)
+
+
+def needs_rehash(stored):
+    """Vrai si le hash stocké doit être migré au prochain login réussi"""
+    return get_engine().needs_rehash(stored)
+
+
+if __name__ == '__main__':
+    # Valeur de PASSWORD_HASH_PARAMS proposée pour cette machine (à fixer dans la configuration)
+    import sys
+    fmt = FORMATS[os.getenv('PASSWORD_HASH_SCHEME', 'scrypt')]
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 50.0
+    print(','.join(f'{k}={v}' for k, v in fmt.calibrate(budget_ms / 1000.0).items()))
@@ -0,0 +1,118 @@
+import unittest
+import hashlib
+import threading
+import os
+import tempfile
+from unittest.mock import patch
+from passwords import PasswordEngine, Overloaded, available_cpus, identify, parse_params
+
+
+class TestPasswordEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = PasswordEngine(params={'n': 2 ** 10, 'r': 8, 'p': 1}, workers=0)
+
+    def test_hash_is_prefixed_and_salted(self):
+        """Le hash porte son format et ses paramètres, et deux hash diffèrent (sel)"""
+        first = self.engine.hash("secret")
+        second = self.engine.hash("secret")
+        self.assertTrue(first.startswith("$scrypt$v=1$n=1024,r=8,p=1$"))
+        self.assertNotEqual(first, second)
+        self.assertEqual(identify(first).name, "scrypt")
+
+    def test_verify_current_format(self):
+        stored = self.engine.hash("secret")
+        self.assertTrue(self.engine.verify("secret", stored))
+        self.assertFalse(self.engine.verify("wrong", stored))
+
+    def test_verify_legacy_formats(self):
+        """Les anciens hash SHA-256 et SHA-512 hexadécimaux restent valides"""
+        for digest in (hashlib.sha256, hashlib.sha512):
+            stored = digest(b"secret").hexdigest()
+            self.assertTrue(self.engine.verify("secret", stored))
+            self.assertFalse(self.engine.verify("wrong", stored))
+
+    def test_unknown_format_rejected(self):
+        self.assertFalse(self.engine.verify("secret", "not-a-hash"))
+        self.assertFalse(self.engine.verify("secret", None))
+
+    def test_needs_rehash(self):
+        """Legacy ou coût inférieur au coût courant : migration au prochain login"""
+        self.assertTrue(self.engine.needs_rehash(hashlib.sha512(b"secret").hexdigest()))
+        self.assertFalse(self.engine.needs_rehash(self.engine.hash("secret")))
+        weaker = PasswordEngine(params={'n': 2 ** 9, 'r': 8, 'p': 1}, workers=0)
+        self.assertTrue(self.engine.needs_rehash(weaker.hash("secret")))
+
+    def test_stronger_hash_never_downgraded(self):
+        """Hash plus coûteux que la cible (autre réplica, ancienne config) : conservé tel quel"""
+        stronger = PasswordEngine(params={'n': 2 ** 11, 'r': 8, 'p': 1}, workers=0)
+        self.assertFalse(self.engine.needs_rehash(stronger.hash("secret")))
+        # Deux réplicas de cibles différentes ne se renvoient pas le même compte
+        self.assertTrue(stronger.needs_rehash(self.engine.hash("secret")))
+        self.assertFalse(self.engine.needs_rehash(stronger.hash("secret")))
+
+    def test_params_from_config_with_floor(self):
+        """Coût pris dans la configuration, plancher du format par défaut et minimum"""
+        scrypt = identify(self.engine.hash("secret"))
+        self.assertEqual(parse_params(scrypt, None), {'n': 2 ** 14, 'r': 8, 'p': 1})
+        self.assertEqual(parse_params(scrypt, "n=32768, r=8, p=1"), {'n': 2 ** 15, 'r': 8, 'p': 1})
+        self.assertEqual(PasswordEngine(workers=0).params, {'n': 2 ** 14, 'r': 8, 'p': 1})
+        for bad in ("n=1024,r=8,p=1", "n=32768,r=8", "n=big,r=8,p=1"):
+            with self.assertRaises(ValueError):
+                parse_params(scrypt, bad)
+
+    def test_available_cpus_follows_container_limits(self):
+        """Quota cgroup (v2 puis v1) et affinité, pas les CPU du nœud"""
+        with tempfile.TemporaryDirectory() as root, \
+                patch('passwords.os.sched_getaffinity', create=True, return_value=set(range(8))):
+            self.assertEqual(available_cpus(root), 8)  # aucun quota lisible
+            os.mkdir(os.path.join(root, 'cpu'))
+            with open(os.path.join(root, 'cpu', 'cpu.cfs_quota_us'), 'w') as fp:
+                fp.write('150000\n')
+            with open(os.path.join(root, 'cpu', 'cpu.cfs_period_us'), 'w') as fp:
+                fp.write('100000\n')
+            self.assertEqual(available_cpus(root), 2)  # v1 : 1,5 CPU arrondi au-dessus
+            with open(os.path.join(root, 'cpu.max'), 'w') as fp:
+                fp.write('max 100000\n')
+            self.assertEqual(available_cpus(root), 8)
+            with open(os.path.join(root, 'cpu.max'), 'w') as fp:
+                fp.write('400000 100000\n')
+            self.assertEqual(available_cpus(root), 4)
+        with patch('passwords.os.sched_getaffinity', create=True, return_value={0, 1}):
+            self.assertEqual(available_cpus('/nonexistent'), 2)
+
+    def test_admission_control_rejects_when_full(self):
+        """File pleine : Overloaded au lieu de bloquer le thread appelant"""
+        engine = PasswordEngine(params={'n': 2 ** 10, 'r': 8, 'p': 1}, workers=1,
+                                max_pending=1, queue_timeout=0.01)
+        release = threading.Event()
+        engine._get_executor = lambda: _BlockingExecutor(release)
+        t = threading.Thread(target=engine.hash, args=("secret",))
+        t.start()
+        try:
+            with self.assertRaises(Overloaded):
+                engine.hash("other")
+            self.assertEqual(engine.stats()['rejected'], 1)
+        finally:
+            release.set()
+            t.join()
+
+
+class _BlockingExecutor:
+    """Exécuteur qui bloque jusqu'à libération, pour remplir la file d'admission"""
+
+    def __init__(self, release):
+        self.release = release
+
+    def submit(self, fn, *args):
+        executor = self
+
+        class _Future:
+            def result(self):
+                executor.release.wait(2)
+                return fn(*args)
+        return _Future()
+
+
+if __name__ == '__main__':
+    unittest.main()
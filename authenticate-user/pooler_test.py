@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import re
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # hash calculés dans le thread de test
+os.environ.setdefault('USER_FILTER_ENABLED', 'false')  # pas de thread d'écoute PostgreSQL
+import handler
+from db import ConnectionPool, execute_prepared, plain_statement, transaction
+
+# Instructions qui laissent un état dans la session serveur
+SESSION_STATE = re.compile(
+    r'^\s*(PREPARE|DEALLOCATE|LISTEN|UNLISTEN|RESET|DISCARD|SET\s+(?!LOCAL\b|TRANSACTION\b)|CREATE\s+TEMP)'
+    r'|\bWITH\s+HOLD\b|\bpg_advisory_lock\(',
+    re.I)
+
+
+class ServerSession:
+    def __init__(self, number):
+        self.number = number
+        self.prepared = {}
+
+
+class TransactionPooler:
+    """
+    Stand-in d'un PgBouncer en mode transaction : chaque transaction (chaque
+    instruction en autocommit) est servie par la session serveur suivante, à
+    tour de rôle. Tout état de session est relevé dans `leaks` ; un EXECUTE
+    sur une session qui n'a pas vu le PREPARE échoue comme sur un vrai pooler.
+    """
+
+    def __init__(self, rows, servers=2):
+        self.rows = rows  # rows(sql, params) -> lignes renvoyées
+        self.servers = [ServerSession(i) for i in range(servers)]
+        self.leaks = []
+        self.committed = []
+        self.active = 0
+        self._turn = 0
+
+    def connect(self):
+        return ClientConnection(self)
+
+    def assign(self):
+        server = self.servers[self._turn % len(self.servers)]
+        self._turn += 1
+        self.active += 1
+        return server
+
+    def run(self, server, sql, params):
+        if SESSION_STATE.search(sql):
+            self.leaks.append(sql.split()[0].upper())
+        match = re.match(r'\s*PREPARE (\w+) AS (.*)', sql, re.S)
+        if match:
+            server.prepared[match.group(1)] = match.group(2)
+            return []
+        match = re.match(r'\s*EXECUTE (\w+)', sql)
+        if match:
+            if match.group(1) not in server.prepared:
+                raise psycopg2.errors.InvalidSqlStatementName(f'prepared statement "{match.group(1)}" does not exist')
+            sql = server.prepared[match.group(1)]
+        return self.rows(sql, params)
+
+
+class ClientConnection:
+    """Connexion psycopg2 vue du client, à travers le pooler"""
+
+    encoding = 'UTF8'
+
+    def __init__(self, pooler):
+        self.pooler = pooler
+        self.closed = 0
+        self.autocommit = False
+        self.server = None
+        self.pending = []
+
+    def cursor(self, name=None):
+        return ClientCursor(self)
+
+    def execute(self, sql, params):
+        if self.autocommit:
+            server = self.pooler.assign()
+            try:
+                rows = self.pooler.run(server, sql, params)
+                self.pooler.committed.append(sql)
+                return rows
+            finally:
+                self.pooler.active -= 1
+        if self.server is None:
+            self.server = self.pooler.assign()  # BEGIN implicite de psycopg2
+        self.pending.append(sql)
+        return self.pooler.run(self.server, sql, params)
+
+    def get_transaction_status(self):
+        if self.server is None:
+            return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+    def _end(self, committed):
+        if self.server is not None:
+            self.server = None
+            self.pooler.active -= 1
+            if committed:
+                self.pooler.committed.extend(self.pending)
+        self.pending = []
+
+    def commit(self):
+        self._end(True)
+
+    def rollback(self):
+        self._end(False)
+
+    def close(self):
+        self.rollback()
+        self.closed = 1
+
+
+class ClientCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.rows = []
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode()  # execute_values : valeurs jamais interprétées ici
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        self.rows = list(self.connection.execute(sql, params))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TestTransactionPooler(unittest.TestCase):
+    """Le login d'authenticate-user à travers un pooler en mode transaction"""
+
+    def setUp(self):
+        legacy = hashlib.sha512(b"password").hexdigest()  # migré au premier login
+        self.users = {
+            "alice": (1, "alice", legacy, None, datetime.now(), False),
+            "bob": (2, "bob", handler.hash_password("password"), None, datetime.now(), False),
+        }
+        self.pooler = TransactionPooler(self.lookup)
+        self.pool = ConnectionPool(self.pooler.connect, maxsize=1)
+        checkout = lambda readonly=False: self.pool.getconn()  # noqa: E731
+        for target, value in (('handler.get_db_connection', checkout), ('handler.reread_connection', checkout),
+                              ('handler.ACTIVITY', MagicMock()), ('handler.RATE_LIMITER', None)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Aucun hash ne doit être calculé transaction ouverte
+        verify = handler.verify_password
+
+        def verify_outside_transaction(password, stored):
+            self.assertEqual(self.pooler.active, 0, "transaction held open while verifying a password")
+            return verify(password, stored)
+
+        patcher = patch('handler.verify_password', verify_outside_transaction)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def lookup(self, sql, params):
+        if 'FROM users' not in sql:
+            return []
+        names = list(params.values())[0] if isinstance(params, dict) else params[0]
+        names = names if isinstance(names, list) else [names]
+        return [self.users[name] for name in names if name in self.users]
+
+    def login(self, body):
+        event = MagicMock()
+        event.body = json.dumps(body)
+        return handler.handle(event, MagicMock())
+
+    def test_session_mode_leaks_prepared_statements(self):
+        """Sans le mode transaction, le PREPARE reste sur une session que l'EXECUTE n'a pas"""
+        with patch('db.TRANSACTION_POOLING', False):
+            result = self.login({"username": "bob", "password": "password"})
+        self.assertEqual(result["statusCode"], 500)
+        self.assertIn("PREPARE", self.pooler.leaks)
+
+    def test_transaction_mode_has_no_session_state(self):
+        with patch('db.TRANSACTION_POOLING', True):
+            for _ in range(3):
+                self.assertEqual(self.login({"username": "alice", "password": "password"})["statusCode"], 200)
+                self.assertEqual(self.login({"username": "bob", "password": "password"})["statusCode"], 200)
+            self.assertEqual(self.login({"username": "carol", "password": "password"})["statusCode"], 401)
+            batch = self.login({"credentials": [{"username": "alice", "password": "password"},
+                                                {"username": "bob", "password": "wrong"}]})
+
+        self.assertEqual([r["statusCode"] for r in json.loads(batch["body"])["results"]], [200, 401])
+        self.assertEqual(self.pooler.leaks, [])
+        self.assertEqual(self.pooler.active, 0)  # toutes les transactions validées ou annulées
+        # Hash d'alice migré à chaque succès (la ligne de test garde l'ancien), UPDATE validé explicitement
+        rehash = [sql for sql in self.pooler.committed if "SET password" in sql]
+        self.assertEqual(len(rehash), 4)
+        self.assertEqual(self.pool.stats()['created'], 1)
+
+    def test_transaction_context_commits_or_rolls_back(self):
+        conn = self.pooler.connect()
+        with patch('db.TRANSACTION_POOLING', True):
+            with transaction(conn):
+                conn.cursor().execute("UPDATE users SET mfa = NULL WHERE id = 1")
+            self.assertFalse(conn.autocommit)
+            with self.assertRaises(RuntimeError):
+                with transaction(conn):
+                    conn.cursor().execute("UPDATE users SET mfa = NULL WHERE id = 2")
+                    raise RuntimeError("boom")
+        self.assertEqual(self.pooler.committed, ["UPDATE users SET mfa = NULL WHERE id = 1"])
+        self.assertEqual(self.pooler.active, 0)
+
+    def test_plain_statement_replaces_server_side_prepare(self):
+        self.assertEqual(plain_statement("SELECT 1 FROM t WHERE a = $1 AND b LIKE 'x%' AND c = $2"),
+                         "SELECT 1 FROM t WHERE a = %(1)s AND b LIKE 'x%%' AND c = %(2)s")
+        cursor = MagicMock()
+        conn = MagicMock()
+        with patch('db.TRANSACTION_POOLING', True):
+            execute_prepared(conn, cursor, 'lookup', "SELECT $1", ('bob',))
+        cursor.execute.assert_called_once_with("SELECT %(1)s", {'1': 'bob'})
+        conn.prepared.add.assert_not_called()
+
+    def test_user_filter_needs_direct_connection(self):
+        import userfilter
+        with patch.dict(os.environ, {'USER_FILTER_ENABLED': 'true', 'DB_DIRECT_HOST': ''}):
+            with patch('db.TRANSACTION_POOLING', True):
+                self.assertFalse(userfilter.enabled())
+            with patch('db.TRANSACTION_POOLING', False):
+                self.assertTrue(userfilter.enabled())
+            with patch('db.TRANSACTION_POOLING', True), patch.dict(os.environ, {'DB_DIRECT_HOST': 'postgres'}):
+                self.assertTrue(userfilter.enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from ratelimit import LocalSharedStore, MemoryBackend, RateLimiter, SharedBackend, from_env
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def event_from(forwarded):
+    event = MagicMock()
+    event.headers = {'X-Forwarded-For': forwarded}
+    return event
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(MemoryBackend(clock=self.clock), ip_rate=1, ip_burst=2,
+                                   user_rate=0.5, user_burst=1)
+
+    def test_ip_bucket_denies_with_retry_after(self):
+        event = event_from("203.0.113.7")
+        self.assertIsNone(self.limiter.check(event))
+        self.assertIsNone(self.limiter.check(event))
+        denied = self.limiter.check(event)
+        self.assertEqual(denied["statusCode"], 429)
+        self.assertEqual(denied["headers"]["Retry-After"], "1")
+
+    def test_bucket_refills_over_time(self):
+        event = event_from("203.0.113.7")
+        for _ in range(2):
+            self.limiter.check(event)
+        self.assertIsNotNone(self.limiter.check(event))
+        self.clock.now += 1
+        self.assertIsNone(self.limiter.check(event))
+
+    def test_cost_takes_several_tokens(self):
+        """Lot de n identifiants : n jetons, refus sans attente au-delà de la capacité"""
+        event = event_from("203.0.113.7")
+        self.assertIsNone(self.limiter.check(event, cost=2))
+        denied = self.limiter.check(event, cost=2)
+        self.assertEqual(denied["headers"]["Retry-After"], "2")
+        too_large = self.limiter.check(event, cost=3)
+        self.assertEqual(too_large["statusCode"], 429)
+        self.assertNotIn("headers", too_large)
+        self.assertEqual(self.limiter.stats()['denied_ip'], 2)
+
+    def test_username_bucket_per_client(self):
+        """Seau (nom, IP) : un attaquant qui l'épuise ne bloque pas le vrai titulaire"""
+        self.assertIsNone(self.limiter.check(event_from("198.51.100.1"), "alice"))
+        denied = self.limiter.check(event_from("198.51.100.1"), "alice")
+        self.assertEqual(denied["statusCode"], 429)
+        self.assertEqual(denied["headers"]["Retry-After"], "2")
+        self.assertEqual(self.limiter.stats()['denied_user'], 1)
+        self.assertIsNone(self.limiter.check(event_from("203.0.113.9"), "alice"))
+
+    def test_username_bucket_across_ips_when_global(self):
+        """RATE_LIMIT_USER_SCOPE=global : force brute distribuée limitée par le nom seul"""
+        limiter = RateLimiter(MemoryBackend(clock=self.clock), user_rate=0.5, user_burst=1, user_scope='global')
+        self.assertIsNone(limiter.check(event_from("198.51.100.1"), "alice"))
+        self.assertEqual(limiter.check(event_from("198.51.100.2"), "alice")["statusCode"], 429)
+        with self.assertRaises(ValueError):
+            RateLimiter(MemoryBackend(), user_scope='account')
+
+    def test_from_env_prefixes_redis_keys_with_function(self):
+        client = MagicMock()
+        client.eval.return_value = [1, "0"]
+        redis = MagicMock()
+        redis.Redis.from_url.return_value = client
+        with patch.dict('sys.modules', {'redis': redis}), \
+                patch.dict('os.environ', {'RATE_LIMIT_BACKEND': 'redis', 'RATE_LIMIT_ENABLED': 'true'}):
+            limiter = from_env('generate-2fa')
+        limiter.check(event_from("203.0.113.7"), "alice")
+        keys = [c.args[2] for c in client.eval.call_args_list]
+        self.assertEqual(keys, ["ratelimit:generate-2fa:ip:203.0.113.7",
+                                "ratelimit:generate-2fa:user:203.0.113.7:alice"])
+
+    def test_client_ip_uses_entry_added_by_trusted_proxy(self):
+        """Une entrée X-Forwarded-For forgée par le client est ignorée"""
+        self.assertEqual(self.limiter.client_ip(event_from("6.6.6.6, 203.0.113.7")), "203.0.113.7")
+        two_hops = RateLimiter(MemoryBackend(), trusted_hops=2)
+        self.assertEqual(two_hops.client_ip(event_from("6.6.6.6, 203.0.113.7, 10.0.0.2")), "203.0.113.7")
+        self.assertIsNone(self.limiter.client_ip(MagicMock(headers={})))
+
+    def test_shared_backend_spans_replicas(self):
+        """Deux réplicas partageant le store consomment le même seau"""
+        store = LocalSharedStore(clock=self.clock)
+        replica_a = RateLimiter(SharedBackend(store), ip_rate=1, ip_burst=1)
+        replica_b = RateLimiter(SharedBackend(store), ip_rate=1, ip_burst=1)
+        event = event_from("203.0.113.7")
+        self.assertIsNone(replica_a.check(event))
+        self.assertEqual(replica_b.check(event)["statusCode"], 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
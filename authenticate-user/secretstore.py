@@ -0,0 +1,167 @@
+"""
+Secrets et configuration lus une fois puis gardés en mémoire, partagés par
+les fonctions MSPR (mot de passe de la base, clés MFA...).
+
+Chaque secret est cherché dans l'environnement, sinon dans les fichiers
+montés par OpenFaaS (/var/openfaas/secrets/<nom> ou un alias). Une valeur
+lue dans un fichier est mise en cache ; un thread de surveillance compare
+périodiquement (SECRETS_POLL_INTERVAL secondes, 10 par défaut, 0 = jamais)
+l'inode, la date et la taille des fichiers lus. Kubernetes met à jour un
+secret monté en remplaçant un lien symbolique : le changement est vu comme
+un nouvel inode.
+
+Les nouvelles valeurs remplacent l'ancien dictionnaire en une affectation :
+un lecteur voit toujours un état cohérent, sans verrou. Les consommateurs
+abonnés par `on_change` (pool de connexions, trousseau MFA) sont ensuite
+appelés avec les noms modifiés.
+"""
+
+import os
+import threading
+
+SECRETS_DIR = '/var/openfaas/secrets'
+POLL_INTERVAL = float(os.getenv('SECRETS_POLL_INTERVAL', '10'))
+
+_MISSING = object()
+
+
+def _fingerprint(path):
+    """(inode, date, taille) du fichier, ou None s'il n'existe pas"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class SecretStore:
+    """Cache thread-safe nom -> valeur, rechargé quand un fichier de secret change"""
+
+    def __init__(self, directory=SECRETS_DIR, poll_interval=POLL_INTERVAL, environ=os.environ):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._environ = environ
+        # nom demandé -> (valeur, chemin lu, empreinte) ; remplacé en bloc à chaque changement
+        self._values = {}
+        self._aliases = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._stats = {'loads': 0, 'reloads': 0, 'errors': 0}
+
+    def get(self, name, *aliases, default=None):
+        """Variable d'environnement `name`, sinon fichier `name` ou un alias, sinon `default`"""
+        value = self._environ.get(name)
+        if value:
+            return value
+        entry = self._values.get(name, _MISSING)
+        if entry is _MISSING:
+            entry = self._load(name, aliases)
+        return entry[0] if entry[0] is not None else default
+
+    def on_change(self, names, callback):
+        """Appelle callback(noms modifiés) quand l'un des secrets `names` change"""
+        with self._lock:
+            self._subscribers.append((frozenset(names), callback))
+
+    def refresh(self):
+        """Relit les fichiers dont l'empreinte a changé ; renvoie les noms modifiés"""
+        with self._lock:
+            values = self._values
+            updates = {}
+            for name, (value, path, fingerprint) in values.items():
+                entry = self._read(name, self._aliases[name])
+                if entry[1:] != (path, fingerprint):
+                    updates[name] = entry
+            if not updates:
+                return set()
+            # Fichier réécrit à l'identique : nouvelle empreinte, pas de notification
+            modified = {name for name, entry in updates.items() if entry[0] != values[name][0]}
+            self._values = dict(values, **updates)
+            self._stats['reloads'] += len(modified)
+            subscribers = [callback for names, callback in self._subscribers if names & modified]
+        for callback in subscribers:
+            try:
+                callback(modified)
+            except Exception:
+                # Consommateur en échec (nouvelle valeur invalide) : il garde son état
+                self._stats['errors'] += 1
+        return modified
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._values)
+        return stats
+
+    def close(self):
+        """Arrête le thread de surveillance"""
+        self._stop.set()
+
+    # ---------- Interne ----------
+    def _read(self, name, aliases):
+        """(valeur, chemin, empreinte) du premier fichier existant parmi name et ses alias"""
+        for filename in (name,) + tuple(aliases):
+            path = os.path.join(self.directory, filename)
+            fingerprint = _fingerprint(path)
+            if fingerprint is None:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as fp:
+                    return fp.read().strip(), path, fingerprint
+            except FileNotFoundError:
+                continue  # remplacé entre stat() et open() : relu au prochain passage
+        return None, None, None
+
+    def _load(self, name, aliases):
+        with self._lock:
+            entry = self._values.get(name, _MISSING)
+            if entry is _MISSING:
+                entry = self._read(name, aliases)
+                self._aliases[name] = tuple(aliases)
+                self._values = dict(self._values, **{name: entry})
+                self._stats['loads'] += 1
+                self._start_watcher()
+        return entry
+
+    def _start_watcher(self):
+        """Thread de surveillance, démarré au premier secret demandé (verrou tenu)"""
+        if self._watcher is not None or self.poll_interval <= 0 or not os.path.isdir(self.directory):
+            return
+        self._watcher = threading.Thread(target=self._watch, name='secret-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:
+                self._stats['errors'] += 1
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    """Magasin du processus"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SecretStore()
+    return _store
+
+
+def get(name, *aliases, default=None):
+    return store().get(name, *aliases, default=default)
+
+
+def on_change(names, callback):
+    store().on_change(names, callback)
+
+
+def stats():
+    """Compteurs du magasin (vide si aucun secret n'a encore été demandé)"""
+    return _store.stats() if _store is not None else {}
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import secretstore
+
+
+class TestSecretStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = secretstore.SecretStore(self.tmp.name, poll_interval=0, environ={})
+
+    def write(self, name, value):
+        # Remplacement atomique, comme la mise à jour d'un secret monté
+        path = os.path.join(self.tmp.name, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as fp:
+            fp.write(value + '\n')
+        os.replace(path + '.tmp', path)
+
+    def test_file_read_once(self):
+        self.write('db-creds', 's3cret')
+        with patch('builtins.open', wraps=open) as opened:
+            for _ in range(3):
+                self.assertEqual(self.store.get('DB_PASSWORD', 'db-creds', default='password'), 's3cret')
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(self.store.get('MISSING', default='x'), 'x')
+
+    def test_environment_wins(self):
+        self.write('DB_PASSWORD', 'from-file')
+        store = secretstore.SecretStore(self.tmp.name, poll_interval=0, environ={'DB_PASSWORD': 'from-env'})
+        self.assertEqual(store.get('DB_PASSWORD'), 'from-env')
+
+    def test_refresh_swaps_value_and_notifies(self):
+        self.write('mfa-keys', 'k1:AAAA')
+        self.assertEqual(self.store.get('MFA_KEYS', 'mfa-keys'), 'k1:AAAA')
+        self.assertIsNone(self.store.get('MFA_KEY_B64', 'mfa-key'))
+        seen = []
+        self.store.on_change(('MFA_KEYS',), seen.append)
+        self.store.on_change(('DB_PASSWORD',), lambda names: self.fail("unrelated consumer notified"))
+
+        self.assertEqual(self.store.refresh(), set())
+        self.write('mfa-keys', 'k1:AAAA,k2:BBBB')
+        self.write('mfa-key', 'LEGACY')
+        self.assertEqual(self.store.refresh(), {'MFA_KEYS', 'MFA_KEY_B64'})
+        self.assertEqual(self.store.get('MFA_KEYS', 'mfa-keys'), 'k1:AAAA,k2:BBBB')
+        self.assertEqual(self.store.get('MFA_KEY_B64', 'mfa-key'), 'LEGACY')
+        self.assertEqual(seen, [{'MFA_KEYS', 'MFA_KEY_B64'}])
+
+        self.write('mfa-keys', 'k1:AAAA,k2:BBBB')  # réécrit à l'identique
+        self.assertEqual(self.store.refresh(), set())
+        self.assertEqual(len(seen), 1)
+
+    def test_failing_consumer_counted(self):
+        self.write('DB_PASSWORD', 'a')
+        self.store.get('DB_PASSWORD')
+        self.store.on_change(('DB_PASSWORD',), lambda names: 1 / 0)
+        self.write('DB_PASSWORD', 'b')
+        self.assertEqual(self.store.refresh(), {'DB_PASSWORD'})
+        self.assertEqual(self.store.get('DB_PASSWORD'), 'b')
+        self.assertEqual(self.store.stats()['errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
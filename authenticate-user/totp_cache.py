@@ -0,0 +1,68 @@
+"""
+Cache LRU borné à durée de vie (TTL) des objets pyotp.TOTP déchiffrés.
+
+Les entrées sont indexées par id utilisateur et mémorisent la valeur `mfa`
+chiffrée dont elles proviennent : si la colonne change (nouvel enrôlement,
+rotation de clé), l'entrée est invalidée au lieu de servir un ancien secret.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TotpCache:
+    """Cache thread-safe user_id -> (mfa chiffré, TOTP prêt à l'emploi)"""
+
+    def __init__(self, maxsize=1024, ttl=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'expirations': 0}
+
+    def get(self, user_id, encrypted):
+        """TOTP en cache pour cette valeur `mfa`, ou None"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            cached_value, totp, expires_at = entry
+            if cached_value != encrypted:
+                # La colonne mfa a changé depuis la mise en cache
+                del self._entries[user_id]
+                self._stats['invalidations'] += 1
+                self._stats['misses'] += 1
+                return None
+            if now >= expires_at:
+                del self._entries[user_id]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return totp
+
+    def put(self, user_id, encrypted, totp):
+        with self._lock:
+            self._entries[user_id] = (encrypted, totp, self._clock() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), maxsize=self.maxsize)
@@ -0,0 +1,51 @@
+import unittest
+from totp_cache import TotpCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTotpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TotpCache(maxsize=2, ttl=60, clock=self.clock)
+
+    def test_hit_after_put(self):
+        self.assertIsNone(self.cache.get(1, "enc-a"))
+        self.cache.put(1, "enc-a", "totp-a")
+        self.assertEqual(self.cache.get(1, "enc-a"), "totp-a")
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_changed_mfa_invalidates_entry(self):
+        """Nouvelle valeur mfa en base : l'ancien TOTP n'est jamais servi"""
+        self.cache.put(1, "enc-a", "totp-a")
+        self.assertIsNone(self.cache.get(1, "enc-b"))
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertIsNone(self.cache.get(1, "enc-a"))
+
+    def test_ttl_expiry(self):
+        self.cache.put(1, "enc-a", "totp-a")
+        self.clock.now = 61
+        self.assertIsNone(self.cache.get(1, "enc-a"))
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_lru_eviction(self):
+        """Au-delà de maxsize, l'entrée la moins récemment utilisée sort"""
+        self.cache.put(1, "enc-1", "t1")
+        self.cache.put(2, "enc-2", "t2")
+        self.cache.get(1, "enc-1")
+        self.cache.put(3, "enc-3", "t3")
+        self.assertIsNone(self.cache.get(2, "enc-2"))
+        self.assertEqual(self.cache.get(1, "enc-1"), "t1")
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
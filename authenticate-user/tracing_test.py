@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+
+import metrics
+import tracing
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+    def shutdown(self):
+        pass
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        self.processor = tracing.configure(self.exporter, interval=3600)
+
+    def tearDown(self):
+        tracing.shutdown()
+
+    def test_traceparent_propagated_and_spans_nested(self):
+        """Racine rattachée au traceparent de la passerelle, phases en enfants"""
+        headers = {'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'}
+        with tracing.start_trace('call_handler', headers) as root:
+            with metrics.phase('select'):
+                with tracing.span('db.execute', statement='SELECT 1'):
+                    pass
+        self.processor.flush()
+
+        spans = {s.name: s for s in self.exporter.spans}
+        self.assertEqual(set(spans), {'call_handler', 'select', 'db.execute'})
+        self.assertEqual({s.trace.trace_id for s in spans.values()}, {'0af7651916cd43dd8448eb211c80319c'})
+        self.assertEqual(root.parent_id, 'b7ad6b7169203331')
+        self.assertEqual(spans['select'].parent_id, root.span_id)
+        self.assertEqual(spans['db.execute'].parent_id, spans['select'].span_id)
+        self.assertEqual(tracing.format_traceparent(root)[:35], '00-0af7651916cd43dd8448eb211c80319c')
+
+    def test_since_adds_finished_child_span(self):
+        with tracing.start_trace('call_handler') as root:
+            metrics.since('verify_totp', metrics.clock() - 0.002)
+        self.processor.flush()
+
+        span = next(s for s in self.exporter.spans if s.name == 'verify_totp')
+        self.assertEqual(span.parent_id, root.span_id)
+        self.assertGreaterEqual(span.end_ns - span.start_ns, 2_000_000)
+
+    def test_unsampled_or_invalid_parent(self):
+        self.assertIsNone(tracing.start_trace('r', {'traceparent': '00-' + 'a' * 32 + '-' + 'b' * 16 + '-00'}))
+        self.assertIsNone(tracing.parse_traceparent('00-' + '0' * 32 + '-' + 'b' * 16 + '-01'))
+        self.assertIsNone(tracing.parse_traceparent('garbage'))
+        root = tracing.start_trace('r', {'traceparent': 'garbage'})
+        self.assertIsNone(root.parent_id)  # nouvelle trace
+
+    def test_spans_outside_trace_are_noops(self):
+        self.assertIsNone(tracing.start_span('orphan'))
+        with tracing.span('orphan') as s:
+            self.assertIsNone(s)
+
+    def test_fast_requests_filtered_by_min_duration(self):
+        processor = tracing.configure(self.exporter, interval=3600, min_duration_ms=10000)
+        with tracing.start_trace('fast'):
+            pass
+        processor.flush()
+        self.assertEqual(self.exporter.spans, [])
+        self.assertEqual(processor.stats()['filtered'], 1)
+
+    def test_jsonl_exporter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'traces.jsonl')
+            processor = tracing.configure(tracing.JsonlExporter(path), interval=3600)
+            with tracing.start_trace('call_handler', method='POST'):
+                with tracing.span('qr'):
+                    pass
+            processor.flush()
+            with open(path, encoding='utf-8') as fp:
+                lines = [json.loads(line) for line in fp]
+        self.assertEqual([l['name'] for l in lines], ['qr', 'call_handler'])
+        self.assertEqual(lines[1]['attributes'], {'method': 'POST'})
+        self.assertEqual(lines[0]['parentSpanId'], lines[1]['spanId'])
+
+
+if __name__ == '__main__':
+    unittest.main()
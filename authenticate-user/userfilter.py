@@ -0,0 +1,253 @@
+"""
+Filtre de Bloom des noms d'utilisateurs existants pour authenticate-user.
+
+Un nom absent du filtre n'existe certainement pas : la requête est rejetée
+sans connexion ni SELECT. Un nom présent peut être un faux positif (taux
+USER_FILTER_FP_RATE) et suit le chemin normal.
+
+Le filtre est construit en arrière-plan en parcourant la table `users` avec
+un curseur côté serveur, puis tenu à jour par les notifications
+`users_created` qu'un trigger sur `users` envoie à chaque insertion, quel que
+soit son chemin (migration 0003 : generate-password, SQL d'administration,
+restauration...). Tant qu'il n'est pas construit, ou si l'écoute des
+notifications est interrompue, le filtre laisse tout passer : il ne peut
+jamais refuser un utilisateur réel.
+
+Un refus par le filtre économise l'aller-retour vers PostgreSQL, mais ne doit
+pas répondre plus vite qu'un refus après SELECT : l'écart révélerait qu'un nom
+n'existe pas. Le filtre tient une moyenne glissante de la durée des lectures
+d'utilisateur, et un refus attend autant (`pad`). La fuite résiduelle est
+statistique (attente égale à la moyenne contre durée variable d'une lecture),
+noyée dans le calcul de hash, bien plus long, que les deux chemins font.
+
+Avant de refuser un nom absent, la requête lit les notifications déjà
+arrivées sur la connexion d'écoute : un compte validé juste avant le login
+n'est pas refusé parce que le thread d'écoute ne l'a pas encore traité. Les
+notifications reçues pendant une reconstruction sont rejouées sur le nouveau
+filtre.
+
+LISTEN est un état de session : derrière un pooler en mode transaction, le
+filtre se connecte directement à PostgreSQL (DB_DIRECT_HOST) ou reste
+désactivé, faute de quoi des créations seraient manquées.
+"""
+
+import hashlib
+import math
+import os
+import select
+import threading
+import time
+
+import db
+
+CHANNEL = 'users_created'
+
+# Poids d'une nouvelle lecture dans la moyenne glissante de leur durée
+LOOKUP_SMOOTHING = 0.1
+
+
+class BloomFilter:
+    """Filtre de Bloom à double hachage (blake2b) sur un bytearray"""
+
+    def __init__(self, capacity, fp_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.nbits = max(8, int(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, round(self.nbits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.nbits for i in range(self.nhashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class UserFilter:
+    """Filtre des utilisateurs existants, maintenu par un thread d'écoute"""
+
+    def __init__(self, connect_fn=db.connect_direct, fp_rate=0.01, min_capacity=100000,
+                 batch_size=10000, retry_delay=5.0):
+        self._connect = connect_fn
+        self.fp_rate = fp_rate
+        self.min_capacity = min_capacity
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self._bloom = None  # None : filtre inactif, tout passe
+        self._listener = None
+        self._rebuilding = None  # noms notifiés pendant une reconstruction
+        self._notify_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {'checks': 0, 'rejected': 0, 'rechecked': 0, 'builds': 0, 'notifications': 0,
+                       'listener_errors': 0}
+        self._lookup_seconds = 0.0
+
+    # ---------- Chemin de requête ----------
+    def might_exist(self, username):
+        """Faux uniquement si l'utilisateur n'existe certainement pas"""
+        bloom = self._bloom
+        if bloom is None:
+            return True
+        self._stats['checks'] += 1
+        if username in bloom:
+            return True
+        # Absent : notifications peut-être arrivées mais pas encore traitées
+        self._stats['rechecked'] += 1
+        self._drain()
+        bloom = self._bloom
+        if bloom is None or username in bloom:
+            return True
+        self._stats['rejected'] += 1
+        return False
+
+    def observe_lookup(self, seconds):
+        """Durée d'une lecture d'utilisateur en base (connexion et SELECT)"""
+        if self._lookup_seconds == 0.0:
+            self._lookup_seconds = seconds
+        else:
+            self._lookup_seconds += (seconds - self._lookup_seconds) * LOOKUP_SMOOTHING
+
+    @property
+    def lookup_seconds(self):
+        """Durée moyenne d'une lecture d'utilisateur (0 avant la première)"""
+        return self._lookup_seconds
+
+    def pad(self):
+        """Attend la durée moyenne d'une lecture, à la place de celle qu'un refus évite"""
+        if self._lookup_seconds > 0.0:
+            time.sleep(self._lookup_seconds)
+
+    @property
+    def ready(self):
+        return self._bloom is not None
+
+    def stats(self):
+        bloom = self._bloom
+        return dict(self._stats, ready=bloom is not None,
+                    lookup_seconds=self._lookup_seconds,
+                    count=bloom.count if bloom else 0,
+                    capacity=bloom.capacity if bloom else 0)
+
+    # ---------- Construction et écoute ----------
+    def start(self):
+        """Démarre (une seule fois) le thread de construction/écoute"""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='userfilter', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def build(self):
+        """Construit un nouveau filtre en parcourant `users` par lots (curseur serveur)"""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = 'users'")
+            row = cur.fetchone()
+            estimate = max(row[0] if row else 0, 0)
+            cur.close()
+
+            bloom = BloomFilter(max(self.min_capacity, 2 * estimate), self.fp_rate)
+            with conn.cursor(name='userfilter_build') as named:
+                named.itersize = self.batch_size
+                named.execute("SELECT username FROM users")
+                for (username,) in named:
+                    bloom.add(username)
+            conn.rollback()
+            return bloom
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            listener = None
+            try:
+                listener = self._connect()
+                listener.autocommit = True
+                with listener.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                # LISTEN avant la construction : aucune création n'est perdue entre les deux
+                bloom = self.build()
+                self._stats['builds'] += 1
+                with self._notify_lock:
+                    self._listener = listener
+                    self._bloom = bloom
+                self._listen(listener)
+            except Exception:
+                self._stats['listener_errors'] += 1
+            finally:
+                # Notifications potentiellement perdues : filtre désactivé jusqu'à reconstruction
+                with self._notify_lock:
+                    self._bloom = None
+                    self._listener = None
+                    self._rebuilding = None
+                if listener is not None:
+                    try:
+                        listener.close()
+                    except Exception:
+                        pass
+            self._stop.wait(self.retry_delay)
+
+    def _listen(self, listener):
+        while not self._stop.is_set():
+            if select.select([listener], [], [], 5.0) == ([], [], []):
+                continue
+            self._drain()
+            bloom = self._bloom
+            if bloom is not None and bloom.count > bloom.capacity:
+                # Filtre saturé : taux de faux positifs dégradé, on reconstruit plus grand.
+                # Les noms notifiés pendant la construction vont aussi au nouveau filtre
+                # (l'instantané du parcours peut précéder leur commit)
+                with self._notify_lock:
+                    self._rebuilding = []
+                rebuilt = self.build()  # en cas d'échec, _run remet tout à zéro
+                with self._notify_lock:
+                    for username in self._rebuilding:
+                        rebuilt.add(username)
+                    self._rebuilding = None
+                    self._bloom = rebuilt
+                self._stats['builds'] += 1
+
+    def _drain(self):
+        """Applique les notifications déjà reçues (sans attendre), depuis n'importe quel thread"""
+        with self._notify_lock:
+            listener, bloom = self._listener, self._bloom
+            if listener is None or bloom is None:
+                return
+            listener.poll()
+            while listener.notifies:
+                username = listener.notifies.pop(0).payload
+                bloom.add(username)
+                if self._rebuilding is not None:
+                    self._rebuilding.append(username)
+                self._stats['notifications'] += 1
+
+
+def from_env():
+    """UserFilter configuré par l'environnement (USER_FILTER_*)"""
+    return UserFilter(
+        fp_rate=float(os.getenv('USER_FILTER_FP_RATE', '0.01')),
+        min_capacity=int(os.getenv('USER_FILTER_MIN_CAPACITY', '100000')),
+        batch_size=int(os.getenv('USER_FILTER_BATCH', '10000')),
+    )
+
+
+def enabled():
+    """Filtre demandé, et une connexion de session est disponible pour LISTEN"""
+    wanted = os.getenv('USER_FILTER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    return wanted and db.has_direct_connection()
+
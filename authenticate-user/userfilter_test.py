@@ -0,0 +1,126 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from userfilter import CHANNEL, BloomFilter, UserFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        names = [f"user{i}" for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+
+    def test_false_positive_rate_close_to_target(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"user{i}")
+        false_positives = sum(f"ghost{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)  # ~1 % attendu, marge large
+
+
+class TestUserFilter(unittest.TestCase):
+
+    def fake_connect(self, usernames):
+        conn = MagicMock()
+        plain = MagicMock()
+        plain.fetchone.return_value = (len(usernames),)
+        named = MagicMock()
+        named.__enter__.return_value = named
+        named.__iter__.return_value = iter([(u,) for u in usernames])
+        conn.cursor.side_effect = lambda name=None: named if name else plain
+        return lambda: conn
+
+    def test_not_ready_lets_everything_through(self):
+        """Filtre non construit : aucun rejet possible"""
+        user_filter = UserFilter(connect_fn=self.fake_connect([]))
+        self.assertFalse(user_filter.ready)
+        self.assertTrue(user_filter.might_exist("anyone"))
+
+    def test_pad_waits_average_lookup(self):
+        """Refus par le filtre : attente de la durée moyenne d'une lecture en base"""
+        user_filter = UserFilter(connect_fn=self.fake_connect([]))
+        with patch('userfilter.time.sleep') as sleep:
+            user_filter.pad()
+            sleep.assert_not_called()  # aucune lecture mesurée
+            user_filter.observe_lookup(0.002)
+            user_filter.observe_lookup(0.012)
+            user_filter.pad()
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.003)
+        self.assertAlmostEqual(user_filter.stats()['lookup_seconds'], 0.003)
+
+    def test_build_streams_users_with_server_side_cursor(self):
+        user_filter = UserFilter(connect_fn=self.fake_connect(["alice", "bob"]), min_capacity=100)
+        user_filter._bloom = user_filter.build()
+        self.assertTrue(user_filter.might_exist("alice"))
+        self.assertTrue(user_filter.might_exist("bob"))
+        self.assertFalse(user_filter.might_exist("mallory"))
+        self.assertEqual(user_filter.stats()['rejected'], 1)
+
+    def fake_listener(self):
+        """Connexion d'écoute : `pending` simule les notifications arrivées sur le socket"""
+        listener = MagicMock()
+        listener.notifies = []
+        listener.pending = []
+
+        def poll():
+            listener.notifies.extend(SimpleNamespace(payload=name) for name in listener.pending)
+            listener.pending.clear()
+        listener.poll.side_effect = poll
+        return listener
+
+    def test_user_inserted_outside_generate_password(self):
+        """
+        Compte créé par du SQL direct : la notification du trigger (migration
+        0003) arrivée avant le login, pas encore traitée par le thread
+        d'écoute, évite le refus.
+        """
+        user_filter = UserFilter(connect_fn=self.fake_connect(["alice"]), min_capacity=100)
+        user_filter._bloom = user_filter.build()
+        user_filter._listener = listener = self.fake_listener()
+
+        listener.pending.append("carol")  # INSERT INTO users ... par un administrateur
+        self.assertTrue(user_filter.might_exist("carol"))
+        self.assertTrue(user_filter.might_exist("carol"))
+        self.assertFalse(user_filter.might_exist("mallory"))
+        stats = user_filter.stats()
+        self.assertEqual((stats['notifications'], stats['rejected']), (1, 1))
+
+    def test_insert_trigger_covers_every_insert_path(self):
+        """La notification vient d'un trigger sur users, pas seulement de generate-password"""
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'migrations',
+                            '0003_users_created_notify.sql')
+        with open(path, encoding='utf-8') as fp:
+            sql = fp.read()
+        self.assertIn("AFTER INSERT ON users", sql)
+        self.assertIn(f"pg_notify('{CHANNEL}'", sql)
+
+    def test_notifications_during_rebuild_reach_new_filter(self):
+        """Filtre saturé reconstruit : un nom notifié pendant le parcours n'est pas perdu"""
+        user_filter = UserFilter(connect_fn=self.fake_connect(["alice"]), min_capacity=100)
+        user_filter._bloom = user_filter.build()
+        user_filter._listener = listener = self.fake_listener()
+        user_filter._stop.is_set = MagicMock(side_effect=[False, True])
+
+        old_build = user_filter.build
+
+        def build_while_notified():
+            listener.pending.append("dave")  # validé après l'instantané du parcours
+            user_filter._drain()
+            return old_build()
+
+        user_filter._bloom.count = user_filter._bloom.capacity + 1  # saturé
+        user_filter.build = build_while_notified
+        with patch('userfilter.select.select', return_value=([listener], [], [])):
+            user_filter._listen(listener)
+
+        self.assertTrue(user_filter.might_exist("dave"))
+        self.assertIsNone(user_filter._rebuilding)
+        self.assertEqual(user_filter.stats()['builds'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
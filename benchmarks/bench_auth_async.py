@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark authenticate-user : chemin threadé (handler.handle, comme sous
+waitress) contre chemin asyncio (handler_async.handle, comme sous asgi.py).
+
+Nécessite une base PostgreSQL initialisée (database/init.sql) et les mêmes
+variables d'environnement que les fonctions (DB_HOST, DB_NAME, DB_USER,
+DB_PASSWORD, DB_PORT, MFA_KEY_B64).
+
+    python benchmarks/bench_auth_async.py --requests 5000 --concurrency 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'authenticate-user'))
+
+import db  # noqa: E402
+import handler  # noqa: E402
+import handler_async  # noqa: E402
+
+BENCH_USER = 'bench_async_user'
+BENCH_PASSWORD = 'bench-async-password-0123'
+
+
+class Event:
+    def __init__(self, body):
+        self.body = body
+
+
+def ensure_user():
+    """Crée (ou réactive) l'utilisateur de benchmark"""
+    conn = db.connect()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, password, gendate, expired) VALUES (%s, %s, %s, false)
+        ON CONFLICT (username) DO UPDATE
+        SET password = EXCLUDED.password, gendate = EXCLUDED.gendate, expired = false, mfa = NULL
+    """, (BENCH_USER, handler.hash_password(BENCH_PASSWORD), datetime.now()))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(name, latencies, elapsed, peak):
+    print(f"{name:<10} {len(latencies) / elapsed:>9.0f} req/s   "
+          f"p50 {percentile(latencies, 0.50) * 1000:>7.1f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms   "
+          f"en vol max {peak}")
+
+
+def bench_threaded(n, threads):
+    body = json.dumps({"username": BENCH_USER, "password": BENCH_PASSWORD})
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        result = handler.handle(Event(body), None)
+        latencies.append(time.perf_counter() - start)
+        assert result["statusCode"] == 200, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(n)))
+    report("threaded", latencies, time.perf_counter() - start, threads)
+
+
+async def bench_async(n, concurrency):
+    body = json.dumps({"username": BENCH_USER, "password": BENCH_PASSWORD})
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    in_flight = peak = 0
+
+    async def one():
+        nonlocal in_flight, peak
+        async with sem:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            start = time.perf_counter()
+            result = await handler_async.handle(Event(body), None)
+            latencies.append(time.perf_counter() - start)
+            in_flight -= 1
+            assert result["statusCode"] == 200, result
+
+    await handler_async.get_pool()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    report("asyncio", latencies, time.perf_counter() - start, peak)
+    await handler_async.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1000,
+                        help="connexions simultanées côté asyncio")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WAITRESS_THREADS', '4')),
+                        help="threads côté chemin synchrone (threads waitress)")
+    args = parser.parse_args()
+
+    ensure_user()
+    bench_threaded(args.requests, args.threads)
+    asyncio.run(bench_async(args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark authenticate-user : allers-retours PostgreSQL et latence d'un login.
+
+Compare, sur une connexion en autocommit où chaque execute() correspond à un
+aller-retour, la séquence d'origine (BEGIN, SELECT analysé à chaque fois,
+UPDATE de gendate, COMMIT) à celle du handler (EXECUTE auth_lookup préparé,
+activité écrite en différé).
+
+Nécessite une base PostgreSQL initialisée (database/init.sql) et les mêmes
+variables d'environnement que les fonctions (DB_HOST, DB_NAME, DB_USER,
+DB_PASSWORD, DB_PORT, MFA_KEY_B64).
+
+    python benchmarks/bench_auth_roundtrips.py --logins 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'authenticate-user'))
+
+import db  # noqa: E402
+import handler  # noqa: E402
+
+BENCH_USER = 'bench_roundtrip_user'
+
+LEGACY_SELECT = """
+    SELECT id, username, password, mfa, gendate, expired
+    FROM users
+    WHERE username = %s
+"""
+
+
+class CountingCursor:
+    """Curseur qui compte les execute(), soit les allers-retours en autocommit"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.round_trips = 0
+
+    def execute(self, sql, params=None):
+        self.round_trips += 1
+        return self.cursor.execute(sql, params)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+
+def ensure_user(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, password, gendate, expired) VALUES (%s, %s, %s, false)
+        ON CONFLICT (username) DO UPDATE SET expired = false, gendate = EXCLUDED.gendate
+    """, (BENCH_USER, 'x', datetime.now()))
+    cur.close()
+
+
+def legacy_login(conn, cur):
+    cur.execute("BEGIN")
+    cur.execute(LEGACY_SELECT, (BENCH_USER,))
+    user = cur.fetchone()
+    cur.execute("UPDATE users SET gendate = %s WHERE id = %s", (datetime.now(), user[0]))
+    cur.execute("COMMIT")
+
+
+def prepared_login(conn, cur):
+    handler.lookup_user(conn, cur, BENCH_USER)
+
+
+def run(name, login, conn, n):
+    cur = CountingCursor(conn.cursor())
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        login(conn, cur)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{name:<10} {cur.round_trips / n:>4.1f} allers-retours/login   "
+          f"p50 {latencies[n // 2] * 1000:>6.2f} ms   "
+          f"p99 {latencies[min(n - 1, int(n * 0.99))] * 1000:>6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=2000)
+    args = parser.parse_args()
+
+    pool = db.ConnectionPool(db.connect, maxsize=1)
+    conn = pool.getconn()
+    conn.autocommit = True
+    try:
+        ensure_user(conn)
+        run("origine", legacy_login, conn, args.logins)
+        run("préparée", prepared_login, conn, args.logins)
+    finally:
+        conn.close()
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
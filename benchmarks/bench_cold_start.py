@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Budget de démarrage à froid par fonction (scaleFromZero : la première requête
+après une période d'inactivité paie l'import du handler).
+
+Pour chaque fonction, importe `handler` dans un interpréteur neuf avec
+`-X importtime`, garde le meilleur de --runs essais, puis compare à
+benchmarks/cold_start_budget.json :
+- `max_import_ms` : durée cumulée de l'import du handler ;
+- `deferred` : modules qui ne doivent pas être chargés à l'import (chargés
+  au premier usage : qrcode/PIL, cryptography, pyotp...).
+
+Code de sortie 1 si un budget est dépassé. Aucune base de données nécessaire.
+
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --top 15 generate-2fa
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cold_start_budget.json')
+
+# Import du handler seul, avec la liste des modules chargés en sortie standard
+PROBE = "import handler, sys, json; print(json.dumps(sorted(sys.modules)))"
+
+
+def import_profile(function):
+    """(durée cumulée en µs, {module: µs propres}, modules chargés) d'un import du handler"""
+    env = dict(os.environ, USER_FILTER_ENABLED='false', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE],
+                          cwd=os.path.join(ROOT, function), env=env,
+                          capture_output=True, text=True, check=True)
+    total, own = 0, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        own[name] = int(self_us)
+        if name == 'handler':
+            total = int(cumulative_us)
+    return total, own, set(json.loads(proc.stdout))
+
+
+def top_packages(own, n):
+    """Paquets de premier niveau les plus coûteux (somme des durées propres)"""
+    packages = {}
+    for name, us in own.items():
+        top = name.split('.')[0]
+        packages[top] = packages.get(top, 0) + us
+    return sorted(packages.items(), key=lambda item: -item[1])[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('functions', nargs='*', help="fonctions à mesurer (toutes celles du budget par défaut)")
+    parser.add_argument('--runs', type=int, default=5, help="essais par fonction, le meilleur est retenu")
+    parser.add_argument('--top', type=int, default=8, help="paquets les plus coûteux affichés")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE, encoding='utf-8') as fp:
+        budgets = json.load(fp)
+
+    failed = False
+    for function in args.functions or sorted(budgets):
+        budget = budgets[function]
+        runs = [import_profile(function) for _ in range(args.runs)]
+        total, own, modules = min(runs, key=lambda run: run[0])
+        loaded = sorted(m for m in budget.get('deferred', []) if m in modules)
+        over = total / 1000 > budget['max_import_ms']
+        failed = failed or over or bool(loaded)
+        print(f"{function:<20} import {total / 1000:>7.1f} ms   budget {budget['max_import_ms']:>5} ms"
+              f"   {'DÉPASSÉ' if over else 'ok'}")
+        for package, us in top_packages(own, args.top):
+            print(f"    {package:<28} {us / 1000:>7.1f} ms")
+        if loaded:
+            print(f"    modules différés chargés à l'import : {', '.join(loaded)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark du point d'entrée python3-http : index.py (Flask) contre wsgi.py
+(shim WSGI minimal), tous deux servis par waitress.
+
+Le handler est celui du template (template/python3-http/function/handler.py),
+pour ne mesurer que le coût du point d'entrée. Deux modes :
+- http (défaut) : serveurs waitress locaux, clients HTTP keep-alive en threads ;
+- inproc : appel direct de l'application WSGI, sans réseau ni serveur.
+
+Aucune base de données nécessaire.
+
+    python benchmarks/bench_http_shim.py --requests 20000 --clients 8
+    python benchmarks/bench_http_shim.py --mode inproc
+"""
+
+import argparse
+import http.client
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'template', 'python3-http')
+sys.path.insert(0, TEMPLATE)
+
+from waitress import create_server  # noqa: E402
+
+import index  # noqa: E402
+import wsgi  # noqa: E402
+
+BODY = b'{"username": "bench", "password": "bench-password"}'
+HEADERS = {'Content-Type': 'application/json', 'X-Call-Id': 'bench'}
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(name, latencies, elapsed):
+    print(f"{name:<8} {len(latencies) / elapsed:>9.0f} req/s   "
+          f"p50 {percentile(latencies, 0.50) * 1e6:>8.1f} µs   "
+          f"p99 {percentile(latencies, 0.99) * 1e6:>8.1f} µs")
+
+
+def environ():
+    return {
+        'REQUEST_METHOD': 'POST', 'PATH_INFO': '/', 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '5000', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(BODY)),
+        'HTTP_X_CALL_ID': 'bench', 'wsgi.input': io.BytesIO(BODY), 'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+
+
+def bench_inproc(name, app, n):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        b''.join(app(environ(), start_response))
+        latencies.append(time.perf_counter() - t)
+    report(name, latencies, time.perf_counter() - started)
+
+
+def bench_http(name, app, n, clients, threads):
+    server = create_server(app, host='127.0.0.1', port=0, threads=threads)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    port = server.effective_port
+    latencies = []
+
+    def client(count):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        for _ in range(count):
+            t = time.perf_counter()
+            conn.request('POST', '/', BODY, HEADERS)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - t)
+            assert response.status == 200, response.status
+        conn.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, [n // clients] * clients))
+    report(name, latencies, time.perf_counter() - started)
+    server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('http', 'inproc'), default='http')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=8, help="clients HTTP simultanés (mode http)")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WAITRESS_THREADS', '4')),
+                        help="threads waitress (mode http)")
+    args = parser.parse_args()
+
+    for name, app in (('flask', index.app), ('wsgi', wsgi.app)):
+        if args.mode == 'inproc':
+            bench_inproc(name, app, args.requests)
+        else:
+            bench_http(name, app, args.requests, args.clients, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Coût d'un échantillon de phase (authenticate-user/metrics.py) pendant une
+requête, traçage désactivé :
+
+- since : `started = metrics.clock()` ... `metrics.since(name, started)`,
+  deux lectures d'horloge et un ajout à une liste ;
+- phase : `with metrics.phase(name):`, un objet de contexte par phase ;
+- record : durée déjà mesurée, ajout seul ;
+- clock : deux lectures d'horloge seules (plancher de la mesure).
+
+Chaque requête simulée enregistre --phases phases, comme un handler. Le
+meilleur de --repeat essais est retenu, boucle de mesure à vide déduite.
+Code de sortie 1 si `since` dépasse --budget-ns (500 ns par défaut : bien
+moins d'une microseconde).
+
+    python benchmarks/bench_metrics_phase.py
+    python benchmarks/bench_metrics_phase.py --iterations 200000 --budget-ns 400
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'authenticate-user'))
+
+import metrics  # noqa: E402
+import tracing  # noqa: E402
+
+
+def per_sample_ns(statement, iterations, phases, repeat):
+    """Durée d'un échantillon (ns), requêtes de `phases` échantillons chacune"""
+    code = ("timings = metrics.start()\n"
+            f"for _ in range({phases}):\n"
+            + ''.join(f"    {line}\n" for line in statement.splitlines()))
+    requests = max(1, iterations // phases)
+    best = min(timeit.repeat(code, number=requests, repeat=repeat, globals={'metrics': metrics}))
+    return best / (requests * phases) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000, help="échantillons par essai")
+    parser.add_argument('--phases', type=int, default=10, help="phases par requête simulée")
+    parser.add_argument('--repeat', type=int, default=5, help="essais, le meilleur est retenu")
+    parser.add_argument('--budget-ns', type=float, default=500.0, help="budget d'un échantillon `since`")
+    args = parser.parse_args()
+
+    tracing.configure(exporter=None)
+    assert not tracing.ENABLED, "TRACE_EXPORTER must be unset (untraced path)"
+
+    cases = {
+        'empty': "pass",
+        'clock': "started = metrics.clock(); metrics.clock()",
+        'record': "metrics.record('select', 0.001)",
+        'since': "started = metrics.clock(); metrics.since('select', started)",
+        'phase': "with metrics.phase('select'): pass",
+    }
+    results = {name: per_sample_ns(statement.replace('; ', '\n'), args.iterations, args.phases, args.repeat)
+               for name, statement in cases.items()}
+    loop = results.pop('empty')
+    results = {name: ns - loop for name, ns in results.items()}
+    for name, ns in results.items():
+        print(f"{name:<8} {ns:>8.0f} ns/échantillon")
+
+    over = results['since'] > args.budget_ns
+    print(f"since : budget {args.budget_ns:.0f} ns   {'DÉPASSÉ' if over else 'ok'}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark des formats de QR code (generate-2fa/qr.py) : durée de rendu et
+taille de la valeur JSON renvoyée, pour une URI TOTP typique.
+
+- pil : ancien rendu (qrcode + PIL, box_size=10, PNG en base64), si Pillow
+  est installé ;
+- png, svg, matrix : formats de qr.py, matrice comprise ;
+- modules : calcul de la matrice seul, commun à tous les formats.
+
+    python benchmarks/bench_qr_formats.py --iterations 500
+    python benchmarks/bench_qr_formats.py --box-size 4 --compress 9
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'generate-2fa'))
+
+import qr  # noqa: E402
+
+URI = "otpauth://totp/COFRAP:alice.martin%40example.org?secret=JBSWY3DPEHPK3PXPJBSWY3DPEHPK3PXP&issuer=COFRAP"
+
+
+def render_pil(data):
+    import qrcode
+    buffer = io.BytesIO()
+    qrcode.make(data, box_size=10, border=4).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def bench(name, fn, iterations):
+    value = fn()  # premier appel hors mesure (imports)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - started) / iterations
+    size = f"{len(json.dumps(value)):>7} octets JSON" if value is not None else ''
+    print(f"{name:<8} {per_call * 1e6:>9.0f} µs/rendu   {size}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--box-size', type=int, default=qr.PNG_BOX_SIZE, help="pixels par module (png)")
+    parser.add_argument('--compress', type=int, default=qr.PNG_COMPRESS, help="niveau zlib (png)")
+    args = parser.parse_args()
+
+    matrix = qr.modules(URI)
+    bench('modules', lambda: qr.modules(URI) and None, args.iterations)
+    try:
+        import PIL  # noqa: F401
+        bench('pil', lambda: render_pil(URI), args.iterations)
+    except ImportError:
+        print("pil      (Pillow absent, ignoré)")
+    bench('png', lambda: base64.b64encode(qr.encode_png(qr.modules(URI), args.box_size,
+                                                         compress_level=args.compress)).decode(),
+          args.iterations)
+    bench('svg', lambda: qr.render_svg(qr.modules(URI)), args.iterations)
+    bench('matrix', lambda: qr.render_matrix(qr.modules(URI)), args.iterations)
+    print(f"matrice {len(matrix)}x{len(matrix)} modules")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark du schéma de la table users avant et après la migration
+0002_users_login_indexes, sur une table synthétique.
+
+Deux schémas jetables sont créés dans la base courante : `bench_before`
+(migration 0001, index d'origine) et `bench_after` (0001 + 0002), remplis des
+mêmes --rows comptes puis analysés (VACUUM ANALYZE). Pour chacun :
+- lookups de login (requête auth_lookup préparée) : débit, plan et
+  `Heap Fetches` (0 = parcours index-only complet) ;
+- mises à jour d'activité (requête de vidage d'activity.py, par lots) : débit
+  et part de mises à jour HOT ;
+- taille de la table et de ses index.
+
+Nécessite une base PostgreSQL 11+ (DB_HOST, DB_NAME, DB_USER, DB_PASSWORD,
+DB_PORT) ; les schémas sont supprimés à la fin (sauf --keep).
+
+    python benchmarks/bench_users_schema.py --rows 1000000 --lookups 20000
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'authenticate-user'))
+
+import migrate  # noqa: E402
+from activity import FLUSH_QUERY  # noqa: E402
+from psycopg2.extras import execute_values  # noqa: E402
+
+AUTH_LOOKUP = "SELECT id, username, password, mfa, gendate, expired FROM users WHERE username = $1"
+
+POPULATE = """
+    INSERT INTO users (username, password, mfa, gendate, expired)
+    SELECT 'bench_user_' || g,
+           '$scrypt$v=1$n=16384,r=8,p=1$' || md5(g::text) || md5((g * 7)::text),
+           CASE WHEN g %% 3 = 0 THEN 'k1:' || encode(sha256(g::text::bytea), 'base64') END,
+           NOW() - (g %% 365) * INTERVAL '1 day',
+           g %% 20 = 0
+    FROM generate_series(1, %s) AS g
+"""
+
+SIZES = """
+    SELECT pg_relation_size('users'),
+           (SELECT string_agg(indexrelid::regclass::text || '=' || pg_relation_size(indexrelid), ' '
+                              ORDER BY indexrelid::regclass::text)
+            FROM pg_index WHERE indrelid = 'users'::regclass)
+"""
+
+UPDATE_STATS = "SELECT n_tup_upd, n_tup_hot_upd FROM pg_stat_xact_user_tables WHERE relid = 'users'::regclass"
+
+
+def setup(conn, schema, migrations, rows):
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+    conn.autocommit = False
+    migrate.migrate(conn, migrations, out=io.StringIO())
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(POPULATE, (rows,))
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE users")
+    conn.autocommit = False
+    return time.perf_counter() - started
+
+
+def bench_lookups(conn, rows, lookups):
+    names = [f"bench_user_{random.randint(1, rows)}" for _ in range(lookups)]
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"PREPARE bench_lookup AS {AUTH_LOOKUP}")
+        started = time.perf_counter()
+        for name in names:
+            cur.execute("EXECUTE bench_lookup (%s)", (name,))
+            cur.fetchone()
+        elapsed = time.perf_counter() - started
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) EXECUTE bench_lookup (%s)", (names[0],))
+        plan = [row[0] for row in cur.fetchall()]
+        cur.execute("DEALLOCATE bench_lookup")
+    conn.autocommit = False
+    node = plan[0].split('  (')[0].strip()
+    heap_fetches = next((line.split(':')[1].strip() for line in plan if 'Heap Fetches' in line), '-')
+    return lookups / elapsed, node, heap_fetches
+
+
+def bench_activity(conn, rows, updates, batch):
+    """Vidages d'activité par lots ; (lignes/s, part HOT)"""
+    now = datetime.now()
+    ids = random.sample(range(1, rows + 1), min(updates, rows))
+    total = hot = 0
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        for i in range(0, len(ids), batch):
+            values = [(user_id, now + timedelta(microseconds=i)) for user_id in sorted(ids[i:i + batch])]
+            execute_values(cur, FLUSH_QUERY, values, template="(%s, %s::timestamp)", page_size=len(values))
+            cur.execute(UPDATE_STATS)
+            upd, hot_upd = cur.fetchone() or (0, 0)
+            conn.commit()
+            total += upd
+            hot += hot_upd
+    elapsed = time.perf_counter() - started
+    return len(ids) / elapsed, (hot / total if total else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help="comptes synthétiques")
+    parser.add_argument('--lookups', type=int, default=10000, help="logins mesurés")
+    parser.add_argument('--updates', type=int, default=50000, help="mises à jour d'activité mesurées")
+    parser.add_argument('--batch', type=int, default=500, help="lignes par vidage d'activité")
+    parser.add_argument('--keep', action='store_true', help="conserve les schémas bench_before / bench_after")
+    args = parser.parse_args()
+
+    migrations = migrate.load_migrations()
+    baseline = [m for m in migrations if m.version == 1]
+    conn = migrate.connect()
+    try:
+        for schema, applied in (('bench_before', baseline), ('bench_after', migrations)):
+            load_seconds = setup(conn, schema, applied, args.rows)
+            lookups_per_s, node, heap_fetches = bench_lookups(conn, args.rows, args.lookups)
+            updates_per_s, hot_ratio = bench_activity(conn, args.rows, args.updates, args.batch)
+            with conn.cursor() as cur:
+                cur.execute(SIZES)
+                table_size, index_sizes = cur.fetchone()
+            conn.commit()
+            print(f"{schema}  (chargement {load_seconds:.1f} s, table {table_size / 2**20:.1f} Mo)")
+            print(f"    login       {lookups_per_s:>9.0f} lookups/s   {node}, heap fetches {heap_fetches}")
+            print(f"    activité    {updates_per_s:>9.0f} lignes/s    HOT {hot_ratio:.0%}")
+            for entry in index_sizes.split():
+                name, size = entry.rsplit('=', 1)
+                print(f"    {name:<32} {int(size) / 2**20:>7.1f} Mo")
+    finally:
+        if not args.keep:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("DROP SCHEMA IF EXISTS bench_before CASCADE")
+                cur.execute("DROP SCHEMA IF EXISTS bench_after CASCADE")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 -- Script d'initialisation de la base de données MSPR
 -- Création de la base de données et de la table users
+-- Schéma de départ (migration 0001) : appliquer ensuite les migrations
+-- versionnées avec `python database/migrate.py` (database/migrations/)
 
 -- Création de la base de données (exécuter séparément)
 -- CREATE DATABASE mspr_db;
@@ -22,6 +24,27 @@ CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_gendate ON users(gendate);
 CREATE INDEX IF NOT EXISTS idx_users_expired ON users(expired);
 
+-- Points de reprise des traitements par lots (fonction expire-accounts)
+CREATE TABLE IF NOT EXISTS sweeper_checkpoints (
+    name VARCHAR(64) PRIMARY KEY,
+    last_gendate TIMESTAMP,
+    last_id INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Clés d'idempotence (en-tête Idempotency-Key, fonction generate-password)
+-- Réponse d'origine conservée IDEMPOTENCY_TTL secondes, puis supprimée par la fonction
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(64) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    fingerprint VARCHAR(255) NOT NULL,  -- requête d'origine (nom d'utilisateur)
+    status INTEGER,
+    response BYTEA,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
+
 -- Exemples de données de test (optionnel)
 -- INSERT INTO users (username, password, mfa, gendate, expired) VALUES 
 -- ('test_user', 'hashed_password_here', null, NOW(), false);
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Migrations versionnées du schéma (database/migrations/NNNN_nom.sql), appliquées
+dans l'ordre et une seule fois, en avant uniquement : pas de retour arrière,
+une correction est une nouvelle migration.
+
+- La table `schema_migrations` garde la version, le nom et la somme SHA-256 de
+  chaque fichier appliqué ; un fichier modifié ou supprimé après application
+  arrête le runner.
+- Une migration s'exécute dans une transaction avec son enregistrement, sauf
+  si sa première ligne est `-- migrate: no-transaction` (CREATE INDEX
+  CONCURRENTLY) : ses instructions sont alors exécutées une à une en
+  autocommit et doivent être rejouables ; un index laissé INVALID par un
+  échec arrête le runner avant l'enregistrement.
+- Un verrou consultatif empêche deux runners simultanés.
+
+Connexion : variables DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD ;
+DB_DIRECT_HOST / DB_DIRECT_PORT, si elles sont définies, contournent un pooler
+en mode transaction (le verrou consultatif est un état de session).
+
+    python database/migrate.py            # applique les migrations en attente
+    python database/migrate.py --status   # liste appliquées / en attente
+    python database/migrate.py --dry-run  # affiche ce qui serait appliqué
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+NO_TRANSACTION = '-- migrate: no-transaction'
+LOCK_ID = 0x6d737072  # "mspr"
+
+_FILENAME = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+RECORD = "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)"
+INVALID_INDEXES = """
+    SELECT indexrelid::regclass::text FROM pg_index
+    WHERE NOT indisvalid AND indrelid IN (SELECT oid FROM pg_class WHERE relnamespace = current_schema()::regnamespace)
+"""
+
+
+class MigrationError(Exception):
+    """Historique incohérent avec les fichiers, ou fichier invalide"""
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'path', 'sql', 'checksum')
+
+    def __init__(self, version, name, path, sql):
+        self.version = version
+        self.name = name
+        self.path = path
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+    @property
+    def transactional(self):
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self):
+        """Instructions d'une migration hors transaction (séparées par ';' en fin de ligne)"""
+        lines = [line for line in self.sql.splitlines() if not line.strip().startswith('--')]
+        return [stmt.strip() for stmt in re.split(r';\s*$', '\n'.join(lines), flags=re.M) if stmt.strip()]
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Migrations du répertoire, triées par version"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.sql'):
+            continue
+        match = _FILENAME.match(filename)
+        if match is None:
+            raise MigrationError(f"Invalid migration file name {filename!r} (expected NNNN_name.sql)")
+        path = os.path.join(directory, filename)
+        with open(path, 'r', encoding='utf-8') as fp:
+            migrations.append(Migration(int(match.group(1)), match.group(2), path, fp.read()))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Duplicate migration versions")
+    return migrations
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version, name, checksum FROM schema_migrations ORDER BY version")
+    return {version: (name, checksum) for version, name, checksum in cursor.fetchall()}
+
+
+def pending(migrations, applied):
+    """Migrations à appliquer ; lève MigrationError si l'historique a divergé"""
+    by_version = {m.version: m for m in migrations}
+    for version, (name, checksum) in applied.items():
+        migration = by_version.get(version)
+        if migration is None:
+            raise MigrationError(f"Applied migration {version:04d}_{name} is missing from {MIGRATIONS_DIR}")
+        if migration.checksum != checksum:
+            raise MigrationError(f"Migration {version:04d}_{name} was modified after being applied")
+    todo = [m for m in migrations if m.version not in applied]
+    if todo and applied and todo[0].version < max(applied):
+        raise MigrationError(f"Migration {todo[0].version:04d}_{todo[0].name} is older than the last applied one")
+    return todo
+
+
+def apply(conn, migration):
+    """Applique une migration et l'enregistre"""
+    if migration.transactional:
+        with conn.cursor() as cursor:
+            cursor.execute(migration.sql)
+            cursor.execute(RECORD, (migration.version, migration.name, migration.checksum))
+        conn.commit()
+        return
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in migration.statements():
+                cursor.execute(statement)
+            cursor.execute(INVALID_INDEXES)
+            invalid = [row[0] for row in cursor.fetchall()]
+            if invalid:
+                raise MigrationError(f"Invalid indexes after {migration.version:04d}_{migration.name}: "
+                                     f"{', '.join(invalid)} (drop them and run again)")
+            cursor.execute(RECORD, (migration.version, migration.name, migration.checksum))
+    finally:
+        conn.autocommit = False
+
+
+def migrate(conn, migrations, dry_run=False, out=sys.stdout):
+    """Applique les migrations en attente ; renvoie leur nombre"""
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        conn.commit()
+        conn.autocommit = True  # verrou de session, gardé entre les transactions des migrations
+        cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+        conn.autocommit = False
+    try:
+        with conn.cursor() as cursor:
+            todo = pending(migrations, applied_versions(cursor))
+        conn.commit()
+        for migration in todo:
+            label = f"{migration.version:04d}_{migration.name}"
+            if dry_run:
+                print(f"pending  {label}", file=out)
+                continue
+            started = time.perf_counter()
+            apply(conn, migration)
+            print(f"applied  {label}  ({time.perf_counter() - started:.2f} s)", file=out)
+        return len(todo)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+        conn.autocommit = False
+
+
+def status(conn, migrations, out=sys.stdout):
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        applied = applied_versions(cursor)
+    conn.commit()
+    for migration in migrations:
+        state = 'applied' if migration.version in applied else 'pending'
+        print(f"{state:<8} {migration.version:04d}_{migration.name}", file=out)
+
+
+def connect():
+    import psycopg2
+    return psycopg2.connect(
+        host=os.getenv('DB_DIRECT_HOST') or os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'mspr_db'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', 'password'),
+        port=os.getenv('DB_DIRECT_PORT') or os.getenv('DB_PORT', '5432'),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help="liste les migrations appliquées et en attente")
+    parser.add_argument('--dry-run', action='store_true', help="affiche les migrations en attente sans les appliquer")
+    args = parser.parse_args()
+
+    migrations = load_migrations()
+    conn = connect()
+    try:
+        if args.status:
+            status(conn, migrations)
+        else:
+            count = migrate(conn, migrations, dry_run=args.dry_run)
+            if not count:
+                print("schema up to date")
+    except MigrationError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+-- Schéma initial (équivalent de database/init.sql avant les migrations versionnées).
+-- Idempotent : une base créée par init.sql l'adopte sans modification.
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    mfa VARCHAR(255),
+    gendate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expired BOOLEAN DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_gendate ON users(gendate);
+CREATE INDEX IF NOT EXISTS idx_users_expired ON users(expired);
+
+CREATE TABLE IF NOT EXISTS sweeper_checkpoints (
+    name VARCHAR(64) PRIMARY KEY,
+    last_gendate TIMESTAMP,
+    last_id INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(64) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    fingerprint VARCHAR(255) NOT NULL,
+    status INTEGER,
+    response BYTEA,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
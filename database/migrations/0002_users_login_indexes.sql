@@ -0,0 +1,33 @@
+-- migrate: no-transaction
+-- Index de la table users ajustés aux requêtes réelles. Hors transaction
+-- (CREATE/DROP INDEX CONCURRENTLY : pas de verrou bloquant les logins) ;
+-- chaque instruction est rejouable si la migration est interrompue (un index
+-- resté INVALID après un échec est signalé par le runner : le supprimer avant
+-- de relancer).
+
+-- Login (auth_lookup, auth_lookup_batch) : toutes les colonnes lues sont dans
+-- l'index, parcours index-only sur les pages marquées visibles. L'index unique
+-- remplace celui de la contrainte UNIQUE (username) et reste l'arbitre des
+-- INSERT ... ON CONFLICT (username) de generate-password.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_username_auth_key
+    ON users (username) INCLUDE (id, password, mfa, gendate, expired) WITH (fillfactor = 90);
+ALTER TABLE users DROP CONSTRAINT IF EXISTS users_username_key;
+
+-- Doublon exact de l'index de la contrainte UNIQUE
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_username;
+
+-- Balayage d'expire-accounts : seuls les comptes non expirés, dans l'ordre
+-- (gendate, id) du parcours par clé ; remplace l'index complet sur gendate et
+-- l'index booléen sur expired (sélectivité trop faible pour servir seul)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_active_gendate_idx
+    ON users (gendate, id) WHERE NOT expired;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_gendate;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_expired;
+
+-- Place libre dans chaque page : la nouvelle version d'une ligne mise à jour
+-- reste dans la même page. Une mise à jour qui ne touche aucune colonne
+-- indexée (ni clé ni INCLUDE) est HOT ; celles d'activité modifient gendate,
+-- lue par le login et le balayage, et ajoutent donc une entrée d'index, mais
+-- sans étendre la table. Vaut pour les pages écrites ensuite (VACUUM FULL ou
+-- pg_repack pour réécrire la table existante).
+ALTER TABLE users SET (fillfactor = 85);
@@ -0,0 +1,32 @@
+-- Notification `users_created` pour toute ligne ajoutée à users, quel que soit
+-- son chemin (generate-password, SQL d'administration, données de démo,
+-- restauration) : le filtre d'utilisateurs d'authenticate-user ne voit que ces
+-- notifications entre deux reconstructions. Livrée au commit ; une
+-- notification identique déjà envoyée par generate-password dans la même
+-- transaction n'est délivrée qu'une fois.
+
+CREATE OR REPLACE FUNCTION users_notify_created() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        -- Insertion en lot : une seule exécution pour l'instruction
+        PERFORM pg_notify('users_created', username) FROM created;
+    ELSE
+        PERFORM pg_notify('users_created', NEW.username);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_created_notify ON users;
+CREATE TRIGGER users_created_notify
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS created
+    FOR EACH STATEMENT EXECUTE FUNCTION users_notify_created();
+
+-- Renommage : le nouveau nom doit aussi passer le filtre
+DROP TRIGGER IF EXISTS users_renamed_notify ON users;
+CREATE TRIGGER users_renamed_notify
+    AFTER UPDATE OF username ON users
+    FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username)
+    EXECUTE FUNCTION users_notify_created();
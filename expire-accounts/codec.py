@@ -0,0 +1,127 @@
+"""
+Codec JSON des fonctions : requêtes typées, réponses encodées en bytes.
+
+- Décodage direct des octets du corps (`event.body`, sans passage par str) ;
+- requêtes décrites par des structures à slots (`struct(...)`) validées champ
+  par champ : un type inattendu donne une réponse 400, pas une erreur 500 ;
+- encodage par orjson s'il est installé, sinon par un encodeur json compact
+  unique ; les handlers renvoient `body` en bytes, repris tel quel par
+  index.py et asgi.py ;
+- réponses d'erreur constantes encodées une seule fois, à l'import.
+"""
+
+import json
+
+try:
+    import orjson  # dépendance optionnelle : encodage/décodage natif
+except ImportError:
+    orjson = None
+
+DecodeError = json.JSONDecodeError
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class ValidationError(ValueError):
+    """Champ de requête absent ou de type invalide"""
+
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+    def loads(data):
+        # orjson.JSONDecodeError hérite de json.JSONDecodeError
+        return orjson.loads(data or b'{}')
+else:
+    def dumps(obj):
+        return _ENCODER.encode(obj).encode('utf-8')
+
+    def loads(data):
+        if not data:
+            return {}
+        try:
+            return json.loads(data)
+        except UnicodeDecodeError as e:
+            raise DecodeError(f"Invalid UTF-8: {e.reason}", '', e.start) from None
+
+
+def response(status, payload, headers=None):
+    """Réponse de handler avec un corps JSON déjà encodé"""
+    resp = {"statusCode": status, "body": dumps(payload)}
+    if headers:
+        resp["headers"] = headers
+    return resp
+
+
+def error(status, text, /, **extra):
+    """Réponse d'erreur au format commun {"error", "success": false, ...}"""
+    return response(status, dict({"error": text, "success": False}, **extra))
+
+
+INVALID_JSON = error(400, "Invalid JSON in request body")
+
+
+class Struct:
+    """Base des requêtes typées : champs en slots, validés par from_dict()"""
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *values):
+        for (name, _, _), value in zip(self.FIELDS, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValidationError("request body must be a JSON object")
+        values = []
+        for name, kind, default in cls.FIELDS:
+            value = data.get(name)
+            if value is None:
+                values.append(default)
+            elif kind is str:
+                if not isinstance(value, str):
+                    raise ValidationError(f"{name} must be a string")
+                values.append(value.strip())
+            elif kind is bool:
+                if not isinstance(value, bool):
+                    raise ValidationError(f"{name} must be a boolean")
+                values.append(value)
+            elif kind is int:
+                # Entiers JSON ou chaînes numériques, comme le faisait int(...)
+                if isinstance(value, bool) or not isinstance(value, (int, str)):
+                    raise ValidationError(f"{name} must be an integer")
+                try:
+                    values.append(int(value))
+                except ValueError:
+                    raise ValidationError(f"{name} must be an integer") from None
+            else:
+                if not isinstance(value, kind):
+                    raise ValidationError(f"{name} has an invalid type")
+                values.append(value)
+        return cls(*values)
+
+    @classmethod
+    def from_json(cls, data):
+        """Structure décodée et validée à partir des octets du corps"""
+        return cls.from_dict(loads(data))
+
+    def __iter__(self):
+        return (getattr(self, name) for name, _, _ in self.FIELDS)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name, _, _ in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+def struct(name, *fields):
+    """
+    Déclare une requête typée : struct('Credentials', ('username', str, ''), ...).
+    Chaque champ est (nom, type, valeur par défaut) ; types : str, int, bool, list...
+    """
+    return type(name, (Struct,), {'__slots__': tuple(f[0] for f in fields), 'FIELDS': tuple(fields)})
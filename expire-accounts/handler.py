@@ -0,0 +1,180 @@
+import logging
+import os
+import psycopg2
+from datetime import datetime, timedelta
+
+from db import get_db_connection
+import codec
+import jsonlog
+import metrics
+
+log = logging.getLogger('expire-accounts')
+
+CHECKPOINT_NAME = 'expire-accounts'
+
+# Paramètres optionnels du corps ; absents, ils viennent de l'environnement
+SweepRequest = codec.struct('SweepRequest', ('inactive_days', int, None), ('batch_size', int, None),
+                            ('max_batches', int, None), ('reset', bool, False))
+
+NOT_POSITIVE = codec.error(400, "inactive_days, batch_size and max_batches must be positive")
+NOT_INTEGERS = codec.error(400, "inactive_days, batch_size and max_batches must be integers")
+
+# Lot suivant dans l'ordre (gendate, id) : parcours de idx_users_gendate par clé
+# (keyset), chaque lot repart du dernier couple traité. Les lignes du lot sont
+# verrouillées (une ligne déjà verrouillée, login en cours, est sautée jusqu'à
+# la passe suivante) et le prédicat est revérifié à l'UPDATE : un login validé
+# entre la sélection et la mise à jour rafraîchit gendate et ne doit pas
+# expirer le compte. Chaque ligne du lot est renvoyée, expirée ou non, pour que
+# le point de reprise avance.
+EXPIRE_BATCH = """
+    WITH batch AS (
+        SELECT id, gendate
+        FROM users
+        WHERE gendate < %(cutoff)s
+          AND (gendate, id) > (%(after_gendate)s, %(after_id)s)
+          AND NOT expired
+        ORDER BY gendate, id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    ), expired AS (
+        UPDATE users u
+        SET expired = TRUE
+        FROM batch
+        WHERE u.id = batch.id
+          AND u.gendate < %(cutoff)s
+          AND NOT u.expired
+        RETURNING u.id
+    )
+    SELECT batch.gendate, batch.id, expired.id IS NOT NULL
+    FROM batch LEFT JOIN expired ON expired.id = batch.id
+"""
+
+# Comptes sans date d'activité : expirés par is_account_expired() côté login
+EXPIRE_NULL_BATCH = """
+    UPDATE users
+    SET expired = TRUE
+    WHERE id IN (
+        SELECT id FROM users
+        WHERE gendate IS NULL AND NOT expired
+        LIMIT %(batch_size)s
+    )
+      AND gendate IS NULL AND NOT expired
+"""
+
+def get_cutoff(inactive_days):
+    """Date limite d'activité : en deçà, le compte est expiré"""
+    return datetime.now() - timedelta(days=inactive_days)
+
+def load_checkpoint(cursor):
+    """Dernier couple (gendate, id) traité, ou le début de l'index"""
+    cursor.execute("SELECT last_gendate, last_id FROM sweeper_checkpoints WHERE name = %s",
+                   (CHECKPOINT_NAME,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return datetime.min, 0
+    return row[0], row[1]
+
+def save_checkpoint(cursor, last_gendate, last_id):
+    cursor.execute("""
+        INSERT INTO sweeper_checkpoints (name, last_gendate, last_id, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (name) DO UPDATE
+        SET last_gendate = EXCLUDED.last_gendate, last_id = EXCLUDED.last_id, updated_at = NOW()
+    """, (CHECKPOINT_NAME, last_gendate, last_id))
+
+def sweep(conn, cutoff, batch_size=1000, max_batches=100, reset=False):
+    """
+    Marque les comptes inactifs par lots, un commit par lot.
+
+    Le point de reprise est enregistré dans la même transaction que le lot :
+    une exécution interrompue reprend exactement où elle s'était arrêtée. Une
+    ligne verrouillée au passage du lot (SKIP LOCKED) reste derrière le point
+    de reprise sans avoir été traitée : arrivé au bout de l'index, le point
+    revient au début, et la passe suivante la revoit.
+    """
+    cursor = conn.cursor()
+    if reset:
+        save_checkpoint(cursor, datetime.min, 0)
+        conn.commit()
+
+    expired = batches = 0
+    done = False
+
+    # Comptes sans gendate (rares) : hors index, traités à part
+    while batches < max_batches:
+        cursor.execute(EXPIRE_NULL_BATCH, {'batch_size': batch_size})
+        conn.commit()
+        batches += 1
+        expired += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+
+    after_gendate, after_id = load_checkpoint(cursor)
+    while batches < max_batches:
+        with metrics.phase('batch'):
+            cursor.execute(EXPIRE_BATCH, {
+                'cutoff': cutoff,
+                'after_gendate': after_gendate,
+                'after_id': after_id,
+                'batch_size': batch_size,
+            })
+            rows = cursor.fetchall()
+            done = len(rows) < batch_size
+            if done:
+                # Fin de passe : la suivante repart du début de l'index
+                after_gendate, after_id = datetime.min, 0
+            else:
+                after_gendate, after_id, _ = max(rows)
+            save_checkpoint(cursor, after_gendate, after_id)
+            conn.commit()
+        batches += 1
+        expired += sum(1 for _, _, updated in rows if updated)
+        if done:
+            break
+
+    cursor.close()
+    return {
+        "expired": expired,
+        "batches": batches,
+        "done": done,
+        "cutoff": cutoff.isoformat(),
+        "checkpoint": {"gendate": after_gendate.isoformat(), "id": after_id},
+    }
+
+def handle(event, context):
+    conn = None
+    try:
+        request = SweepRequest.from_json(getattr(event, 'body', None))
+
+        inactive_days, batch_size, max_batches, reset = request
+        if inactive_days is None:
+            inactive_days = int(os.getenv('SWEEP_INACTIVE_DAYS', '180'))
+        if batch_size is None:
+            batch_size = int(os.getenv('SWEEP_BATCH_SIZE', '1000'))
+        if max_batches is None:
+            max_batches = int(os.getenv('SWEEP_MAX_BATCHES', '100'))
+        if inactive_days <= 0 or batch_size <= 0 or max_batches <= 0:
+            return NOT_POSITIVE
+
+        conn = get_db_connection()
+        report = sweep(conn, get_cutoff(inactive_days), batch_size, max_batches, reset=reset)
+
+        jsonlog.event(log, 'accounts.swept', expired=report['expired'], batches=report['batches'],
+                      done=report['done'])
+        return codec.response(200, dict(report, success=True))
+
+    except psycopg2.Error as e:
+        jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(e))
+        return codec.error(500, f"Database error: {e}")
+    except codec.DecodeError:
+        return codec.INVALID_JSON
+    except codec.ValidationError as e:
+        return codec.error(400, str(e))
+    except ValueError:
+        return NOT_INTEGERS
+    except Exception as e:
+        log.error('internal error', exc_info=e)
+        return codec.error(500, f"Internal server error: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
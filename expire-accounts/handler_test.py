@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+from datetime import datetime
+from handler import handle, sweep
+
+
+class FakeCursor:
+    """Curseur simulé : checkpoint en mémoire, lots servis dans l'ordre"""
+
+    def __init__(self, batches, checkpoint=None, null_rows=0):
+        self.batches = list(batches)
+        self.checkpoint = checkpoint
+        self.null_rows = null_rows
+        self.rowcount = 0
+        self.executed = []
+        self._result = None
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if "gendate IS NULL" in sql:
+            self.rowcount = self.null_rows
+        elif "FROM sweeper_checkpoints" in sql:
+            self._result = [self.checkpoint] if self.checkpoint else []
+        elif "INSERT INTO sweeper_checkpoints" in sql:
+            self.checkpoint = (params[1], params[2])
+        elif "WITH batch" in sql:
+            self.last_params = params
+            self._result = self.batches.pop(0) if self.batches else []
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class TestExpireAccounts(unittest.TestCase):
+
+    def make_conn(self, cursor):
+        conn = MagicMock()
+        conn.cursor.return_value = cursor
+        return conn
+
+    def test_sweep_commits_each_batch_and_checkpoints(self):
+        """Un commit par lot, point de reprise = dernier (gendate, id)"""
+        d1, d2 = datetime(2023, 1, 1), datetime(2023, 2, 1)
+        cursor = FakeCursor([[(d1, 3, True), (d1, 8, True)], [(d2, 5, True)]])
+        conn = self.make_conn(cursor)
+
+        report = sweep(conn, datetime(2024, 1, 1), batch_size=2)
+
+        self.assertEqual(report["expired"], 3)
+        self.assertTrue(report["done"])
+        self.assertEqual(cursor.checkpoint, (datetime.min, 0))  # passe finie : retour au début
+        self.assertEqual(conn.commit.call_count, 3)  # lot NULL + 2 lots
+
+    def test_sweep_next_pass_revisits_locked_rows(self):
+        """Ligne verrouillée (sautée) derrière le point de reprise : revue à la passe suivante"""
+        d1, d2 = datetime(2023, 1, 1), datetime(2023, 2, 1)
+        # id 2 verrouillé pendant le premier lot : absent du résultat
+        cursor = FakeCursor([[(d1, 1, True), (d1, 3, True)], [(d2, 5, True)]])
+        sweep(self.make_conn(cursor), datetime(2024, 1, 1), batch_size=2, max_batches=2)
+        self.assertEqual(cursor.checkpoint, (d1, 3))
+
+        cursor.batches = [[(d2, 5, True)]]
+        report = sweep(self.make_conn(cursor), datetime(2024, 1, 1), batch_size=2)
+        self.assertTrue(report["done"])
+        self.assertEqual(cursor.checkpoint, (datetime.min, 0))
+
+        cursor.batches = [[(d1, 2, True)]]
+        report = sweep(self.make_conn(cursor), datetime(2024, 1, 1), batch_size=2)
+        self.assertEqual((cursor.last_params['after_gendate'], cursor.last_params['after_id']), (datetime.min, 0))
+        self.assertEqual(report["expired"], 1)
+
+    def test_sweep_resumes_from_checkpoint(self):
+        checkpoint = (datetime(2023, 3, 1), 42)
+        cursor = FakeCursor([[]], checkpoint=checkpoint)
+
+        sweep(self.make_conn(cursor), datetime(2024, 1, 1))
+
+        self.assertEqual(cursor.last_params['after_gendate'], checkpoint[0])
+        self.assertEqual(cursor.last_params['after_id'], 42)
+
+    def test_sweep_stops_after_max_batches(self):
+        """Travail borné par invocation : la suite reprendra au prochain appel"""
+        d = datetime(2023, 1, 1)
+        cursor = FakeCursor([[(d, i, True), (d, i + 1, True)] for i in range(0, 20, 2)])
+
+        report = sweep(self.make_conn(cursor), datetime(2024, 1, 1), batch_size=2, max_batches=3)
+
+        self.assertFalse(report["done"])
+        self.assertEqual(report["expired"], 4)
+        self.assertEqual(cursor.checkpoint, (d, 3))
+
+    def test_sweep_skips_accounts_refreshed_since_selection(self):
+        """Compte revenu entre la sélection et l'UPDATE : non expiré, mais dépassé"""
+        d = datetime(2023, 1, 1)
+        cursor = FakeCursor([[(d, 1, False), (d, 2, False)], [(d, 4, True)]])
+
+        report = sweep(self.make_conn(cursor), datetime(2024, 1, 1), batch_size=2)
+
+        self.assertEqual(report["expired"], 1)
+        self.assertEqual(report["batches"], 3)  # lot NULL + 2 lots : un lot entier revérifié ne clôt pas le balayage
+        self.assertEqual(cursor.checkpoint, (datetime.min, 0))
+        self.assertIn("AND NOT u.expired", [sql for sql in cursor.executed if "WITH batch" in sql][0])
+
+    def test_handle_invalid_parameters(self):
+        event = MagicMock()
+        event.body = json.dumps({"batch_size": 0})
+        result = handle(event, MagicMock())
+        self.assertEqual(result["statusCode"], 400)
+
+    @patch('handler.get_db_connection')
+    def test_handle_reports_counts(self, mock_db):
+        mock_db.return_value = self.make_conn(FakeCursor([[]]))
+        event = MagicMock()
+        event.body = ""
+        result = handle(event, MagicMock())
+        body = json.loads(result["body"])
+        self.assertEqual(result["statusCode"], 200)
+        self.assertEqual(body["expired"], 0)
+        self.assertTrue(body["done"])
+        mock_db.return_value.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
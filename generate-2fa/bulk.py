@@ -0,0 +1,117 @@
+"""
+Mode lot des fonctions de provisionnement (generate-password, generate-2fa).
+
+Entrée : liste `usernames` d'un corps JSON, ou corps NDJSON
+(`Content-Type: application/x-ndjson`, une ligne {"username": ...} par
+compte), lu ligne à ligne. Sortie : corps NDJSON diffusé tranche par
+tranche, une transaction par tranche, une ligne par nom dans l'ordre de la
+requête ; la mémoire utilisée ne dépend pas de la taille de l'appel.
+"""
+
+import io
+import logging
+from itertools import islice
+
+import psycopg2
+
+import codec
+import jsonlog
+from db import get_db_connection
+
+NDJSON = 'application/x-ndjson'
+
+UsernameLine = codec.struct('UsernameLine', ('username', str, ''))
+
+
+def line(obj):
+    """Ligne NDJSON encodée"""
+    return codec.dumps(obj) + b'\n'
+
+
+def is_ndjson(event):
+    headers = getattr(event, 'headers', None)
+    content_type = headers.get('Content-Type') if headers is not None else None
+    return isinstance(content_type, str) and content_type.split(';', 1)[0].strip() == NDJSON
+
+
+def ndjson_request(event):
+    """(éléments, qr_format) d'un corps NDJSON ; qr_format vient du paramètre de requête"""
+    query = getattr(event, 'query', None)
+    qr_format = query.get('qr_format') if query is not None else None
+    return ndjson_usernames(getattr(event, 'body', None)), qr_format if isinstance(qr_format, str) else ''
+
+
+def list_request(data, max_items):
+    """(éléments, qr_format) d'un corps {"usernames": [...], "qr_format": ...}"""
+    usernames = data['usernames']
+    if not isinstance(usernames, list) or len(usernames) > max_items:
+        raise codec.ValidationError(f"usernames must be a list of at most {max_items} items")
+    qr_format = data.get('qr_format') or ''
+    if not isinstance(qr_format, str):
+        raise codec.ValidationError("qr_format must be a string")
+    return list_usernames(usernames), qr_format
+
+
+def list_usernames(usernames):
+    """(nom, erreur) des éléments d'une liste "usernames" """
+    for username in usernames:
+        if not isinstance(username, str):
+            yield '', "username must be a string"
+        else:
+            yield username.strip(), None
+
+
+def ndjson_usernames(body):
+    """(nom, erreur) des lignes {"username": ...} d'un corps NDJSON, lues au fil de l'eau"""
+    for raw in io.BytesIO(body or b''):
+        if not raw.strip():
+            continue
+        try:
+            username, = UsernameLine.from_dict(codec.loads(raw))
+        except codec.DecodeError:
+            yield '', "Invalid JSON line"
+        except codec.ValidationError as e:
+            yield '', str(e)
+        else:
+            yield username, None
+
+
+def failure(username, error):
+    return {"username": username, "success": False, "error": error}
+
+
+def stream(items, process_chunk, chunk_size, max_items, log, event_name):
+    """
+    Corps de réponse NDJSON : `process_chunk(conn, tranche)` traite une
+    tranche de (nom, erreur) dans sa transaction et renvoie (lignes, nombre
+    de comptes traités). Une erreur de base arrête le flux sur une ligne
+    d'erreur ; les tranches déjà validées restent acquises.
+    """
+    conn = None
+    total = 0
+    remaining = max_items
+    items = iter(items)
+    try:
+        while True:
+            chunk = list(islice(items, min(chunk_size, remaining)))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if conn is None:
+                conn = get_db_connection()
+            lines, done = process_chunk(conn, chunk)
+            total += done
+            yield lines
+        if remaining == 0 and next(items, None) is not None:
+            yield line({"success": False, "error": f"At most {max_items} users per call, remaining lines ignored"})
+        jsonlog.event(log, event_name, count=total)
+    except psycopg2.Error as e:
+        jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(e))
+        yield line({"success": False, "error": f"Database error: {e}"})
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def response(body):
+    return {"statusCode": 200, "headers": {"Content-Type": NDJSON}, "body": body}
@@ -1,199 +1,240 @@
 import secrets
 import string
-import json
+import logging
 import os
 import psycopg2
-import qrcode
-import io
 import base64
 import pyotp
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from urllib.parse import quote
 
-# Chargement clé AES-256-GCM depuis la variable d'environnement (Base64 -> 32 octets)
-_RAW_KEY_B64 = os.getenv('MFA_KEY_B64')
-# Si la variable d'env est absente, tenter de lire le secret monté "mfa-key"
-if not _RAW_KEY_B64:
-    for p in ('/var/openfaas/secrets/MFA_KEY_B64', '/var/openfaas/secrets/mfa-key'):
-        try:
-            with open(p, 'r', encoding='utf-8') as fp:
-                _RAW_KEY_B64 = fp.read().strip()
-                break
-        except FileNotFoundError:
-            continue
-
-if not _RAW_KEY_B64:
-    raise ValueError("Environment variable MFA_KEY_B64 (base64-encoded 32-byte AES key) is required or secret must exist")
-
-try:
-    AES_KEY = base64.b64decode(_RAW_KEY_B64)
-    if len(AES_KEY) != 32:
-        raise ValueError
-except Exception:
-    raise ValueError("MFA_KEY_B64 must be base64 of 32 bytes (256 bits)")
+from psycopg2.extras import execute_values
+
+from db import get_db_connection, pool_stats
+import bulk
+import codec
+import jsonlog
+import metrics
+import mfa_keys
+import qr
+import ratelimit
+import secretstore
+
+log = logging.getLogger('generate-2fa')
+metrics.register_gauges('db_pool', pool_stats)
+metrics.register_gauges('secrets', secretstore.stats)
+
+# Seaux à jetons par IP et par utilisateur (None si RATE_LIMIT_ENABLED=false)
+RATE_LIMITER = ratelimit.from_env('generate-2fa')
+
+EnrollRequest = codec.struct('EnrollRequest', ('username', str, ''), ('qr_format', str, ''))
+
+USERNAME_REQUIRED = codec.error(400, "Username is required")
+
+# Mode lot : utilisateurs par appel, utilisateurs par transaction
+BULK_MAX = int(os.getenv('MFA_BULK_MAX', '10000'))
+BULK_CHUNK = int(os.getenv('MFA_BULK_CHUNK', '500'))
+# Marge historique des QR codes d'enrôlement (5 modules), sauf QR_BORDER explicite
+QR_BORDER = int(os.getenv('QR_BORDER', '5'))
+
+SELECT_BULK = "SELECT id, username, mfa FROM users WHERE username = ANY(%s)"
+# Un UPDATE par transaction de lot ; un secret posé entre-temps n'est pas écrasé
+UPDATE_BULK = """
+    UPDATE users AS u SET mfa = v.mfa
+    FROM (VALUES %s) AS v(id, mfa)
+    WHERE u.id = v.id AND u.mfa IS NULL
+    RETURNING u.id
+"""
 
 def generate_2fa_secret():
     """Génère un secret 2FA aléatoire de 32 caractères"""
     return pyotp.random_base32()
 
-def get_db_connection():
-    """Établit une connexion à la base de données PostgreSQL"""
-    db_password = os.getenv('DB_PASSWORD')
-    if db_password is None:
-        for p in ('/var/openfaas/secrets/DB_PASSWORD', '/var/openfaas/secrets/db-creds'):
-            try:
-                with open(p, 'r', encoding='utf-8') as fp:
-                    db_password = fp.read().strip()
-                    break
-            except FileNotFoundError:
-                continue
-        else:
-            db_password = 'password'
-
-    return psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'mspr_db'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=db_password,
-        port=os.getenv('DB_PORT', '5432')
-    )
-
-def generate_qr_code(username, secret, issuer="COFRAP"):
-    """Génère un QR code pour l'authentification 2FA"""
-    totp_uri = pyotp.totp.TOTP(secret).provisioning_uri(
-        name=username,
-        issuer_name=issuer
-    )
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(totp_uri)
-    qr.make(fit=True)
-    
-    qr_image = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convertir en base64
-    buffer = io.BytesIO()
-    qr_image.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return qr_base64, totp_uri
+def generate_2fa_secrets(n):
+    """n secrets de 32 caractères Base32 (160 bits), tirés d'un seul appel à l'entropie système"""
+    entropy = secrets.token_bytes(20 * n)
+    return [base64.b32encode(entropy[i:i + 20]).decode() for i in range(0, 20 * n, 20)]
+
+def provisioning_uri(username, secret, issuer="COFRAP"):
+    return pyotp.totp.TOTP(secret).provisioning_uri(name=username, issuer_name=issuer)
+
+def generate_qr_code(username, secret, issuer="COFRAP", fmt=None):
+    """QR code de l'URI TOTP au format demandé (qr.py : png base64, svg ou matrix)"""
+    totp_uri = provisioning_uri(username, secret, issuer)
+    return qr.render(totp_uri, fmt, border=QR_BORDER), totp_uri
 
 # ---------------- Chiffrement AES-GCM ----------------
 def encrypt_secret(secret: str):
-    """Chiffre le secret TOTP avec AES-256-GCM, renvoie nonce+ciphertext encodés Base64"""
-    aesgcm = AESGCM(AES_KEY)
-    nonce = secrets.token_bytes(12)  # 96-bit nonce recommandé
-    ct = aesgcm.encrypt(nonce, secret.encode(), None)
-    return base64.b64encode(nonce + ct).decode()
+    """Chiffre le secret TOTP avec la clé active du trousseau ("id:base64(nonce+ciphertext)")"""
+    return mfa_keys.keyring().encrypt(secret)
+
+def encrypt_secrets(mfa_secrets):
+    """Chiffre une liste de secrets : un contexte AES-GCM, un seul tirage pour tous les nonces"""
+    return mfa_keys.keyring().encrypt_many(mfa_secrets)
+
+def enroll_chunk(conn, chunk, qr_format):
+    """
+    Inscrit les utilisateurs d'un lot dans une transaction : un SELECT, un
+    UPDATE multi-lignes. Renvoie les lignes NDJSON dans l'ordre du lot et le
+    nombre d'inscriptions.
+    """
+    errors = {}
+    pending = []
+    for i, (username, error) in enumerate(chunk):
+        if error is None and not username:
+            error = "Username is required"
+        if error is not None:
+            errors[i] = error
+        else:
+            pending.append(username)
+
+    cur = conn.cursor()
+    users = {}
+    if pending:
+        with metrics.phase('select'):
+            cur.execute(SELECT_BULK, (list(set(pending)),))
+            users = {name: (user_id, mfa) for user_id, name, mfa in cur.fetchall()}
+
+    # Premier exemplaire de chaque nom sans secret : nom -> (id, secret en clair)
+    todo = list(dict.fromkeys(name for name in pending if name in users and not users[name][1]))
+    mfa_secrets = generate_2fa_secrets(len(todo))
+    updated = set()
+    enrolled = {}
+    if todo:
+        started = metrics.clock()
+        encrypted = encrypt_secrets(mfa_secrets)
+        metrics.since('encrypt', started)
+        with metrics.phase('update'):
+            rows = [(users[name][0], ct) for name, ct in zip(todo, encrypted)]
+            updated = {row[0] for row in execute_values(cur, UPDATE_BULK, rows, page_size=len(rows), fetch=True)}
+            conn.commit()
+        enrolled = {name: secret for name, secret in zip(todo, mfa_secrets) if users[name][0] in updated}
+    cur.close()
+
+    lines = []
+    for i, (username, _) in enumerate(chunk):
+        if i in errors:
+            result = bulk.failure(username, errors[i])
+        elif username not in users:
+            result = bulk.failure(username, f"User '{username}' not found")
+        elif username not in enrolled:
+            result = bulk.failure(username, f"User '{username}' already has 2FA enabled")
+        else:
+            mfa_secret = enrolled.pop(username)  # une seule ligne de succès par nom
+            totp_uri = provisioning_uri(username, mfa_secret)
+            result = {"success": True, "username": username, "mfa_secret": mfa_secret, "totp_uri": totp_uri}
+            if qr_format:
+                started = metrics.clock()
+                result["qr_code"] = qr.render(totp_uri, qr_format, border=QR_BORDER)
+                metrics.since('qr', started)
+                result["qr_format"] = qr_format
+        lines.append(bulk.line(result))
+    return b''.join(lines), len(updated)
+
+def handle_bulk(event, items, qr_format=''):
+    """Inscription en lot : liste "usernames" ou corps NDJSON ; QR codes seulement si qr_format est donné"""
+    if RATE_LIMITER is not None:
+        denied = RATE_LIMITER.check(event)
+        if denied is not None:
+            return denied
+    if qr_format:
+        qr_format = qr.negotiate(event, qr_format)  # ValidationError si le format est inconnu
+    return bulk.response(bulk.stream(
+        items, lambda conn, chunk: enroll_chunk(conn, chunk, qr_format),
+        BULK_CHUNK, BULK_MAX, log, '2fa.bulk_enrolled'))
 
 def handle(event, context):
+    conn = None
     try:
-        # Parse le body de la requête
-        if hasattr(event, 'body'):
-            body = json.loads(event.body) if event.body else {}
-        else:
-            body = {}
-        
-        username = body.get('username', '').strip()
+        # Corps de la requête, décodé et validé depuis ses octets
+        if bulk.is_ndjson(event):
+            return handle_bulk(event, *bulk.ndjson_request(event))
+        data = codec.loads(getattr(event, 'body', None))
+        if isinstance(data, dict) and 'usernames' in data:
+            return handle_bulk(event, *bulk.list_request(data, BULK_MAX))
+        username, qr_format = EnrollRequest.from_dict(data)
+        qr_format = qr.negotiate(event, qr_format)
+
+        # Refus avant tout accès base
+        if RATE_LIMITER is not None:
+            denied = RATE_LIMITER.check(event, username)
+            if denied is not None:
+                return denied
         
         if not username:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({
-                    "error": "Username is required",
-                    "success": False
-                })
-            }
+            return USERNAME_REQUIRED
         
-        # Connexion à la base de données
-        conn = get_db_connection()
+        # Connexion à la base de données (rendue au pool dans le finally)
+        with metrics.phase('db_connect'):
+            conn = get_db_connection()
         cursor = conn.cursor()
         
         # Vérifier si l'utilisateur existe
-        cursor.execute("SELECT id, username, mfa FROM users WHERE username = %s", (username,))
-        user = cursor.fetchone()
+        with metrics.phase('select'):
+            cursor.execute("SELECT id, username, mfa FROM users WHERE username = %s", (username,))
+            user = cursor.fetchone()
         
         if not user:
             cursor.close()
-            conn.close()
-            return {
-                "statusCode": 404,
-                "body": json.dumps({
-                    "error": f"User '{username}' not found",
-                    "success": False
-                })
-            }
+            return codec.error(404, f"User '{username}' not found")
         
         user_id, username, existing_mfa = user
         
         # Vérifier si l'utilisateur a déjà un secret 2FA
         if existing_mfa:
             cursor.close()
-            conn.close()
-            return {
-                "statusCode": 409,
-                "body": json.dumps({
-                    "error": f"User '{username}' already has 2FA enabled",
-                    "success": False,
-                    "message": "Use the existing 2FA secret or disable it first"
-                })
-            }
+            return codec.error(409, f"User '{username}' already has 2FA enabled",
+                               message="Use the existing 2FA secret or disable it first")
         
         # Générer un nouveau secret 2FA
         mfa_secret = generate_2fa_secret()
         
         # Chiffrer le secret avant stockage
+        started = metrics.clock()
         encrypted_secret = encrypt_secret(mfa_secret)
+        metrics.since('encrypt', started)
         
         # Mettre à jour la base de données avec le secret 2FA chiffré
-        cursor.execute("""
-            UPDATE users 
-            SET mfa = %s 
-            WHERE id = %s
-        """, (encrypted_secret, user_id))
-        
-        conn.commit()
+        with metrics.phase('update'):
+            cursor.execute("""
+                UPDATE users 
+                SET mfa = %s 
+                WHERE id = %s
+            """, (encrypted_secret, user_id))
+            
+            conn.commit()
         
         # Générer le QR code
-        qr_base64, totp_uri = generate_qr_code(username, mfa_secret)
+        started = metrics.clock()
+        qr_code, totp_uri = generate_qr_code(username, mfa_secret, fmt=qr_format)
+        metrics.since('qr', started)
         
         cursor.close()
-        conn.close()
-        
-        return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "success": True,
-                "username": username,
-                "mfa_secret": mfa_secret,
-                "qr_code": qr_base64,
-                "totp_uri": totp_uri,
-                "message": f"2FA secret generated successfully for user '{username}'",
-                "instructions": "Scan the QR code with your authenticator app (Google Authenticator, Authy, etc.)"
-            })
-        }
+
+        jsonlog.event(log, '2fa.enrolled', user_id=user_id)
+        started = metrics.clock()
+        response = codec.response(200, {
+            "success": True,
+            "username": username,
+            "mfa_secret": mfa_secret,
+            "qr_code": qr_code,
+            "qr_format": qr_format,
+            "totp_uri": totp_uri,
+            "message": f"2FA secret generated successfully for user '{username}'",
+            "instructions": "Scan the QR code with your authenticator app (Google Authenticator, Authy, etc.)"
+        })
+        metrics.since('encode', started)
+        return response
         
     except psycopg2.Error as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": f"Database error: {str(e)}",
-                "success": False
-            })
-        }
-    except json.JSONDecodeError:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({
-                "error": "Invalid JSON in request body",
-                "success": False
-            })
-        }
+        jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(e))
+        return codec.error(500, f"Database error: {str(e)}")
+    except codec.DecodeError:
+        return codec.INVALID_JSON
+    except codec.ValidationError as e:
+        return codec.error(400, str(e))
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": f"Internal server error: {str(e)}",
-                "success": False
-            })
-        } 
\ No newline at end of file
+        log.error('internal error', exc_info=e)
+        return codec.error(500, f"Internal server error: {str(e)}")
+    finally:
+        if conn is not None:
+            conn.close() 
\ No newline at end of file
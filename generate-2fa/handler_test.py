@@ -45,5 +45,94 @@ class TestGenerate2FA(unittest.TestCase):
         self.assertFalse(body["success"])
         self.assertIn("not found", body["error"])
 
+    def test_qr_formats(self):
+        """PNG 1 bit valide, SVG et matrice décrivant les mêmes modules"""
+        import struct, zlib
+        import qr
+        matrix = qr.modules("otpauth://totp/COFRAP:alice?secret=JBSWY3DPEHPK3PXP")
+        rows = qr.render_matrix(matrix)
+        self.assertEqual(len(rows), len(matrix))
+        self.assertEqual(rows[0][:7], "1111111")  # motif de repérage
+        png = qr.encode_png(matrix, box_size=3, border=2)
+        self.assertTrue(png.startswith(b'\x89PNG\r\n\x1a\n'))
+        width, height, depth = struct.unpack('>IIB', png[16:25])
+        self.assertEqual((width, height, depth), ((len(matrix) + 4) * 3, (len(matrix) + 4) * 3, 1))
+        idat = png[33 + 8:-12 - 4]
+        self.assertEqual(len(zlib.decompress(idat)), height * (1 + (width + 7) // 8))
+        svg = qr.render_svg(matrix)
+        self.assertIn(f'viewBox="0 0 {len(matrix) + 8} {len(matrix) + 8}"', svg)
+
+    def test_qr_format_negotiation(self):
+        import qr
+        event = MagicMock()
+        event.headers = {'Accept': 'image/svg+xml;q=0.9, */*'}
+        self.assertEqual(qr.negotiate(event), 'svg')
+        self.assertEqual(qr.negotiate(event, 'matrix'), 'matrix')
+        event.headers = {}
+        self.assertEqual(qr.negotiate(event), qr.DEFAULT_FORMAT)
+        with self.assertRaisesRegex(ValueError, "qr_format must be one of matrix, png, svg"):
+            qr.negotiate(event, 'gif')
+
+    def test_qr_format_negotiation_honours_q_values(self):
+        """Le plus fort q l'emporte ; q=0 refuse le format, même par défaut"""
+        import qr
+        event = MagicMock()
+        for accept, expected in (('image/png;q=0, image/svg+xml', 'svg'),
+                                 ('image/png;q=0.5, image/svg+xml;q=0.8', 'svg'),
+                                 ('image/svg+xml;q=0.5, image/png', 'png'),
+                                 ('application/x-qr-matrix, image/svg+xml', 'matrix'),
+                                 ('text/html', qr.DEFAULT_FORMAT)):
+            event.headers = {'Accept': accept}
+            self.assertEqual(qr.negotiate(event), expected, accept)
+        event.headers = {'Accept': f'{"image/png" if qr.DEFAULT_FORMAT == "png" else "image/svg+xml"}; q=0'}
+        self.assertNotEqual(qr.negotiate(event), qr.DEFAULT_FORMAT)
+
+    @patch('handler.QR_BORDER', 5)
+    def test_qr_code_keeps_enrolment_border(self):
+        """QR d'enrôlement : marge historique de 5 modules"""
+        import qr
+        svg, uri = generate_qr_code("alice", "JBSWY3DPEHPK3PXP", fmt='svg')
+        size = len(qr.modules(uri)) + 10
+        self.assertIn(f'viewBox="0 0 {size} {size}"', svg)
+
+    @patch('handler.execute_values')
+    @patch('bulk.get_db_connection')
+    def test_handle_bulk_enrolls_in_one_update(self, mock_db, mock_execute_values):
+        """Mode lot : un SELECT et un UPDATE par tranche, une ligne NDJSON par nom, dans l'ordre"""
+        import os
+        import mfa_keys
+        keyring = mfa_keys.Keyring({"k1": os.urandom(32)}, "k1")
+        patcher = patch('mfa_keys._keyring', keyring)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [(1, "alice", None), (2, "bob", "déjà-chiffré"), (3, "carol", None)]
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+        mock_execute_values.side_effect = lambda cur, sql, rows, **kw: [(row[0],) for row in rows]
+
+        event = MagicMock()
+        event.headers = {}
+        event.body = json.dumps({"usernames": ["alice", "bob", "dave", "carol", "alice", ""]})
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["headers"]["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b''.join(result["body"]).splitlines()]
+        self.assertEqual([line["success"] for line in lines], [True, False, False, True, False, False])
+        self.assertIn("already has 2FA", lines[1]["error"])
+        self.assertIn("not found", lines[2]["error"])
+        self.assertIn("already has 2FA", lines[4]["error"])
+        self.assertEqual(lines[5]["error"], "Username is required")
+        self.assertNotIn("qr_code", lines[0])
+        self.assertIn(lines[0]["mfa_secret"], lines[0]["totp_uri"])
+        rows = mock_execute_values.call_args.args[2]
+        self.assertEqual([row[0] for row in rows], [1, 3])
+        self.assertTrue(rows[0][1].startswith("k1:"))
+        self.assertEqual(keyring.decrypt(rows[0][1]), lines[0]["mfa_secret"])
+        mock_cursor.execute.assert_called_once()
+        mock_conn.commit.assert_called_once()
+        mock_conn.close.assert_called_once()
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Histogrammes de latence par phase et par issue, exposés au format texte
+Prometheus (`/metrics` d'index.py et d'asgi.py).
+
+Le point d'entrée ouvre une mesure par requête (`start()`), les handlers
+chronomètrent leurs phases, puis le point d'entrée clôt la mesure avec
+l'issue de la requête (code HTTP, ou l'issue posée par le handler via
+`set_outcome('requires_2fa')`). Chaque phase est alors enregistrée dans
+l'histogramme (phase, issue), plus la phase `total`.
+
+Deux façons de chronométrer une phase :
+
+- `started = metrics.clock()` ... `metrics.since('verify_totp', started)` :
+  deux lectures d'horloge et un ajout à une liste, sans objet intermédiaire
+  (budget : bien moins d'une microseconde, vérifié par
+  benchmarks/bench_metrics_phase.py). Pour les phases de calcul, répétées
+  par élément d'un lot ;
+- `with metrics.phase('select'):` : un objet de contexte par phase (de
+  l'ordre de la microseconde), enregistré même si le bloc lève. Pour les
+  phases qui encadrent un accès base : avec le traçage, leur span est le
+  parent des spans `db.execute`.
+
+Quand le traçage est actif (tracing.py), chaque phase est aussi un span
+enfant de la trace courante (après coup pour `since`) ; sinon aucun span
+n'est créé ni cherché. Les histogrammes (recherche dichotomique + verrou) ne
+sont mis à jour qu'une fois, à la clôture. Hors requête (tests, tâches de
+fond), une phase est enregistrée tout de suite avec l'issue "none".
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+import tracing
+
+# Bornes des seaux (secondes) : 0,5 ms à 10 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC = 'function_phase_seconds'
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+class Histogram:
+    """Histogramme cumulatif à seaux fixes"""
+
+    __slots__ = ('counts', 'sum', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # dernier seau : +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Registry:
+    """Histogrammes indexés par (phase, issue) et jauges calculées à la lecture"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase, outcome, seconds):
+        histogram = self._histograms.get((phase, outcome))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault((phase, outcome), Histogram())
+        histogram.observe(seconds)
+
+    def register_gauges(self, name, collect):
+        """`collect()` renvoie {clé: nombre}, exposé en function_<name>{key="..."}"""
+        self._gauges[name] = collect
+
+    def render(self):
+        """Exposition au format texte Prometheus 0.0.4"""
+        lines = [f"# HELP {METRIC} Durée des phases de traitement par issue de la requête",
+                 f"# TYPE {METRIC} histogram"]
+        for (phase, outcome), histogram in sorted(self._histograms.items()):
+            counts, total = histogram.snapshot()
+            labels = f'phase="{phase}",outcome="{outcome}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{METRIC}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC}_sum{{{labels}}} {total}')
+            lines.append(f'{METRIC}_count{{{labels}}} {cumulative}')
+        for name, collect in sorted(self._gauges.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            lines.append(f"# TYPE function_{name} gauge")
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f'function_{name}{{key="{key}"}} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class RequestTimings:
+    """Phases mesurées pendant une requête, enregistrées à sa clôture"""
+
+    __slots__ = ('started', 'phases', 'outcome')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.outcome = None
+
+
+class _Phase:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _TracedPhase(_Phase):
+    """Phase doublée d'un span enfant de la trace courante"""
+
+    __slots__ = ('span',)
+
+    def __enter__(self):
+        self.span = tracing.start_span(self.name)
+        if self.span is not None:
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+        if self.span is not None:
+            self.span.__exit__(*exc)
+        return False
+
+
+def phase(name):
+    """Chronomètre une phase : `with metrics.phase('select'): ...`"""
+    return _TracedPhase(name) if tracing.ENABLED else _Phase(name)
+
+
+clock = time.perf_counter
+
+
+def since(name, started):
+    """Phase commencée à `started` (valeur de `clock()`), terminée maintenant"""
+    seconds = clock() - started
+    timings = _current.get()
+    if timings is None:
+        REGISTRY.observe(name, 'none', seconds)
+    else:
+        timings.phases.append((name, seconds))
+    if tracing.ENABLED:
+        tracing.record_span(name, seconds)
+
+
+def record(name, seconds):
+    """Durée d'une phase déjà mesurée"""
+    timings = _current.get()
+    if timings is None:
+        REGISTRY.observe(name, 'none', seconds)
+    else:
+        timings.phases.append((name, seconds))
+
+
+def start():
+    """Ouvre la mesure de la requête courante (point d'entrée)"""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def set_outcome(outcome):
+    """Issue plus précise que le code HTTP (ex. requires_2fa)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.outcome = outcome
+
+
+def finish(timings, status):
+    """Clôt la mesure : chaque phase et le total sous l'issue de la requête"""
+    outcome = timings.outcome or str(status)
+    for name, seconds in timings.phases:
+        REGISTRY.observe(name, outcome, seconds)
+    REGISTRY.observe('total', outcome, time.perf_counter() - timings.started)
+    if _current.get() is timings:
+        _current.set(None)
+
+
+def register_gauges(name, collect):
+    REGISTRY.register_gauges(name, collect)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,174 @@
+"""
+Trousseau de clés AES-256-GCM des secrets 2FA (generate-2fa, authenticate-user,
+rewrap-mfa).
+
+Format stocké dans `users.mfa` : "<id de clé>:<base64(nonce + ciphertext)>".
+L'identifiant en tête désigne la clé sans essai de déchiffrement (un accès
+dictionnaire) ; ":" n'apparaît ni en Base64 ni en Base32, les valeurs
+antérieures restent donc reconnaissables :
+- sans préfixe, plus de 40 caractères : chiffré par la clé historique
+  (MFA_KEY_B64) ;
+- sans préfixe, 40 caractères ou moins : secret Base32 en clair.
+
+Les nouveaux secrets sont chiffrés par la clé active ; la fonction rewrap-mfa
+réécrit les valeurs historiques ou chiffrées par une ancienne clé.
+
+Configuration (variable, sinon secret monté du même nom ou son alias, lu par
+secretstore) :
+- MFA_KEYS ("mfa-keys") : "id:base64,id:base64..." ;
+- MFA_KEY_B64 ("mfa-key") : clé historique, enregistrée sous MFA_LEGACY_KEY_ID
+  ("k0") ;
+- MFA_ACTIVE_KEY_ID : clé de chiffrement (défaut : dernière clé de MFA_KEYS,
+  sinon la clé historique).
+
+Quand un secret de clé monté change, le trousseau est reconstruit et remplacé
+en une affectation ; en cas d'erreur l'ancien est conservé.
+"""
+
+import base64
+import os
+import re
+import secrets
+import threading
+
+import secretstore
+
+SEPARATOR = ':'
+LEGACY_PLAINTEXT_MAX = 40
+NONCE_SIZE = 12
+
+_KEY_ID = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+_keyring = None
+_keyring_lock = threading.Lock()
+
+
+class UnknownKeyId(ValueError):
+    """Secret chiffré par une clé absente du trousseau"""
+
+
+class Keyring:
+    """Clés AES-256-GCM par identifiant, une clé active pour chiffrer"""
+
+    def __init__(self, keys, active_id, legacy_id=None):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # import différé (démarrage à froid)
+        for key_id, key in keys.items():
+            if not _KEY_ID.match(key_id):
+                raise ValueError(f"Invalid MFA key id {key_id!r} (letters, digits, '_' or '-', at most 32)")
+            if len(key) != 32:
+                raise ValueError(f"MFA key {key_id!r} must decode to 32 bytes")
+        if active_id not in keys:
+            raise ValueError(f"Active MFA key {active_id!r} is not in the keyring")
+        if legacy_id is not None and legacy_id not in keys:
+            raise ValueError(f"Legacy MFA key {legacy_id!r} is not in the keyring")
+        self._ciphers = {key_id: AESGCM(key) for key_id, key in keys.items()}
+        self.active_id = active_id
+        self.legacy_id = legacy_id
+        self.prefix = active_id + SEPARATOR
+
+    @property
+    def key_ids(self):
+        return sorted(self._ciphers)
+
+    def encrypt(self, plaintext):
+        """Secret en clair -> "id:base64(nonce + ciphertext)" avec la clé active"""
+        return self.encrypt_many([plaintext])[0]
+
+    def encrypt_many(self, plaintexts):
+        """Chiffre une liste de secrets : un seul tirage pour tous les nonces"""
+        aes = self._ciphers[self.active_id]
+        entropy = secrets.token_bytes(NONCE_SIZE * len(plaintexts))
+        encrypted = []
+        for i, plaintext in enumerate(plaintexts):
+            nonce = entropy[NONCE_SIZE * i:NONCE_SIZE * (i + 1)]
+            ct = aes.encrypt(nonce, plaintext.encode(), None)
+            encrypted.append(self.prefix + base64.b64encode(nonce + ct).decode())
+        return encrypted
+
+    def key_id(self, value):
+        """Identifiant de la clé de `value` ; None pour un secret en clair historique"""
+        key_id, sep, _ = value.partition(SEPARATOR)
+        if sep:
+            return key_id
+        if len(value) > LEGACY_PLAINTEXT_MAX:
+            return self.legacy_id
+        return None
+
+    def decrypt(self, value):
+        """Valeur stockée (tous formats) -> secret Base32 en clair"""
+        key_id, sep, payload = value.partition(SEPARATOR)
+        if not sep:
+            if len(value) <= LEGACY_PLAINTEXT_MAX:
+                return value  # secret non chiffré historique
+            key_id, payload = self.legacy_id, value
+        aes = self._ciphers.get(key_id)
+        if aes is None:
+            raise UnknownKeyId(f"MFA secret encrypted with unknown key {key_id!r}")
+        data = base64.b64decode(payload)
+        return aes.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], None).decode()
+
+    def is_current(self, value):
+        """Valeur déjà chiffrée par la clé active"""
+        return value.startswith(self.prefix)
+
+    def rewrap(self, value):
+        """Valeur rechiffrée par la clé active (inchangée si elle l'est déjà)"""
+        if self.is_current(value):
+            return value
+        return self.encrypt(self.decrypt(value))
+
+
+def _decode_key(key_id, raw_b64):
+    try:
+        return base64.b64decode(raw_b64.strip(), validate=True)
+    except ValueError:
+        raise ValueError(f"MFA key {key_id!r} must be base64 of 32 bytes (256 bits)")
+
+
+def load_keyring():
+    """Trousseau construit depuis l'environnement et les secrets montés"""
+    keys = {}
+    raw_keys = secretstore.get('MFA_KEYS', 'mfa-keys')
+    if raw_keys:
+        for entry in raw_keys.replace('\n', ',').split(','):
+            if not entry.strip():
+                continue
+            key_id, sep, raw_b64 = entry.strip().partition(SEPARATOR)
+            if not sep:
+                raise ValueError("MFA_KEYS entries must be 'id:base64'")
+            keys[key_id] = _decode_key(key_id, raw_b64)
+    default_active = list(keys)[-1] if keys else None
+
+    legacy_id = None
+    raw_legacy = secretstore.get('MFA_KEY_B64', 'mfa-key')
+    if raw_legacy:
+        legacy_id = os.getenv('MFA_LEGACY_KEY_ID', 'k0')
+        keys.setdefault(legacy_id, _decode_key(legacy_id, raw_legacy))
+        default_active = default_active or legacy_id
+
+    if not keys:
+        raise ValueError("MFA_KEYS or MFA_KEY_B64 (base64-encoded 32-byte AES key) is required, as env var or secret")
+    return Keyring(keys, os.getenv('MFA_ACTIVE_KEY_ID') or default_active, legacy_id)
+
+
+def keyring():
+    """Trousseau du processus, chargé au premier secret 2FA (pas à l'import)"""
+    global _keyring
+    if _keyring is None:
+        with _keyring_lock:
+            if _keyring is None:
+                _keyring = load_keyring()
+                secretstore.on_change(('MFA_KEYS', 'MFA_KEY_B64'), reload_keyring)
+    return _keyring
+
+
+def reload_keyring(names=()):
+    """
+    Reconstruit le trousseau (secret de clé modifié). Une configuration
+    invalide lève ValueError avant le remplacement : l'ancien trousseau reste
+    en place (erreur comptée par secretstore).
+    """
+    global _keyring
+    new = load_keyring()
+    with _keyring_lock:
+        _keyring = new
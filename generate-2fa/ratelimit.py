@@ -0,0 +1,213 @@
+"""
+Limitation de débit par seau à jetons (token bucket), partagée par les trois
+fonctions.
+
+Deux clés sont limitées : l'adresse IP du client (X-Forwarded-For posé par
+nginx-cors-proxy.conf) et le nom d'utilisateur visé. Le refus (429 +
+Retry-After) intervient avant tout calcul de hash ou accès à PostgreSQL.
+
+Le seau d'un nom d'utilisateur est tenu par client (nom, IP) : un seau par
+nom seul laisserait n'importe qui bloquer le compte d'un autre en épuisant
+ses jetons. RATE_LIMIT_USER_SCOPE=global rétablit un seau par nom, toutes
+IP confondues (force brute distribuée limitée, au prix de ce blocage).
+
+Backends :
+- MemoryBackend : seaux dans le processus (un réplica = ses propres compteurs) ;
+- SharedBackend : seaux partagés entre réplicas dans un store compatible Redis
+  (script Lua atomique) ; LocalSharedStore en est la doublure locale.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _take(state, rate, burst, now, cost=1.0):
+    """Algorithme du seau : (nouvel état, autorisé, délai avant nouveau jeton)"""
+    tokens, last = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - last) * rate)
+    if tokens >= cost:
+        return (tokens - cost, now), True, 0.0
+    return (tokens, now), False, (cost - tokens) / rate
+
+
+class MemoryBackend:
+    """Seaux en mémoire du processus, bornés en nombre (LRU)"""
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        with self._lock:
+            state, allowed, retry_after = _take(self._buckets.get(key), rate, burst, self._clock(), cost)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+# Seau atomique côté serveur : KEYS[1] = clé, ARGV = rate, burst, coût ; horloge du serveur
+_LUA_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3]) or 1
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local tokens = tonumber(state[1]) or burst
+local last = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+
+class SharedBackend:
+    """Seaux partagés entre réplicas dans un store Redis (client redis-py ou doublure)"""
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, cost=1.0):
+        allowed, retry_after = self.client.eval(_LUA_TAKE, 1, self.prefix + key, rate, burst, cost)
+        return bool(int(allowed)), float(retry_after)
+
+
+class LocalSharedStore:
+    """
+    Doublure locale d'un store partagé : même contrat que client.eval(_LUA_TAKE)
+    sans serveur Redis, pour les tests et le développement.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def eval(self, script, numkeys, key, rate, burst, cost=1.0):
+        rate, burst = float(rate), float(burst)
+        with self._lock:
+            state, allowed, retry_after = _take(self._data.get(key), rate, burst, self._clock(), float(cost))
+            self._data[key] = state
+        return [1 if allowed else 0, str(retry_after)]
+
+
+class RateLimiter:
+    """Applique les limites par IP et par utilisateur, renvoie une réponse 429 ou None"""
+
+    def __init__(self, backend, ip_rate=5.0, ip_burst=20, user_rate=0.2, user_burst=5, trusted_hops=1,
+                 user_scope='ip'):
+        if user_scope not in ('ip', 'global'):
+            raise ValueError(f"Invalid user rate limit scope: {user_scope!r}")
+        self.backend = backend
+        self.ip_rate, self.ip_burst = ip_rate, ip_burst
+        self.user_rate, self.user_burst = user_rate, user_burst
+        self.trusted_hops = trusted_hops
+        self.user_scope = user_scope
+        self._stats = {'allowed': 0, 'denied_ip': 0, 'denied_user': 0}
+
+    def client_ip(self, event):
+        """
+        IP du client d'après X-Forwarded-For : chaque proxy de confiance ajoute
+        une entrée à droite, on retient celle posée par le premier (nginx).
+        """
+        headers = getattr(event, 'headers', None)
+        forwarded = headers.get('X-Forwarded-For') if headers is not None else None
+        if not isinstance(forwarded, str) or not forwarded.strip():
+            return None
+        hops = [h.strip() for h in forwarded.split(',') if h.strip()]
+        return hops[-self.trusted_hops] if len(hops) >= self.trusted_hops else hops[0]
+
+    def check(self, event, username=None, cost=1):
+        """
+        `cost` jetons pris dans le seau de l'IP : un lot de n identifiants coûte
+        n tentatives, comme n appels unitaires. Un lot plus grand que la
+        capacité du seau ne passerait jamais : refusé sans attente.
+        """
+        ip = self.client_ip(event)
+        if ip is not None:
+            if cost > self.ip_burst:
+                self._stats['denied_ip'] += 1
+                return too_many_requests(None, f"At most {self.ip_burst:g} credentials per request from one client")
+            allowed, retry_after = self.backend.take('ip:' + ip, self.ip_rate, self.ip_burst, cost)
+            if not allowed:
+                self._stats['denied_ip'] += 1
+                return too_many_requests(retry_after)
+        if username:
+            denied = self.check_username(username, ip)
+            if denied is not None:
+                return denied
+        self._stats['allowed'] += 1
+        return None
+
+    def check_username(self, username, ip=None):
+        """Limite par utilisateur seule (éléments d'un lot déjà admis par IP)"""
+        key = 'user:' + username if self.user_scope == 'global' else f"user:{ip or '-'}:{username}"
+        allowed, retry_after = self.backend.take(key, self.user_rate, self.user_burst)
+        if not allowed:
+            self._stats['denied_user'] += 1
+            return too_many_requests(retry_after)
+        return None
+
+    def stats(self):
+        return dict(self._stats)
+
+
+# Corps constant, encodé une seule fois
+_TOO_MANY_BODY = json.dumps({
+    "error": "Too many requests, please retry later",
+    "success": False
+}).encode()
+
+
+def too_many_requests(retry_after, error=None):
+    """Réponse 429 ; sans `retry_after`, la même requête ne passera pas plus tard"""
+    if retry_after is None:
+        return {"statusCode": 429, "body": json.dumps({"error": error, "success": False}).encode()}
+    return {
+        "statusCode": 429,
+        "headers": {"Retry-After": str(max(1, math.ceil(retry_after)))},
+        "body": _TOO_MANY_BODY
+    }
+
+
+def from_env(function):
+    """
+    RateLimiter de la fonction `function` configuré par l'environnement
+    (RATE_LIMIT_*), ou None si désactivé. Dans Redis, les clés sont préfixées
+    par le nom de la fonction : chacune garde ses propres seaux.
+    """
+    if os.getenv('RATE_LIMIT_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'redis':
+        import redis  # dépendance optionnelle, seulement pour le backend partagé
+        backend = SharedBackend(redis.Redis.from_url(os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')),
+                                prefix=f'ratelimit:{function}:')
+    else:
+        backend = MemoryBackend()
+    return RateLimiter(
+        backend,
+        ip_rate=float(os.getenv('RATE_LIMIT_IP_RATE', '5')),
+        ip_burst=float(os.getenv('RATE_LIMIT_IP_BURST', '20')),
+        user_rate=float(os.getenv('RATE_LIMIT_USER_RATE', '0.2')),
+        user_burst=float(os.getenv('RATE_LIMIT_USER_BURST', '5')),
+        trusted_hops=int(os.getenv('RATE_LIMIT_TRUSTED_HOPS', '1')),
+        user_scope=os.getenv('RATE_LIMIT_USER_SCOPE', 'ip'),
+    )
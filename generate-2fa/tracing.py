@@ -0,0 +1,307 @@
+"""
+Traces par requête : span racine ouvert par le point d'entrée (index.py,
+asgi.py), spans enfants pour les phases (`metrics.phase`) et chaque
+`cursor.execute` (curseur de db.py), contexte W3C `traceparent` repris des
+en-têtes de la passerelle.
+
+Les spans terminés d'une trace sont gardés avec elle ; à la fin du span
+racine, la trace entière part dans une file vidée par un thread (export par
+lots, jamais dans le thread de la requête). TRACE_MIN_MS ne garde que les
+requêtes lentes, pour examiner la latence de queue en production.
+
+Variables d'environnement :
+- TRACE_EXPORTER : "none" (défaut, traçage désactivé), "jsonl" (fichier
+  local, une ligne JSON par span au format OTLP/JSON aplati) ou
+  "module:fabrique" pour un exportateur fourni ;
+- TRACE_FILE : fichier de l'exportateur jsonl (/tmp/traces.jsonl) ;
+- TRACE_SAMPLE_RATE : part des traces sans parent échantillonnées (1.0) ;
+- TRACE_MIN_MS : durée minimale d'une requête pour être exportée (0).
+"""
+
+import atexit
+import contextvars
+import importlib
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current = contextvars.ContextVar('trace_span', default=None)
+_processor = None
+_configured = False
+# Vrai quand un exportateur est installé : sans lui, aucun span n'est créé et
+# metrics.phase se passe de tout appel à ce module
+ENABLED = False
+_atexit_registered = False
+_config_lock = threading.Lock()
+
+
+class Span:
+    """Opération chronométrée d'une trace"""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'status', '_token')
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = None
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': self.attributes,
+            'status': self.status or 'ok',
+        }
+
+    # Utilisation en gestionnaire de contexte : le span devient le parent courant
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.status = 'error'
+            self.attributes.setdefault('error', repr(exc))
+        _current.reset(self._token)
+        self.end()
+        return False
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.trace.finished(self)
+
+
+class Trace:
+    """Spans terminés d'une requête, exportés ensemble à la fin du span racine"""
+
+    __slots__ = ('trace_id', 'flags', 'root', 'spans')
+
+    def __init__(self, trace_id, flags):
+        self.trace_id = trace_id
+        self.flags = flags
+        self.root = None
+        self.spans = []
+
+    def finished(self, span):
+        self.spans.append(span)
+        if span is self.root and _processor is not None:
+            _processor.submit(self)
+
+
+def parse_traceparent(value):
+    """(trace_id, parent_span_id, flags) d'un en-tête traceparent valide, sinon None"""
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16)
+
+
+def format_traceparent(span):
+    return f"00-{span.trace.trace_id}-{span.span_id}-{span.trace.flags:02x}"
+
+
+def start_trace(name, headers=None, **attributes):
+    """
+    Span racine de la requête, à utiliser en `with` ; None si le traçage est
+    désactivé ou la requête non échantillonnée.
+    """
+    if not _configured:
+        configure()
+    if _processor is None:
+        return None
+    parent = parse_traceparent(headers.get('traceparent')) if headers is not None else None
+    if parent is not None:
+        trace_id, parent_id, flags = parent
+        if not flags & 1:
+            return None
+    else:
+        if random.random() >= _processor.sample_rate:
+            return None
+        trace_id, parent_id, flags = secrets.token_hex(16), None, 1
+    trace = Trace(trace_id, flags)
+    trace.root = Span(trace, name, parent_id, attributes)
+    return trace.root
+
+
+def start_span(name, **attributes):
+    """Span enfant du span courant (None hors trace) ; `with` ou `end()` explicite"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def record_span(name, seconds, **attributes):
+    """Span enfant du span courant déjà terminé, d'une durée `seconds` finissant maintenant"""
+    parent = _current.get()
+    if parent is None:
+        return
+    span = Span(parent.trace, name, parent.span_id, attributes)
+    span.end_ns = time.time_ns()
+    span.start_ns = span.end_ns - int(seconds * 1e9)
+    span.trace.finished(span)
+
+
+def current_span():
+    return _current.get()
+
+
+class span:
+    """`with tracing.span('qr'):` ; sans effet hors trace"""
+
+    __slots__ = ('_span',)
+
+    def __init__(self, name, **attributes):
+        self._span = start_span(name, **attributes)
+
+    def __enter__(self):
+        if self._span is not None:
+            self._span.__enter__()
+        return self._span
+
+    def __exit__(self, *exc):
+        if self._span is not None:
+            self._span.__exit__(*exc)
+        return False
+
+
+class JsonlExporter:
+    """Exportateur hors ligne : une ligne JSON par span, en ajout au fichier"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as fp:
+            for s in spans:
+                fp.write(json.dumps(s.to_dict(), default=str) + '\n')
+
+    def shutdown(self):
+        pass
+
+
+class BatchProcessor:
+    """File bornée de traces, exportées par lots depuis un thread"""
+
+    def __init__(self, exporter, max_batch=512, interval=1.0, max_queue=2048,
+                 sample_rate=1.0, min_duration_ms=0.0):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.min_duration_ns = int(min_duration_ms * 1e6)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._stats = {'exported': 0, 'dropped': 0, 'filtered': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+        self._thread.start()
+
+    def submit(self, trace):
+        root = trace.root
+        if root.end_ns - root.start_ns < self.min_duration_ns:
+            self._stats['filtered'] += 1
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # Jamais bloquant : sous charge, des traces sont perdues
+            self._stats['dropped'] += 1
+
+    def flush(self):
+        spans = []
+        while True:
+            try:
+                spans.extend(self._queue.get_nowait().spans)
+            except queue.Empty:
+                break
+            if len(spans) >= self.max_batch:
+                self._export(spans)
+                spans = []
+        if spans:
+            self._export(spans)
+
+    def _export(self, spans):
+        try:
+            self.exporter.export(spans)
+            self._stats['exported'] += len(spans)
+        except Exception:
+            self._stats['errors'] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        self.exporter.shutdown()
+
+    def stats(self):
+        return dict(self._stats, queued=self._queue.qsize())
+
+
+def load_exporter(spec):
+    """Exportateur désigné par TRACE_EXPORTER, ou None"""
+    if not spec or spec == 'none':
+        return None
+    if spec == 'jsonl':
+        return JsonlExporter(os.getenv('TRACE_FILE', '/tmp/traces.jsonl'))
+    module, _, factory = spec.partition(':')
+    return getattr(importlib.import_module(module), factory or 'exporter')()
+
+
+def configure(exporter=None, **options):
+    """Installe le processeur d'export (une seule fois, d'après l'environnement par défaut)"""
+    global _processor, _configured, _atexit_registered, ENABLED
+    with _config_lock:
+        if _processor is not None:
+            _processor.shutdown()
+            _processor = None
+        if exporter is None:
+            exporter = load_exporter(os.getenv('TRACE_EXPORTER', 'none'))
+        if exporter is not None:
+            options.setdefault('sample_rate', float(os.getenv('TRACE_SAMPLE_RATE', '1.0')))
+            options.setdefault('min_duration_ms', float(os.getenv('TRACE_MIN_MS', '0')))
+            _processor = BatchProcessor(exporter, **options)
+            if not _atexit_registered:
+                atexit.register(shutdown)
+                _atexit_registered = True
+        ENABLED = _processor is not None
+        _configured = True
+    return _processor
+
+
+def shutdown():
+    global _processor, ENABLED
+    ENABLED = False
+    if _processor is not None:
+        processor, _processor = _processor, None
+        processor.shutdown()
+
+
+def stats():
+    return _processor.stats() if _processor is not None else {}
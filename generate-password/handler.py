@@ -1,12 +1,68 @@
 import secrets
-import json
+import logging
 import os
 import psycopg2
 from datetime import datetime
-import hashlib
-import qrcode
-import io
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from psycopg2.extras import execute_values
+
+from db import get_db_connection, pool_stats, transaction
+from passwords import Overloaded, hash_password
+import bulk
+import codec
+import idempotency
+import jsonlog
+import metrics
+import qr
+import ratelimit
+import secretstore
+
+log = logging.getLogger('generate-password')
+metrics.register_gauges('db_pool', pool_stats)
+metrics.register_gauges('secrets', secretstore.stats)
+
+# Seaux à jetons par IP et par utilisateur (None si RATE_LIMIT_ENABLED=false)
+RATE_LIMITER = ratelimit.from_env('generate-password')
+
+CreateRequest = codec.struct('CreateRequest', ('username', str, ''), ('qr_format', str, ''))
+
+USERNAME_REQUIRED = codec.error(400, "Username is required")
+SERVER_BUSY = codec.response(503, {"error": "Server busy, please retry", "success": False},
+                             headers={"Retry-After": "1"})
+
+# Mode lot : utilisateurs par appel, utilisateurs par transaction, threads de hachage
+BULK_MAX = int(os.getenv('PASSWORD_BULK_MAX', '10000'))
+BULK_CHUNK = int(os.getenv('PASSWORD_BULK_CHUNK', '500'))
+BULK_WORKERS = int(os.getenv('PASSWORD_BULK_WORKERS', str(os.cpu_count() or 1)))
+
+# Un INSERT par transaction de lot ; les noms déjà pris ne reviennent pas dans RETURNING
+INSERT_BULK = """
+    INSERT INTO users (username, password, gendate, expired) VALUES %s
+    ON CONFLICT (username) DO NOTHING
+    RETURNING id, username
+"""
+NOTIFY_BULK = "SELECT pg_notify('users_created', u) FROM unnest(%s::text[]) AS u"
+
+# Création en une instruction : pas de SELECT préalable, pas de course entre deux
+# requêtes pour le même nom (aucune ligne renvoyée si le nom est déjà pris)
+CREATE_USER = """
+    WITH created AS (
+        INSERT INTO users (username, password, gendate, expired)
+        VALUES (%(username)s, %(password)s, %(gendate)s, FALSE)
+        ON CONFLICT (username) DO NOTHING
+        RETURNING id, username
+    )
+    -- Mise à jour incrémentale du filtre d'utilisateurs d'authenticate-user (livrée au commit ;
+    -- identique à celle du trigger users_created_notify, délivrée une seule fois)
+    SELECT id, pg_notify('users_created', username) FROM created
+"""
+
+IDEMPOTENCY_SCOPE = 'generate-password'
+
+_bulk_executor = None
 
 def generate_password(length=24):
     """Génère un mot de passe de 24 caractères composé uniquement de l'alphabet Base64url (a-z, A-Z, 0-9, _-) pour éviter tout problème de copie ou d'encodage."""
@@ -16,88 +72,191 @@ def generate_password(length=24):
         if len(pwd) == length:
             return pwd
 
-def get_db_connection():
-    """Établit une connexion à la base de données PostgreSQL"""
-    # Mot de passe : d'abord depuis la variable d'environnement, sinon depuis le secret monté
-    db_password = os.getenv('DB_PASSWORD')
-    if db_password is None:
-        paths = [
-            '/var/openfaas/secrets/DB_PASSWORD',  # clé unique recommandée
-            '/var/openfaas/secrets/db-creds'      # ancien chemin (nom du secret)
-        ]
-        for p in paths:
-            try:
-                with open(p, 'r', encoding='utf-8') as fp:
-                    db_password = fp.read().strip()
-                    break
-            except FileNotFoundError:
-                continue
+def generate_passwords(n):
+    """n mots de passe de 24 caractères Base64url, tirés d'un seul appel à l'entropie système"""
+    entropy = secrets.token_bytes(18 * n)
+    return [base64.urlsafe_b64encode(entropy[i:i + 18]).decode() for i in range(0, 18 * n, 18)]
+
+def bulk_executor():
+    """Threads de hachage du mode lot (les hashs passent par le pool de passwords)"""
+    global _bulk_executor
+    if _bulk_executor is None:
+        _bulk_executor = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix='password-bulk')
+    return _bulk_executor
+
+def hash_or_busy(password):
+    try:
+        return hash_password(password)
+    except Overloaded:
+        return None
+
+def provision_chunk(conn, chunk, qr_format):
+    """
+    Crée les comptes d'un lot dans une transaction ; renvoie les lignes NDJSON
+    dans l'ordre du lot et le nombre de comptes créés.
+    """
+    errors = {}
+    pending = {}  # nom -> mot de passe attribué, premier exemplaire du nom dans le lot
+    for i, (username, error) in enumerate(chunk):
+        if error is None and not username:
+            error = "Username is required"
+        elif error is None and username in pending:
+            error = f"User '{username}' already exists"
+        if error is not None:
+            errors[i] = error
         else:
-            db_password = 'password'
-
-    return psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'mspr_db'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=db_password,
-        port=os.getenv('DB_PORT', '5432')
-    )
+            pending[username] = None
+
+    passwords = generate_passwords(len(pending))
+    with metrics.phase('hash_password'):
+        hashes = list(bulk_executor().map(hash_or_busy, passwords))
+    now = datetime.now()
+    rows = []
+    for username, password, hashed in zip(list(pending), passwords, hashes):
+        if hashed is None:
+            del pending[username]  # file de hachage pleine : réponse "Server busy" pour ce nom
+        else:
+            pending[username] = password
+            rows.append((username, hashed, now, False))
+
+    created = {}
+    if rows:
+        with metrics.phase('insert'):
+            cur = conn.cursor()
+            created = {name: user_id for user_id, name in
+                       execute_values(cur, INSERT_BULK, rows, page_size=len(rows), fetch=True)}
+            if created:
+                # Filtre d'utilisateurs d'authenticate-user, livré au commit comme en mode unitaire
+                cur.execute(NOTIFY_BULK, (list(created),))
+            conn.commit()
+            cur.close()
+
+    lines = []
+    for i, (username, _) in enumerate(chunk):
+        if i in errors:
+            result = bulk.failure(username, errors[i])
+        elif username not in pending:
+            result = bulk.failure(username, "Server busy, please retry")
+        elif username not in created:
+            result = bulk.failure(username, f"User '{username}' already exists")
+        else:
+            password = pending.pop(username)  # une seule ligne de succès par nom
+            result = {"success": True, "user_id": created[username], "username": username,
+                      "password": password, "gendate": now.isoformat()}
+            if qr_format:
+                started = metrics.clock()
+                result["qrcode"] = qr.render(password, qr_format)
+                metrics.since('qr', started)
+                result["qr_format"] = qr_format
+        lines.append(bulk.line(result))
+    return b''.join(lines), len(created)
 
-def hash_password(password):
-    """Hash le mot de passe avec SHA-512"""
-    return hashlib.sha512(password.encode()).hexdigest()
+def handle_bulk(event, items, qr_format=''):
+    """Création en lot : liste "usernames" ou corps NDJSON ; QR codes seulement si qr_format est donné"""
+    if RATE_LIMITER is not None:
+        denied = RATE_LIMITER.check(event)
+        if denied is not None:
+            return denied
+    if qr_format:
+        qr_format = qr.negotiate(event, qr_format)  # ValidationError si le format est inconnu
+    return bulk.response(bulk.stream(
+        items, lambda conn, chunk: provision_chunk(conn, chunk, qr_format),
+        BULK_CHUNK, BULK_MAX, log, 'password.bulk_generated'))
 
 def handle(event, context):
+    conn = claimed = None
     try:
         # ---------- Lecture du corps ----------
-        body = json.loads(getattr(event, 'body', '') or '{}')
-        username = body.get('username', '').strip()
+        if bulk.is_ndjson(event):
+            return handle_bulk(event, *bulk.ndjson_request(event))
+        data = codec.loads(getattr(event, 'body', None))
+        if isinstance(data, dict) and 'usernames' in data:
+            return handle_bulk(event, *bulk.list_request(data, BULK_MAX))
+        username, qr_format = CreateRequest.from_dict(data)
+        qr_format = qr.negotiate(event, qr_format)
+
+        # Refus avant tout hash ou accès base
+        if RATE_LIMITER is not None:
+            denied = RATE_LIMITER.check(event, username)
+            if denied is not None:
+                return denied
         if not username:
-            return {"statusCode": 400,
-                    "body": json.dumps({"error": "Username is required", "success": False})}
+            return USERNAME_REQUIRED
+
+        idempotency_key = idempotency.key_from(event)
 
-        # ---------- Connexion & vérif ----------
-        conn = get_db_connection()
+        # ---------- Connexion & réservation de la clé d'idempotence ----------
+        with metrics.phase('db_connect'):
+            conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT 1 FROM users WHERE username=%s", (username,))
-        if cur.fetchone():
-            cur.close(); conn.close()
-            return {"statusCode": 409,
-                    "body": json.dumps({"error": f"User '{username}' already exists", "success": False})}
+        if idempotency_key is not None:
+            # Réservation validée seule : ni transaction ni verrou ouverts pendant
+            # le hash et le QR code ; une requête concurrente portant la même clé
+            # reçoit 409 sans attendre
+            with metrics.phase('idempotency'):
+                replay = idempotency.claim(cur, IDEMPOTENCY_SCOPE, idempotency_key, username)
+                conn.commit()
+            if replay is not None:
+                return replay
+            claimed = idempotency_key
 
         # ---------- Génération ----------
         password = generate_password()
-        hashed = hash_password(password)
+        started = metrics.clock()
+        hashed = hash_password(password)  # format courant ($scrypt$...), calculé hors du thread
+        metrics.since('hash_password', started)
         now = datetime.now()
-        cur.execute(
-            """INSERT INTO users (username, password, gendate, expired)
-               VALUES (%s, %s, %s, %s) RETURNING id""",
-            (username, hashed, now, False))
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close(); conn.close()
 
         # ---------- QR Code ----------
-        buf = io.BytesIO()
-        qrcode.make(password).save(buf, format="PNG")
-        qr_b64 = base64.b64encode(buf.getvalue()).decode()
+        started = metrics.clock()
+        qr_code = qr.render(password, qr_format)
+        metrics.since('qr', started)
 
-        return {"statusCode": 200,
-                "body": json.dumps({
+        # ---------- Création ----------
+        # Sans clé : une seule instruction, validée seule (autocommit, ou transaction
+        # explicite derrière un pooler) ; avec clé : INSERT et réponse validés
+        # ensemble dans une seconde transaction courte
+        unit = transaction(conn) if idempotency_key is None else nullcontext()
+        with metrics.phase('insert'), unit:
+            cur.execute(CREATE_USER, {'username': username, 'password': hashed, 'gendate': now})
+            created = cur.fetchone()
+            if created is None:
+                response = codec.error(409, f"User '{username}' already exists")
+            else:
+                response = codec.response(200, {
                     "success": True,
-                    "user_id": user_id,
+                    "user_id": created[0],
                     "username": username,
                     "password": password,        # ↙︎ à enlever en prod
                     "gendate": now.isoformat(),
-                    "qrcode": qr_b64
-                })}
+                    "qrcode": qr_code,
+                    "qr_format": qr_format
+                })
+            if idempotency_key is not None:
+                # Un rejeu renvoie la même réponse, 409 compris
+                idempotency.store(cur, IDEMPOTENCY_SCOPE, idempotency_key, response)
+                conn.commit()
+                claimed = None
+        cur.close()
+        if created is not None:
+            jsonlog.event(log, 'password.generated', user_id=created[0])
+        return response
 
+    except Overloaded:
+        return SERVER_BUSY
     except psycopg2.Error as e:
-        return {"statusCode": 500,
-                "body": json.dumps({"error": f"Database error: {e}", "success": False})}
-    except json.JSONDecodeError:
-        return {"statusCode": 400,
-                "body": json.dumps({"error": "Invalid JSON in request body", "success": False})}
+        jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(e))
+        return codec.error(500, f"Database error: {e}")
+    except codec.DecodeError:
+        return codec.INVALID_JSON
+    except codec.ValidationError as e:
+        return codec.error(400, str(e))
     except Exception as e:
-        return {"statusCode": 500,
-                "body": json.dumps({"error": f"Internal server error: {e}", "success": False})}
\ No newline at end of file
+        log.error('internal error', exc_info=e)
+        return codec.error(500, f"Internal server error: {e}")
+    finally:
+        if claimed is not None:
+            # Échec après la réservation : clé libérée pour le prochain essai
+            idempotency.release(conn, IDEMPOTENCY_SCOPE, claimed)
+        if conn is not None:
+            conn.close()
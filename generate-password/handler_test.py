@@ -1,10 +1,187 @@
-from .handler import handle
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')  # hash calculés dans le thread de test
+from handler import handle, generate_password
 
-# Test your handler here
+class TestGeneratePassword(unittest.TestCase):
 
-# To disable testing, you can set the build_arg `TEST_ENABLED=false` on the CLI or in your stack.yml
-# https://docs.openfaas.com/reference/yaml/#function-build-args-build-args
+    def test_generate_password(self):
+        """Mot de passe de 24 caractères Base64url"""
+        password = generate_password()
+        self.assertEqual(len(password), 24)
+        self.assertNotEqual(password, generate_password())
 
-def test_handle():
-    # assert handle("input") == "input"
-    pass
+    def test_handle_missing_username(self):
+        """Test avec username manquant"""
+        event = MagicMock()
+        event.body = json.dumps({})
+
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 400)
+        self.assertIn("Username is required", json.loads(result["body"])["error"])
+
+    @patch('handler.get_db_connection')
+    def test_handle_user_exists(self, mock_db):
+        """Utilisateur existant : 409 et connexion rendue au pool"""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = None  # ON CONFLICT DO NOTHING : aucune ligne
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.headers = {}
+        event.body = json.dumps({"username": "existing"})
+
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 409)
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        mock_conn.close.assert_called()
+
+    @patch('db.TRANSACTION_POOLING', False)  # comportement du mode session
+    @patch('handler.get_db_connection')
+    def test_handle_stores_prefixed_hash(self, mock_db):
+        """Le hash stocké est au format versionné, jamais le mot de passe en clair"""
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (42, '')
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.headers = {}
+        event.body = json.dumps({"username": "newuser"})
+
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        body = json.loads(result["body"])
+        # Une seule instruction (INSERT + pg_notify), validée en autocommit
+        (statement, params), = [c.args for c in mock_cursor.execute.call_args_list]
+        self.assertIn("ON CONFLICT (username) DO NOTHING", statement)
+        self.assertIn("pg_notify('users_created'", statement)
+        self.assertEqual(params["username"], "newuser")
+        self.assertTrue(params["password"].startswith("$scrypt$v=1$"))
+        self.assertNotIn(body["password"], params["password"])
+        self.assertTrue(mock_conn.autocommit)
+        mock_conn.commit.assert_not_called()
+
+    @patch('handler.get_db_connection')
+    def test_handle_idempotency_key_replays_original_response(self, mock_db):
+        """Même Idempotency-Key : réponse d'origine rejouée, aucun nouveau mot de passe"""
+        stored = {}
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        def execute(statement, params=None):
+            if "INSERT INTO idempotency_keys" in statement:
+                mock_cursor.fetchone.return_value = None if stored else (1,)
+            elif "SELECT fingerprint" in statement:
+                mock_cursor.fetchone.return_value = ("newuser", stored["status"], stored["body"])
+            elif "UPDATE idempotency_keys" in statement:
+                stored["status"], stored["body"] = params[0], params[1].adapted
+            elif "INSERT INTO users" in statement:
+                mock_cursor.fetchone.return_value = (42, '')
+        mock_cursor.execute.side_effect = execute
+
+        event = MagicMock()
+        event.headers = {"Idempotency-Key": "retry-1"}
+        event.body = json.dumps({"username": "newuser"})
+
+        commits_before_hash = []
+        with patch('handler.hash_password', side_effect=lambda password: (
+                commits_before_hash.append(mock_conn.commit.call_count), "$scrypt$v=1$x")[1]):
+            first = handle(event, MagicMock())
+        self.assertEqual(commits_before_hash, [1])  # réservation validée avant le hash
+        self.assertEqual(mock_conn.commit.call_count, 2)  # puis INSERT et réponse ensemble
+        with patch('handler.hash_password') as mock_hash:
+            replay = handle(event, MagicMock())
+            mock_hash.assert_not_called()
+        self.assertEqual(replay["statusCode"], 200)
+        self.assertEqual(replay["body"], first["body"])
+        self.assertEqual(replay["headers"]["Idempotent-Replayed"], "true")
+
+        event.body = json.dumps({"username": "otheruser"})
+        self.assertEqual(handle(event, MagicMock())["statusCode"], 422)
+
+    @patch('handler.get_db_connection')
+    def test_handle_idempotency_key_released_on_failure(self, mock_db):
+        """Échec après la réservation : la clé est libérée pour le prochain essai"""
+        from passwords import Overloaded
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = (1,)
+        mock_conn.cursor.return_value = mock_cursor
+        mock_db.return_value = mock_conn
+
+        event = MagicMock()
+        event.headers = {"Idempotency-Key": "retry-2"}
+        event.body = json.dumps({"username": "newuser"})
+        with patch('handler.hash_password', side_effect=Overloaded("busy")):
+            result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 503)
+        statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        self.assertTrue(statements[-1].startswith("DELETE FROM idempotency_keys"))
+        self.assertEqual(mock_cursor.execute.call_args.args[1], ("generate-password", "retry-2"))
+        self.assertFalse(any("INSERT INTO users" in statement for statement in statements))
+        mock_conn.close.assert_called_once()
+
+    @patch('handler.execute_values')
+    @patch('bulk.get_db_connection')
+    def test_handle_bulk_streams_ndjson_in_order(self, mock_db, mock_execute_values):
+        """Mode lot : un INSERT par transaction, une ligne NDJSON par nom, dans l'ordre"""
+        mock_conn = MagicMock()
+        mock_db.return_value = mock_conn
+        mock_execute_values.return_value = [(1, "alice"), (3, "carol")]  # "bob" existe déjà
+
+        event = MagicMock()
+        event.headers = {}
+        event.body = json.dumps({"usernames": ["alice", "bob", "carol", "alice", 7, ""]})
+        result = handle(event, MagicMock())
+
+        self.assertEqual(result["headers"]["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b''.join(result["body"]).splitlines()]
+        self.assertEqual([line["success"] for line in lines], [True, False, True, False, False, False])
+        self.assertEqual([lines[0]["user_id"], lines[2]["user_id"]], [1, 3])
+        self.assertEqual(len(lines[0]["password"]), 24)
+        self.assertNotIn("qrcode", lines[0])
+        self.assertIn("already exists", lines[1]["error"])
+        self.assertIn("already exists", lines[3]["error"])
+        self.assertEqual(lines[4]["error"], "username must be a string")
+        self.assertEqual(lines[5]["error"], "Username is required")
+        rows = mock_execute_values.call_args.args[2]
+        self.assertEqual([row[0] for row in rows], ["alice", "bob", "carol"])
+        mock_conn.commit.assert_called_once()
+        mock_conn.close.assert_called_once()
+
+    @patch('handler.BULK_CHUNK', 2)
+    @patch('handler.execute_values')
+    @patch('bulk.get_db_connection')
+    def test_handle_bulk_ndjson_chunked_transactions(self, mock_db, mock_execute_values):
+        """Corps NDJSON : une transaction par tranche de BULK_CHUNK noms"""
+        mock_conn = MagicMock()
+        mock_db.return_value = mock_conn
+        mock_execute_values.side_effect = lambda cur, sql, rows, **kw: [(i, row[0]) for i, row in enumerate(rows)]
+
+        event = MagicMock()
+        event.headers = {"Content-Type": "application/x-ndjson"}
+        event.query = {"qr_format": "matrix"}
+        event.body = b'{"username": "u1"}\n{"username": "u2"}\n\nnot json\n{"username": "u3"}\n'
+        chunks = list(handle(event, MagicMock())["body"])
+
+        self.assertEqual(len(chunks), 2)
+        lines = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertEqual([line["success"] for line in lines], [True, True, False, True])
+        self.assertEqual(lines[2]["error"], "Invalid JSON line")
+        self.assertEqual(lines[0]["qr_format"], "matrix")
+        self.assertEqual(mock_conn.commit.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
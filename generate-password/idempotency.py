@@ -0,0 +1,108 @@
+"""
+Clés d'idempotence (en-tête `Idempotency-Key`) : une requête rejouée par la
+passerelle ou le client renvoie la réponse d'origine au lieu de créer un
+nouveau mot de passe.
+
+La clé est réservée par un INSERT validé aussitôt, avant le hash : une
+requête concurrente portant la même clé lit une réservation sans réponse et
+reçoit 409 au lieu d'attendre. Réponse et création du compte sont validées
+ensemble dans une seconde transaction ; un échec entre les deux libère la
+réservation (au pire, elle expire).
+
+Les clés expirent après IDEMPOTENCY_TTL secondes (600) : une clé expirée est
+reprise par la requête suivante, et les lignes expirées sont supprimées au
+plus une fois par IDEMPOTENCY_CLEANUP_INTERVAL secondes (60) et par processus.
+La réponse enregistrée contient le mot de passe généré : garder un TTL court.
+"""
+
+import os
+import threading
+import time
+
+import psycopg2
+
+import codec
+
+HEADER = 'Idempotency-Key'
+TTL = int(os.getenv('IDEMPOTENCY_TTL', '600'))
+CLEANUP_INTERVAL = float(os.getenv('IDEMPOTENCY_CLEANUP_INTERVAL', '60'))
+
+# Réserve la clé ; une clé expirée est reprise, une clé valide ne renvoie rien
+CLAIM = """
+    INSERT INTO idempotency_keys (scope, key, fingerprint, created_at)
+    VALUES (%(scope)s, %(key)s, %(fingerprint)s, NOW())
+    ON CONFLICT (scope, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint, status = NULL, response = NULL, created_at = NOW()
+    WHERE idempotency_keys.created_at < NOW() - %(ttl)s * INTERVAL '1 second'
+    RETURNING 1
+"""
+REPLAY = "SELECT fingerprint, status, response FROM idempotency_keys WHERE scope = %s AND key = %s"
+RELEASE = "DELETE FROM idempotency_keys WHERE scope = %s AND key = %s AND status IS NULL"
+STORE = "UPDATE idempotency_keys SET status = %s, response = %s WHERE scope = %s AND key = %s"
+CLEANUP = "DELETE FROM idempotency_keys WHERE created_at < NOW() - %s * INTERVAL '1 second'"
+
+KEY_REUSED = codec.error(422, "Idempotency-Key already used for a different request")
+IN_PROGRESS = codec.error(409, "A request with this Idempotency-Key is already in progress")
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def key_from(event):
+    """Clé d'idempotence de la requête, ou None sans en-tête"""
+    headers = getattr(event, 'headers', None)
+    key = headers.get(HEADER) if headers is not None else None
+    if not isinstance(key, str) or not key.strip():
+        return None
+    key = key.strip()
+    if len(key) > 255:
+        raise codec.ValidationError("Idempotency-Key must be at most 255 characters")
+    return key
+
+
+def claim(cursor, scope, key, fingerprint):
+    """
+    Réserve la clé, à valider aussitôt par l'appelant. Renvoie None si la
+    requête doit s'exécuter, sinon la réponse à renvoyer telle quelle (rejeu,
+    clé réutilisée pour une autre requête, requête encore en cours).
+    """
+    maybe_cleanup(cursor)
+    cursor.execute(CLAIM, {'scope': scope, 'key': key, 'fingerprint': fingerprint, 'ttl': TTL})
+    if cursor.fetchone() is not None:
+        return None
+    cursor.execute(REPLAY, (scope, key))
+    stored_fingerprint, status, response = cursor.fetchone()
+    if stored_fingerprint != fingerprint:
+        return KEY_REUSED
+    if status is None:
+        return IN_PROGRESS
+    return {"statusCode": status, "headers": {"Idempotent-Replayed": "true"}, "body": bytes(response)}
+
+
+def store(cursor, scope, key, response):
+    """Enregistre la réponse avec la clé (même transaction que la création)"""
+    cursor.execute(STORE, (response["statusCode"], psycopg2.Binary(response["body"]), scope, key))
+
+
+def release(conn, scope, key):
+    """Supprime une réservation restée sans réponse ; en cas d'échec, elle expirera après TTL"""
+    try:
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute(RELEASE, (scope, key))
+        conn.commit()
+    except psycopg2.Error:
+        pass
+
+
+def maybe_cleanup(cursor):
+    """Supprime les clés expirées, au plus une fois par CLEANUP_INTERVAL"""
+    global _last_cleanup
+    now = time.monotonic()
+    if now - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    with _cleanup_lock:
+        if now - _last_cleanup < CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+    cursor.execute(CLEANUP, (TTL,))
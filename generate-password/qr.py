@@ -0,0 +1,153 @@
+"""
+Rendu des QR codes (generate-2fa, generate-password), au format négocié par
+requête : champ `qr_format` du corps, sinon en-tête `Accept`, sinon
+QR_DEFAULT_FORMAT.
+
+- "png" : image PNG 1 bit en base64, écrite directement (zlib) sans PIL,
+  dans le thread de la requête (le calcul tient le GIL : un pool de threads
+  n'ajouterait qu'un aller-retour) ;
+- "svg" : un seul chemin SVG, une commande par suite de modules noirs ;
+- "matrix" : modules bruts, une chaîne de "0"/"1" par ligne, sans marge.
+
+Les formats sont enregistrés dans RENDERERS (`register`), chacun recevant la
+matrice de modules calculée une seule fois par qrcode et la marge demandée.
+
+Variables d'environnement : QR_DEFAULT_FORMAT (png), QR_BORDER (marge en
+modules, sinon celle de l'appelant : 4, ou 5 pour generate-2fa),
+QR_PNG_BOX_SIZE (10 pixels par module), QR_PNG_COMPRESS (niveau zlib, 6).
+"""
+
+import base64
+import os
+import struct
+import zlib
+from itertools import groupby
+
+import codec
+
+DEFAULT_FORMAT = os.getenv('QR_DEFAULT_FORMAT', 'png')
+BORDER = int(os.getenv('QR_BORDER', '4'))
+PNG_BOX_SIZE = int(os.getenv('QR_PNG_BOX_SIZE', '10'))
+PNG_COMPRESS = int(os.getenv('QR_PNG_COMPRESS', '6'))
+
+# format -> fonction(matrice, marge) renvoyant la valeur JSON du QR code
+RENDERERS = {}
+# type de média (en-tête Accept) -> format
+MEDIA_TYPES = {}
+
+
+def register(name, media_type):
+    """Décorateur : ajoute un format de rendu, sélectionnable par nom ou par type de média"""
+    def decorator(render):
+        RENDERERS[name] = render
+        MEDIA_TYPES[media_type] = name
+        return render
+    return decorator
+
+
+def modules(data):
+    """Matrice de modules (listes de booléens, True = noir), sans marge"""
+    import qrcode  # import différé : seul le calcul de la matrice en a besoin (PIL si installé)
+    qr = qrcode.QRCode(border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+@register('matrix', 'application/x-qr-matrix')
+def render_matrix(matrix, border=None):
+    return [''.join('1' if dark else '0' for dark in row) for row in matrix]
+
+
+@register('svg', 'image/svg+xml')
+def render_svg(matrix, border=None):
+    border = BORDER if border is None else border
+    size = len(matrix) + 2 * border
+    path = []
+    for y, row in enumerate(matrix, start=border):
+        x = border
+        for dark, run in groupby(row):
+            width = sum(1 for _ in run)
+            if dark:
+                path.append(f"M{x} {y}h{width}v1h-{width}z")
+            x += width
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<path fill="#fff" d="M0 0h{size}v{size}H0z"/><path d="{"".join(path)}"/></svg>')
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(matrix, box_size=None, border=None, compress_level=None):
+    """PNG niveaux de gris 1 bit (1 = blanc) : une ligne de balayage par ligne de pixels"""
+    box_size = PNG_BOX_SIZE if box_size is None else box_size
+    border = BORDER if border is None else border
+    compress_level = PNG_COMPRESS if compress_level is None else compress_level
+    side = (len(matrix) + 2 * border) * box_size
+    padding = -side % 8  # bits de remplissage en fin de ligne, blancs
+    nbytes = (side + padding) // 8
+    quiet = b'\0' + b'\xff' * nbytes
+    margin = '1' * (border * box_size)
+    raw = [quiet * (border * box_size)]
+    for row in matrix:
+        bits = margin + ''.join(('0' if dark else '1') * box_size for dark in row) + margin + '1' * padding
+        raw.append((b'\0' + int(bits, 2).to_bytes(nbytes, 'big')) * box_size)
+    raw.append(quiet * (border * box_size))
+    return (b'\x89PNG\r\n\x1a\n'
+            + _chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 1, 0, 0, 0, 0))
+            + _chunk(b'IDAT', zlib.compress(b''.join(raw), compress_level))
+            + _chunk(b'IEND', b''))
+
+
+@register('png', 'image/png')
+def render_png(matrix, border=None):
+    return base64.b64encode(encode_png(matrix, border=border)).decode()
+
+
+def accepted(accept):
+    """{format: q} des types connus de l'en-tête Accept ; q=0 (ou invalide) refuse le format"""
+    weights = {}
+    for media_range in accept.split(','):
+        media_type, *params = media_range.split(';')
+        name = MEDIA_TYPES.get(media_type.strip().lower())
+        if name is None:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = max(q, weights.get(name, 0.0))
+    return weights
+
+
+def negotiate(event, requested=''):
+    """
+    Format demandé : champ du corps, sinon type connu de plus fort q dans
+    l'en-tête Accept (à égalité, le premier cité), sinon QR_DEFAULT_FORMAT
+    s'il n'est pas refusé (q=0).
+    """
+    if requested:
+        if requested not in RENDERERS:
+            raise codec.ValidationError(f"qr_format must be one of {', '.join(sorted(RENDERERS))}")
+        return requested
+    headers = getattr(event, 'headers', None)
+    accept = headers.get('Accept') if headers is not None else None
+    if not isinstance(accept, str):
+        return DEFAULT_FORMAT
+    weights = accepted(accept)
+    best = max(weights, key=weights.get, default=None)  # max garde le premier à égalité
+    if best is not None and weights[best] > 0:
+        return best
+    if weights.get(DEFAULT_FORMAT, 1.0) > 0:
+        return DEFAULT_FORMAT
+    return next((name for name in RENDERERS if weights.get(name, 1.0) > 0), DEFAULT_FORMAT)
+
+
+def render(data, fmt=None, border=None):
+    """Valeur JSON du QR code de `data` au format `fmt`, marge `border` (sinon QR_BORDER)"""
+    return RENDERERS[fmt or DEFAULT_FORMAT](modules(data), border)
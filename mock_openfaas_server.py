@@ -9,9 +9,18 @@ from flask_cors import CORS
 import sys
 import os
 import json
+import logging
 
 # Importer les fonctions directement depuis simple_test.py
 sys.path.append(os.path.dirname(__file__))
+# Modules partagés des fonctions (db.py, ...)
+for _fn in ('generate-password', 'generate-2fa', 'authenticate-user'):
+    sys.path.append(os.path.join(os.path.dirname(__file__), _fn))
+
+import jsonlog  # noqa: E402  journaux JSON (module partagé des fonctions)
+
+jsonlog.configure()
+log = logging.getLogger('mock-openfaas')
 
 # Import des fonctions depuis les modules
 exec(open('generate-password/handler.py').read(), globals())
@@ -30,6 +39,12 @@ def format_json_request(data):
     """Convertir les données de requête en format JSON string pour les handlers"""
     return json.dumps(data).encode('utf-8')
 
+def decode_result(result):
+    """Corps bytes (codec.py) remis en texte pour la réponse JSON du mock"""
+    if isinstance(result, dict) and isinstance(result.get('body'), bytes):
+        return dict(result, body=result['body'].decode('utf-8'))
+    return result
+
 @app.route('/function/generate-password', methods=['POST'])
 def generate_password():
     """Endpoint pour la génération de mot de passe"""
@@ -38,7 +53,9 @@ def generate_password():
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
             
-        print(f"📝 generate-password appelé avec: {data}")
+        jsonlog.bind_request(request.headers)
+        # Clés seulement : le corps contient des mots de passe
+        jsonlog.event(log, 'mock.call', level=logging.DEBUG, function='generate-password', keys=sorted(data) if isinstance(data, dict) else None)
             
         # Simuler l'objet req d'OpenFaaS
         class MockReq:
@@ -50,9 +67,10 @@ def generate_password():
         req = MockReq(format_json_request(data))
         # Ajouter un contexte vide
         context = {}
-        result = handle(req, context)
+        result = decode_result(handle(req, context))
         
-        print(f"🔄 Résultat brut: {result}")
+        jsonlog.event(log, 'mock.result', level=logging.DEBUG,
+                      status=result.get('statusCode') if isinstance(result, dict) else None)
         
         # Parser le résultat (peut être dict ou string JSON)
         if isinstance(result, dict):
@@ -70,7 +88,7 @@ def generate_password():
         return parsed, 200
             
     except Exception as e:
-        print(f"❌ Erreur generate-password: {e}")
+        jsonlog.event(log, 'mock.error', level=logging.ERROR, function='generate-password', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/function/generate-2fa', methods=['POST'])
@@ -81,7 +99,9 @@ def generate_2fa():
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
             
-        print(f"📝 generate-2fa appelé avec: {data}")
+        jsonlog.bind_request(request.headers)
+        # Clés seulement : le corps contient des mots de passe
+        jsonlog.event(log, 'mock.call', level=logging.DEBUG, function='generate-2fa', keys=sorted(data) if isinstance(data, dict) else None)
             
         # Simuler l'objet req d'OpenFaaS
         class MockReq:
@@ -93,9 +113,10 @@ def generate_2fa():
         req = MockReq(format_json_request(data))
         # Ajouter un contexte vide
         context = {}
-        result = handle(req, context)
+        result = decode_result(handle(req, context))
         
-        print(f"🔄 Résultat brut: {result}")
+        jsonlog.event(log, 'mock.result', level=logging.DEBUG,
+                      status=result.get('statusCode') if isinstance(result, dict) else None)
         
         # Parser le résultat (peut être dict ou string JSON)
         if isinstance(result, dict):
@@ -115,7 +136,7 @@ def generate_2fa():
         return parsed, 200
             
     except Exception as e:
-        print(f"❌ Erreur generate-2fa: {e}")
+        jsonlog.event(log, 'mock.error', level=logging.ERROR, function='generate-2fa', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/function/authenticate-user', methods=['POST'])
@@ -126,7 +147,9 @@ def authenticate_user():
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
             
-        print(f"📝 authenticate-user appelé avec: {data}")
+        jsonlog.bind_request(request.headers)
+        # Clés seulement : le corps contient des mots de passe
+        jsonlog.event(log, 'mock.call', level=logging.DEBUG, function='authenticate-user', keys=sorted(data) if isinstance(data, dict) else None)
             
         # Simuler l'objet req d'OpenFaaS
         class MockReq:
@@ -138,9 +161,10 @@ def authenticate_user():
         req = MockReq(format_json_request(data))
         # Ajouter un contexte vide
         context = {}
-        result = handle(req, context)
+        result = decode_result(handle(req, context))
         
-        print(f"🔄 Résultat brut: {result}")
+        jsonlog.event(log, 'mock.result', level=logging.DEBUG,
+                      status=result.get('statusCode') if isinstance(result, dict) else None)
         
         # Parser le résultat et gérer les codes d'erreur
         try:
@@ -180,7 +204,7 @@ def authenticate_user():
             return {"error": result}, 500
             
     except Exception as e:
-        print(f"❌ Erreur authenticate-user: {e}")
+        jsonlog.event(log, 'mock.error', level=logging.ERROR, function='authenticate-user', error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/system/functions', methods=['GET'])
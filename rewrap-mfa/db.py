@@ -0,0 +1,645 @@
+"""
+Pool de connexions PostgreSQL partagé par les fonctions MSPR
+(authenticate-user, generate-2fa, generate-password, expire-accounts, rewrap-mfa).
+
+Le pool est créé au premier appel puis conservé au niveau du module : un
+réplica "chaud" réutilise ses connexions au lieu de refaire la poignée de
+main TCP + authentification à chaque requête.
+
+Lectures sur réplicas (DB_REPLICA_HOSTS="hote[:port],...") : une lecture qui
+tolère un retard demande `get_db_connection(readonly=True)` et reçoit une
+connexion d'un réplica sain (tourniquet, un pool par réplica), sinon du
+primaire. Un réplica injoignable ou en retard de plus de DB_REPLICA_MAX_LAG
+secondes est écarté DB_REPLICA_RETRY secondes. Les écritures et les lectures
+qui doivent voir une écriture récente restent sur le primaire
+(`get_db_connection()` par défaut).
+
+Derrière un pooler en mode transaction (PgBouncer `pool_mode = transaction`,
+DB_POOL_MODE=transaction), deux transactions d'une même connexion cliente
+peuvent être servies par deux sessions serveur différentes : aucun état de
+session n'est utilisé (pas de PREPARE, de SET ni de LISTEN par le pooler),
+et le travail des handlers passe par `transaction(conn)`. Ce qui a besoin
+d'une session (LISTEN du filtre d'utilisateurs) ouvre une connexion directe
+(`connect_direct`, DB_DIRECT_HOST / DB_DIRECT_PORT).
+"""
+
+import itertools
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+import secretstore
+import tracing
+
+
+# Mode du pooler placé devant PostgreSQL : "session" (ou aucun pooler) ou "transaction"
+POOL_MODE = os.getenv('DB_POOL_MODE', 'session').strip().lower()
+if POOL_MODE not in ('session', 'transaction'):
+    raise ValueError(f"DB_POOL_MODE must be 'session' or 'transaction', not {POOL_MODE!r}")
+TRANSACTION_POOLING = POOL_MODE == 'transaction'
+
+_PARAM = re.compile(r'\$(\d+)')
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Aucune connexion disponible dans le délai imparti"""
+
+
+def get_db_password():
+    """Mot de passe : variable d'environnement, sinon secret monté (lu une fois, voir secretstore), sinon défaut"""
+    return secretstore.get('DB_PASSWORD', 'db-creds', default='password')
+
+
+def connect_direct():
+    """
+    Connexion de session à PostgreSQL lui-même, hors pooler (LISTEN, curseurs
+    longs) : DB_DIRECT_HOST / DB_DIRECT_PORT, sinon la connexion habituelle.
+    """
+    return connect(os.getenv('DB_DIRECT_HOST'), os.getenv('DB_DIRECT_PORT'))
+
+
+def has_direct_connection():
+    """Une connexion de session est disponible (pas de pooler en mode transaction, ou DB_DIRECT_HOST)"""
+    return not TRANSACTION_POOLING or bool(os.getenv('DB_DIRECT_HOST'))
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """Curseur dont chaque execute() est un span de la trace courante"""
+
+    def execute(self, query, vars=None):
+        if tracing.current_span() is None:
+            return super().execute(query, vars)
+        with tracing.span('db.execute', statement=_statement(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        if tracing.current_span() is None:
+            return super().executemany(query, vars_list)
+        with tracing.span('db.executemany', statement=_statement(query)):
+            return super().executemany(query, vars_list)
+
+
+def _statement(query):
+    """Texte SQL abrégé pour les attributs de span (jamais les paramètres)"""
+    if isinstance(query, bytes):
+        # Requête déjà composée (execute_values) : les valeurs suivent VALUES
+        query = query[:400].decode('utf-8', 'replace')
+        cut = query.upper().find('VALUES')
+        if cut >= 0:
+            query = query[:cut + 6] + ' ...'
+    return ' '.join(str(query).split())[:200]
+
+
+def connect(host=None, port=None):
+    """Ouvre une nouvelle connexion PostgreSQL (hors pool), au primaire par défaut"""
+    return psycopg2.connect(
+        host=host or os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'mspr_db'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=get_db_password(),
+        port=port or os.getenv('DB_PORT', '5432'),
+        cursor_factory=TracingCursor,
+    )
+
+
+class _Slot:
+    """Connexion physique, ses horodatages, ses requêtes préparées et sa génération"""
+
+    __slots__ = ('conn', 'created_at', 'last_used', 'prepared', 'generation')
+
+    def __init__(self, conn, generation=0):
+        self.conn = conn
+        self.created_at = self.last_used = time.monotonic()
+        self.prepared = set()
+        self.generation = generation
+
+
+class PooledConnection:
+    """
+    Proxy autour d'une connexion du pool.
+
+    Se comporte comme une connexion psycopg2, mais close() rend la connexion
+    au pool au lieu de la fermer : les handlers gardent leur
+    `cursor.close(); conn.close()` habituel.
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+
+    @property
+    def replica(self):
+        """Connexion à un réplica (lecture seule, éventuellement en retard)"""
+        return self._pool.replica
+
+    def __getattr__(self, name):
+        if self._slot is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._slot.conn, name)
+
+    @property
+    def closed(self):
+        return self._slot is None or self._slot.conn.closed
+
+    @property
+    def autocommit(self):
+        return self._slot.conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        # Attribut côté client uniquement (pas d'aller-retour serveur)
+        self._slot.conn.autocommit = value
+
+    @property
+    def prepared(self):
+        """Noms des requêtes préparées sur cette connexion physique"""
+        return self._slot.prepared
+
+    def close(self):
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool.release(slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._slot is not None and exc_type is not None:
+            self._slot.conn.rollback()
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Pool thread-safe de connexions PostgreSQL.
+
+    - taille bornée (par défaut le nombre de threads waitress),
+    - vérification de santé au checkout pour les connexions restées inactives,
+    - recyclage des connexions au-delà d'une durée de vie maximale,
+    - invalidation de toutes les connexions (changement de mot de passe),
+    - compteurs exposés par stats().
+    """
+
+    def __init__(self, connect_fn=connect, maxsize=4, timeout=5.0,
+                 max_lifetime=1800.0, check_idle=30.0, replica=False):
+        self._connect = connect_fn
+        self.replica = replica
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self._idle = deque()
+        self._size = 0
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'unhealthy': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'invalidated': 0,
+        }
+
+    # ---------- Checkout / retour ----------
+    def getconn(self):
+        """Emprunte une connexion saine (bloque au plus `timeout` secondes)"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._stats['checkouts'] += 1
+        while True:
+            slot = self._reserve(deadline)
+            if slot is None:
+                break
+            # Vérification hors du verrou : un SELECT 1 ne bloque pas les autres threads
+            if self._usable(slot):
+                slot.last_used = time.monotonic()
+                with self._cond:
+                    self._stats['reused'] += 1
+                return PooledConnection(self, slot)
+            with self._cond:
+                self._discard(slot)
+                self._cond.notify()
+
+        # Place réservée : ouverture d'une nouvelle connexion, elle aussi hors du verrou
+        generation = self._generation
+        try:
+            slot = _Slot(self._connect(), generation)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return PooledConnection(self, slot)
+
+    def _reserve(self, deadline):
+        """Retire une connexion inactive, ou réserve une place (None) pour en ouvrir une"""
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()  # LIFO : la connexion la plus chaude
+                if self._size < self.maxsize:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout("no database connection available in the pool")
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+    def release(self, slot):
+        """Remet une connexion dans le pool (appelé par PooledConnection.close)"""
+        conn = slot.conn
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+        if healthy and conn.autocommit:
+            conn.autocommit = False
+        now = time.monotonic()
+        with self._cond:
+            if not healthy:
+                self._stats['unhealthy'] += 1
+                self._discard(slot)
+            elif slot.generation != self._generation:
+                self._stats['invalidated'] += 1
+                self._discard(slot)
+            elif now - slot.created_at > self.max_lifetime:
+                self._stats['recycled'] += 1
+                self._discard(slot)
+            else:
+                slot.last_used = now
+                self._idle.append(slot)
+            self._cond.notify()
+
+    def invalidate(self):
+        """
+        Ferme les connexions inactives et marque celles en cours d'usage pour
+        être fermées à leur retour : les suivantes sont ouvertes avec la
+        configuration courante (nouveau mot de passe).
+        """
+        with self._cond:
+            self._generation += 1
+            while self._idle:
+                self._stats['invalidated'] += 1
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def closeall(self):
+        """Ferme toutes les connexions inactives"""
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def stats(self):
+        """Instantané des compteurs du pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['maxsize'] = self.maxsize
+        return stats
+
+    # ---------- Interne ----------
+    def _usable(self, slot):
+        """Connexion ouverte, pas trop vieille, et qui répond si elle a dormi"""
+        conn = slot.conn
+        now = time.monotonic()
+        if conn.closed:
+            self._count('unhealthy')
+            return False
+        if now - slot.created_at > self.max_lifetime:
+            self._count('recycled')
+            return False
+        if slot.generation != self._generation:
+            self._count('invalidated')
+            return False
+        if now - slot.last_used > self.check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                self._count('unhealthy')
+                return False
+        return True
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _discard(self, slot):
+        """Ferme une connexion et libère sa place (verrou tenu)"""
+        self._size -= 1
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool du processus, créé au premier appel à partir de l'environnement"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    maxsize=int(os.getenv('DB_POOL_MAX', os.getenv('WAITRESS_THREADS', '4'))),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                    max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+                    check_idle=float(os.getenv('DB_POOL_CHECK_IDLE', '30')),
+                )
+                # Secret DB_PASSWORD remplacé : les connexions ouvertes avec l'ancien sont recyclées
+                secretstore.on_change(('DB_PASSWORD',), lambda names: _pool.invalidate())
+    return _pool
+
+
+class _Replica:
+    """Pool d'un réplica et son état de santé (verrou du routeur tenu pour l'écriture)"""
+
+    __slots__ = ('name', 'pool', 'down_until', 'checked_at', 'lag')
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag = 0.0
+
+
+class ReplicaRouter:
+    """
+    Choix de la connexion d'une lecture tolérante au retard : réplicas sains
+    en tourniquet, puis primaire en dernier recours.
+
+    - un échec de connexion (ou un pool épuisé) écarte le réplica `retry`
+      secondes ;
+    - le retard de réplication est mesuré au plus toutes les `check_interval`
+      secondes par réplica, à l'emprunt ; au-delà de `max_lag` secondes le
+      réplica est écarté comme s'il était en panne ;
+    - stats() compte les lectures servies par réplica / primaire et les
+      bascules.
+    """
+
+    LAG_QUERY = (
+        "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+        " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+    )
+
+    def __init__(self, primary, replicas, max_lag=1.0, retry=30.0, check_interval=5.0):
+        self.primary = primary
+        self.max_lag = max_lag
+        self.retry = retry
+        self.check_interval = check_interval
+        self._replicas = [_Replica(name, pool) for name, pool in replicas]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {
+            'primary': 0,
+            'replica': 0,
+            'fallback': 0,
+            'replica_errors': 0,
+            'replica_lagging': 0,
+            'primary_rereads': 0,
+        }
+
+    def getconn(self, readonly=False):
+        """Connexion du primaire, ou d'un réplica sain si `readonly`"""
+        if readonly:
+            for replica in self._candidates():
+                conn = self._try_replica(replica)
+                if conn is not None:
+                    self._count('replica')
+                    return conn
+            if self._replicas:
+                self._count('fallback')
+        self._count('primary')
+        return self.primary.getconn()
+
+    def reread(self):
+        """Connexion du primaire pour relire ce qu'un réplica n'a peut-être pas encore reçu"""
+        self._count('primary_rereads')
+        return self.primary.getconn()
+
+    def _candidates(self):
+        """Réplicas disponibles, à partir du suivant dans le tourniquet"""
+        if not self._replicas:
+            return []
+        now = time.monotonic()
+        start = next(self._next) % len(self._replicas)
+        ordered = self._replicas[start:] + self._replicas[:start]
+        return [replica for replica in ordered if replica.down_until <= now]
+
+    def _try_replica(self, replica):
+        """Connexion au réplica s'il répond et n'est pas trop en retard, sinon None (réplica écarté)"""
+        try:
+            conn = replica.pool.getconn()
+        except (psycopg2.OperationalError, PoolTimeout):
+            self._mark_down(replica, 'replica_errors')
+            return None
+        if time.monotonic() - replica.checked_at < self.check_interval:
+            return conn
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self.LAG_QUERY)
+                lag = float(cur.fetchone()[0])
+            conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            self._mark_down(replica, 'replica_errors')
+            return None
+        with self._lock:
+            replica.checked_at = time.monotonic()
+            replica.lag = lag
+        if lag > self.max_lag:
+            conn.close()
+            self._mark_down(replica, 'replica_lagging')
+            return None
+        return conn
+
+    def _mark_down(self, replica, reason):
+        with self._lock:
+            replica.down_until = time.monotonic() + self.retry
+            replica.checked_at = 0.0  # retard remesuré au retour
+            self._stats[reason] += 1
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        """Instantané des compteurs de routage et de l'état des réplicas"""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = len(self._replicas)
+            stats['replicas_healthy'] = sum(1 for r in self._replicas if r.down_until <= now)
+            stats['replica_max_lag'] = max((r.lag for r in self._replicas), default=0.0)
+        return stats
+
+
+def parse_replica_hosts(value):
+    """"hote[:port],..." -> [(hote, port ou None), ...]"""
+    hosts = []
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, sep, port = entry.rpartition(':')
+        if not sep:
+            host, port = entry, None
+        elif not port.isdigit():
+            raise ValueError(f"Invalid DB_REPLICA_HOSTS entry {entry!r} (expected host[:port])")
+        hosts.append((host, port))
+    return hosts
+
+
+_router = None
+
+
+def get_router():
+    """Routeur du processus : pool primaire + un pool par entrée de DB_REPLICA_HOSTS"""
+    global _router
+    if _router is None:
+        primary = get_pool()
+        with _pool_lock:
+            if _router is None:
+                replicas = []
+                for host, port in parse_replica_hosts(os.getenv('DB_REPLICA_HOSTS')):
+                    pool = ConnectionPool(
+                        connect_fn=lambda host=host, port=port: connect(host, port),
+                        maxsize=primary.maxsize,
+                        timeout=float(os.getenv('DB_REPLICA_TIMEOUT', '1')),
+                        max_lifetime=primary.max_lifetime,
+                        check_idle=primary.check_idle,
+                        replica=True,
+                    )
+                    secretstore.on_change(('DB_PASSWORD',), lambda names, pool=pool: pool.invalidate())
+                    replicas.append((f"{host}:{port or os.getenv('DB_PORT', '5432')}", pool))
+                _router = ReplicaRouter(
+                    primary, replicas,
+                    max_lag=float(os.getenv('DB_REPLICA_MAX_LAG', '1')),
+                    retry=float(os.getenv('DB_REPLICA_RETRY', '30')),
+                    check_interval=float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5')),
+                )
+    return _router
+
+
+def get_db_connection(readonly=False):
+    """
+    Emprunte une connexion au pool ; conn.close() la rend au pool.
+
+    `readonly=True` : lecture qui tolère quelques instants de retard, servie
+    par un réplica quand il y en a un de sain (voir is_replica).
+    """
+    if not readonly:
+        return get_pool().getconn()
+    return get_router().getconn(readonly=True)
+
+
+def is_replica(conn):
+    """Connexion servie par un réplica : un résultat absent peut être une écriture pas encore répliquée"""
+    return getattr(conn, 'replica', False) is True
+
+
+def reread_connection():
+    """Connexion du primaire pour relire après un résultat de réplica incomplet (comptée)"""
+    return get_router().reread()
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Unité de travail courte d'un handler sur `conn`, à ouvrir après les
+    calculs coûteux (hash) et à refermer avant.
+
+    - mode session : autocommit, chaque instruction est validée seule (ni
+      BEGIN ni COMMIT, une lecture coûte un aller-retour) ;
+    - mode transaction : transaction explicite, COMMIT à la sortie, ROLLBACK
+      si une exception la traverse ; le pooler récupère la session serveur
+      au COMMIT, jamais laissée "idle in transaction".
+    """
+    if not TRANSACTION_POOLING:
+        conn.autocommit = True
+        yield conn
+        return
+    conn.autocommit = False
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+_plain_statements = {}
+
+
+def plain_statement(statement):
+    """`statement` en paramètres psycopg2 ($1 -> %(1)s), sans préparation serveur (mis en cache)"""
+    plain = _plain_statements.get(statement)
+    if plain is None:
+        plain = _PARAM.sub(r'%(\1)s', statement.replace('%', '%%'))
+        _plain_statements[statement] = plain
+    return plain
+
+
+def execute_prepared(conn, cursor, name, statement, params):
+    """
+    Exécute `statement` (paramètres $1, $2...) préparé côté serveur, une seule
+    fois par connexion physique du pool : les appels suivants ne renvoient que
+    EXECUTE, sans nouvelle analyse du SQL.
+
+    Derrière un pooler en mode transaction, une requête préparée resterait sur
+    une session serveur que la transaction suivante n'aura peut-être pas :
+    `statement` est alors exécuté tel quel.
+    """
+    if TRANSACTION_POOLING:
+        cursor.execute(plain_statement(statement), {str(i): value for i, value in enumerate(params, 1)})
+        return
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})"
+    if name not in conn.prepared:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared.add(name)
+    try:
+        cursor.execute(execute, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Session réinitialisée côté serveur (DISCARD ALL...) : on prépare à nouveau
+        if not conn.autocommit:
+            conn.rollback()
+        conn.prepared.clear()
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared.add(name)
+        cursor.execute(execute, params)
+
+
+def pool_stats():
+    """Compteurs du pool (vide si aucune connexion n'a encore été demandée)"""
+    return _pool.stats() if _pool is not None else {}
+
+
+def routing_stats():
+    """Compteurs du routage primaire / réplicas (vide avant la première lecture routée)"""
+    return _router.stats() if _router is not None else {}
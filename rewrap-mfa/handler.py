@@ -0,0 +1,203 @@
+import logging
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import get_db_connection
+import codec
+import jsonlog
+import metrics
+import mfa_keys
+
+log = logging.getLogger('rewrap-mfa')
+
+# Un point de reprise par clé active : une nouvelle rotation repart du début
+CHECKPOINT_PREFIX = 'rewrap-mfa:'
+
+# Paramètres optionnels du corps ; absents, ils viennent de l'environnement
+RewrapRequest = codec.struct('RewrapRequest', ('batch_size', int, None), ('max_batches', int, None),
+                             ('reset', bool, False))
+
+NOT_POSITIVE = codec.error(400, "batch_size and max_batches must be positive")
+NOT_INTEGERS = codec.error(400, "batch_size and max_batches must be integers")
+
+# Secrets à réécrire, lus en flux par un curseur côté serveur dans l'ordre des id
+# (clé primaire) : les valeurs déjà chiffrées par la clé active sont filtrées en base
+SCAN = """
+    SELECT id, mfa
+    FROM users
+    WHERE id > %(after_id)s
+      AND mfa IS NOT NULL AND mfa <> ''
+      AND left(mfa, %(prefix_length)s) <> %(prefix)s
+    ORDER BY id
+"""
+
+# Vérification de fin de passe, sans point de reprise : pendant le déploiement
+# d'une rotation, un réplica encore sur l'ancienne clé peut écrire derrière le
+# point de reprise
+REMAINING = """
+    SELECT count(*)
+    FROM users
+    WHERE mfa IS NOT NULL AND mfa <> ''
+      AND left(mfa, %(prefix_length)s) <> %(prefix)s
+"""
+
+# Un UPDATE par lot ; une valeur modifiée depuis la lecture (nouvel enrôlement)
+# n'est pas écrasée
+REWRAP_BATCH = """
+    UPDATE users AS u SET mfa = v.mfa
+    FROM (VALUES %s) AS v(id, mfa, old)
+    WHERE u.id = v.id AND u.mfa = v.old
+"""
+
+def load_checkpoint(cursor, name):
+    """Dernier id traité pour cette clé active, ou 0"""
+    cursor.execute("SELECT last_id FROM sweeper_checkpoints WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row is not None and row[0] is not None else 0
+
+def save_checkpoint(cursor, name, last_id):
+    cursor.execute("""
+        INSERT INTO sweeper_checkpoints (name, last_id, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (name) DO UPDATE
+        SET last_id = EXCLUDED.last_id, updated_at = NOW()
+    """, (name, last_id))
+
+def rewrap_rows(keyring, rows):
+    """(id, nouvelle valeur, ancienne valeur) des lignes déchiffrables, et les id en échec"""
+    updates, failed = [], []
+    for user_id, stored in rows:
+        try:
+            updates.append((user_id, keyring.rewrap(stored), stored))
+        except Exception:
+            failed.append(user_id)
+    return updates, failed
+
+def rewrap(reader, writer, keyring, batch_size=500, max_batches=100, reset=False):
+    """
+    Rechiffre par la clé active les secrets 2FA historiques ou chiffrés par une
+    ancienne clé, par lots, un commit par lot.
+
+    La lecture passe par un curseur côté serveur sur sa propre connexion (la
+    table n'est jamais chargée en mémoire) ; les UPDATE et le point de reprise
+    sont validés ensemble sur la seconde : une exécution interrompue reprend
+    après le dernier lot validé.
+
+    Arrivée au bout de la table, une passe de vérification compte les secrets
+    qui ne sont toujours pas chiffrés par la clé active, point de reprise
+    ignoré. `done` n'est vrai que si elle n'en trouve aucun ; sinon le point
+    de reprise revient à 0 et l'exécution suivante repart du début.
+    """
+    name = CHECKPOINT_PREFIX + keyring.active_id
+    cursor = writer.cursor()
+    if reset:
+        save_checkpoint(cursor, name, 0)
+        writer.commit()
+    after_id = load_checkpoint(cursor, name)
+    writer.commit()
+
+    scan = reader.cursor(name='rewrap_mfa_scan')
+    scan.itersize = batch_size
+    scan.execute(SCAN, {'after_id': after_id, 'prefix': keyring.prefix, 'prefix_length': len(keyring.prefix)})
+
+    started = time.perf_counter()
+    scanned = rewrapped = batches = 0
+    failed = []
+    end_reached = False
+    while batches < max_batches:
+        rows = scan.fetchmany(batch_size)
+        if rows:
+            encrypt_started = metrics.clock()
+            updates, batch_failed = rewrap_rows(keyring, rows)
+            metrics.since('encrypt', encrypt_started)
+            with metrics.phase('update'):
+                if updates:
+                    execute_values(cursor, REWRAP_BATCH, updates, page_size=len(updates))
+                    rewrapped += cursor.rowcount
+                after_id = rows[-1][0]
+                save_checkpoint(cursor, name, after_id)
+                writer.commit()
+            scanned += len(rows)
+            failed.extend(batch_failed)
+        batches += 1
+        if len(rows) < batch_size:
+            end_reached = True
+            break
+    scan.close()
+    reader.rollback()
+
+    remaining = None
+    if end_reached:
+        with metrics.phase('verify'):
+            cursor.execute(REMAINING, {'prefix': keyring.prefix, 'prefix_length': len(keyring.prefix)})
+            remaining = cursor.fetchone()[0]
+            if remaining:
+                after_id = 0
+                save_checkpoint(cursor, name, after_id)
+            writer.commit()
+    cursor.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "active_key": keyring.active_id,
+        "scanned": scanned,
+        "rewrapped": rewrapped,
+        "failed": len(failed),
+        "failed_ids": failed[:100],
+        "batches": batches,
+        "remaining": remaining,
+        "done": remaining == 0,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(scanned / elapsed, 1) if elapsed > 0 else None,
+        "checkpoint": {"id": after_id},
+    }
+
+def handle(event, context):
+    reader = writer = None
+    try:
+        request = RewrapRequest.from_json(getattr(event, 'body', None))
+
+        batch_size, max_batches, reset = request
+        if batch_size is None:
+            batch_size = int(os.getenv('REWRAP_BATCH_SIZE', '500'))
+        if max_batches is None:
+            max_batches = int(os.getenv('REWRAP_MAX_BATCHES', '100'))
+        if batch_size <= 0 or max_batches <= 0:
+            return NOT_POSITIVE
+
+        try:
+            keyring = mfa_keys.keyring()
+        except ValueError as e:
+            jsonlog.event(log, 'mfa.keyring_invalid', level=logging.ERROR, error=str(e))
+            return codec.error(500, str(e))
+        # Lecture sur le primaire : un réplica en retard masquerait des lignes
+        # encore écrites avec l'ancienne clé ; l'UPDATE ne touche que les
+        # valeurs inchangées depuis la lecture
+        reader = get_db_connection()
+        writer = get_db_connection()
+        report = rewrap(reader, writer, keyring, batch_size, max_batches, reset=reset)
+
+        jsonlog.event(log, 'mfa.rewrapped', active_key=report['active_key'], scanned=report['scanned'],
+                      rewrapped=report['rewrapped'], failed=report['failed'], remaining=report['remaining'],
+                      done=report['done'], rows_per_second=report['rows_per_second'])
+        return codec.response(200, dict(report, success=True))
+
+    except psycopg2.Error as e:
+        jsonlog.event(log, 'db.error', level=logging.ERROR, error=str(e))
+        return codec.error(500, f"Database error: {e}")
+    except codec.DecodeError:
+        return codec.INVALID_JSON
+    except codec.ValidationError as e:
+        return codec.error(400, str(e))
+    except ValueError:
+        return NOT_INTEGERS
+    except Exception as e:
+        log.error('internal error', exc_info=e)
+        return codec.error(500, f"Internal server error: {e}")
+    finally:
+        for conn in (reader, writer):
+            if conn is not None:
+                conn.close()
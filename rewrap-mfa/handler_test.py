@@ -0,0 +1,137 @@
+import base64
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+
+import mfa_keys
+from handler import handle, rewrap
+
+
+class FakeWriterCursor:
+    """Curseur d'écriture simulé : checkpoint en mémoire, UPDATE comptés"""
+
+    def __init__(self, checkpoint=None, remaining=0):
+        self.checkpoint = checkpoint
+        self.remaining = remaining
+        self.rowcount = 0
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if "FROM sweeper_checkpoints" in sql:
+            self._result = (self.checkpoint,) if self.checkpoint is not None else None
+        elif "INSERT INTO sweeper_checkpoints" in sql:
+            self.checkpoint = params[1]
+        elif "count(*)" in sql:
+            self._result = (self.remaining,)
+
+    def fetchone(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class TestRewrapMfa(unittest.TestCase):
+
+
+    def make_scan(self, batches):
+        reader = MagicMock()
+        scan = reader.cursor.return_value
+        scan.fetchmany.side_effect = list(batches) + [[]]
+        return reader, scan
+
+    @patch('handler.execute_values')
+    def test_rewrap_batches_and_checkpoints(self, mock_execute_values):
+        """Un UPDATE et un commit par lot, point de reprise = dernier id lu"""
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        legacy_key = os.urandom(32)
+        keyring = mfa_keys.Keyring({"k0": legacy_key, "k1": os.urandom(32)}, "k1", legacy_id="k0")
+        nonce = os.urandom(12)
+        legacy = base64.b64encode(nonce + AESGCM(legacy_key).encrypt(nonce, b"LEGACYSECRETLEGACY", None)).decode()
+        batches = [[(3, legacy), (5, "JBSWY3DPEHPK3PXP")], [(8, "k9:" + "A" * 60)]]
+        reader, scan = self.make_scan(batches)
+        writer = MagicMock()
+        cursor = FakeWriterCursor(checkpoint=2)
+        writer.cursor.return_value = cursor
+        mock_execute_values.side_effect = lambda cur, sql, rows, **kw: setattr(cur, 'rowcount', len(rows))
+
+        report = rewrap(reader, writer, keyring, batch_size=2, max_batches=10)
+
+        self.assertEqual(reader.cursor.call_args.kwargs["name"], "rewrap_mfa_scan")
+        params = scan.execute.call_args.args[1]
+        self.assertEqual((params["after_id"], params["prefix"]), (2, "k1:"))
+        rows = mock_execute_values.call_args_list[0].args[2]
+        self.assertEqual([row[0] for row in rows], [3, 5])
+        self.assertTrue(all(keyring.is_current(row[1]) for row in rows))
+        self.assertEqual(keyring.decrypt(rows[0][1]), "LEGACYSECRETLEGACY")
+        self.assertEqual(keyring.decrypt(rows[1][1]), "JBSWY3DPEHPK3PXP")
+        self.assertEqual(mock_execute_values.call_count, 1)  # 2e lot : clé inconnue, rien à écrire
+        self.assertEqual((report["scanned"], report["rewrapped"], report["failed"]), (3, 2, 1))
+        self.assertEqual(report["failed_ids"], [8])
+        self.assertEqual(report["remaining"], 0)
+        self.assertTrue(report["done"])
+        self.assertEqual(cursor.checkpoint, 8)
+        self.assertEqual(report["checkpoint"], {"id": 8})
+        self.assertEqual(writer.commit.call_count, 4)  # lecture du checkpoint + 2 lots + vérification
+
+    @patch('handler.execute_values')
+    def test_rows_behind_checkpoint_restart_pass(self, mock_execute_values):
+        """Ancienne clé écrite derrière le point de reprise : pas fini, reprise à 0"""
+        keyring = mfa_keys.Keyring({"k0": os.urandom(32), "k1": os.urandom(32)}, "k1", legacy_id="k0")
+        reader, _ = self.make_scan([])
+        writer = MagicMock()
+        cursor = FakeWriterCursor(checkpoint=900, remaining=3)
+        writer.cursor.return_value = cursor
+
+        report = rewrap(reader, writer, keyring, batch_size=100)
+
+        self.assertEqual(report["remaining"], 3)
+        self.assertFalse(report["done"])
+        self.assertEqual(cursor.checkpoint, 0)
+        self.assertEqual(report["checkpoint"], {"id": 0})
+
+    @patch('handler.execute_values')
+    def test_unfinished_pass_skips_verification(self, mock_execute_values):
+        keyring = mfa_keys.Keyring({"k0": os.urandom(32), "k1": os.urandom(32)}, "k1", legacy_id="k0")
+        reader, _ = self.make_scan([[(1, "JBSWY3DPEHPK3PXP")]])
+        writer = MagicMock()
+        cursor = FakeWriterCursor(remaining=5)
+        writer.cursor.return_value = cursor
+
+        report = rewrap(reader, writer, keyring, batch_size=1, max_batches=1)
+
+        self.assertIsNone(report["remaining"])
+        self.assertFalse(report["done"])
+        self.assertEqual(cursor.checkpoint, 1)
+
+    @patch('handler.get_db_connection')
+    def test_handle_reports_throughput(self, mock_db):
+        keyring = mfa_keys.Keyring({"k0": os.urandom(32), "k1": os.urandom(32)}, "k1", legacy_id="k0")
+        reader, _ = self.make_scan([])
+        writer = MagicMock()
+        writer.cursor.return_value = FakeWriterCursor()
+        mock_db.side_effect = [reader, writer]
+
+        event = MagicMock()
+        event.body = json.dumps({"batch_size": 100, "reset": True})
+        with patch('mfa_keys._keyring', keyring):
+            result = handle(event, MagicMock())
+
+        self.assertEqual(result["statusCode"], 200)
+        body = json.loads(result["body"])
+        self.assertTrue(body["success"] and body["done"])
+        self.assertEqual((body["active_key"], body["scanned"]), ("k1", 0))
+        self.assertIn("rows_per_second", body)
+        self.assertEqual([c.kwargs for c in mock_db.call_args_list], [{}, {}])  # primaire seulement
+        reader.close.assert_called_once()
+        writer.close.assert_called_once()
+
+    def test_handle_rejects_non_positive(self):
+        event = MagicMock()
+        event.body = json.dumps({"batch_size": 0})
+        self.assertEqual(handle(event, MagicMock())["statusCode"], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Journalisation structurée (une ligne JSON par événement), commune aux fonctions.
+
+Les handlers journalisent par `logging.getLogger(...)` et `event()` ; seul le
+point d'entrée (index.py, asgi.py) appelle `configure()`. Les enregistrements
+passent par une file (QueueHandler) : l'écriture sur stdout est faite par un
+thread dédié, jamais par le thread de la requête.
+
+Variables d'environnement :
+- LOG_LEVEL : niveau minimal (INFO par défaut) ;
+- LOG_SAMPLE : taux d'échantillonnage par événement, ex.
+  "auth.success=0.01,http.request=0.1". Seuls les niveaux inférieurs à
+  WARNING sont échantillonnés, les erreurs sont toujours écrites.
+
+L'identifiant de requête vient des en-têtes X-Request-Id ou X-Call-Id (posé
+par la passerelle OpenFaaS), sinon il est généré.
+"""
+
+import atexit
+import contextvars
+import copy
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+
+REQUEST_ID_HEADERS = ('X-Request-Id', 'X-Call-Id')
+
+# Événements de succès à fort volume : un sur dix par défaut
+DEFAULT_SAMPLING = {'auth.success': 0.1, 'http.request': 0.1}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_listener = None
+
+
+def bind_request(headers=None):
+    """Associe un identifiant de requête au contexte courant et le renvoie"""
+    request_id = None
+    if headers is not None:
+        for name in REQUEST_ID_HEADERS:
+            value = headers.get(name)
+            if isinstance(value, str) and value.strip():
+                request_id = value.strip()[:128]
+                break
+    if request_id is None:
+        request_id = uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+
+def request_id():
+    return _request_id.get()
+
+
+def in_context(fn):
+    """`fn` exécutée dans une copie du contexte courant (run_in_executor)"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def event(logger, name, level=logging.INFO, **fields):
+    """Journalise l'événement `name` avec ses champs structurés"""
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={'event': name, 'fields': fields})
+
+
+def parse_sampling(spec):
+    """"a=0.1,b=1" -> {'a': 0.1, 'b': 1.0}"""
+    rates = dict(DEFAULT_SAMPLING)
+    for part in (spec or '').split(','):
+        if '=' in part:
+            name, rate = part.split('=', 1)
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Échantillonne par événement et fige l'identifiant de requête avant la file"""
+
+    def __init__(self, rates=None, rand=random.random):
+        super().__init__()
+        self.rates = rates or {}
+        self._rand = rand
+
+    def filter(self, record):
+        name = getattr(record, 'event', None)
+        if record.levelno < logging.WARNING and name is not None:
+            rate = self.rates.get(name, 1.0)
+            if rate < 1.0 and self._rand() >= rate:
+                return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Met en file l'enregistrement sans le formater (le thread d'écriture s'en charge)"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': getattr(record, 'event', None) or record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id is not None:
+            entry['request_id'] = request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(level=None, sampling=None, stream=None):
+    """
+    Installe (une seule fois) la file de journalisation sur le logger racine.
+    Renvoie le QueueHandler installé.
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        return root.handlers[0]
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(ContextFilter(parse_sampling(os.getenv('LOG_SAMPLE') if sampling is None else sampling)))
+
+    root.handlers[:] = [handler]
+    root.setLevel(level or os.getenv('LOG_LEVEL', 'INFO').upper())
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    return handler
+
+
+def shutdown():
+    """Vide la file et arrête le thread d'écriture"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""
+Point d'entrée ASGI optionnel, alternative à index.py (Flask + waitress).
+
+Si la fonction fournit function/handler_async.py avec un `async def handle`,
+chaque requête est une coroutine : une attente sur PostgreSQL n'occupe plus
+de thread. Sinon le handler synchrone tourne dans le pool de threads par défaut.
+
+Activation : fprocess="python asgi.py" (variable d'environnement de la fonction).
+"""
+import time
+_STARTED = time.perf_counter()  # démarrage à froid : mesuré dès le premier import
+
+import asyncio
+import contextvars
+import functools
+import importlib.util
+import json
+import logging
+import os
+import sys
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'function'))
+
+_handler_started = time.perf_counter()
+if importlib.util.find_spec('function.handler_async') is not None:
+    from function import handler_async as handler
+    is_async = True
+else:
+    from function import handler
+    is_async = False
+HANDLER_IMPORT_SECONDS = time.perf_counter() - _handler_started
+
+try:
+    import jsonlog  # function/jsonlog.py : journaux JSON via une file
+except ImportError:
+    jsonlog = None
+
+try:
+    import metrics  # function/metrics.py : histogrammes de latence par phase
+except ImportError:
+    metrics = None
+
+try:
+    import tracing  # function/tracing.py : traces par requête (TRACE_EXPORTER)
+except ImportError:
+    tracing = None
+
+if jsonlog is not None:
+    jsonlog.configure()
+log = logging.getLogger('asgi')
+
+# Rapport de démarrage : durées d'import exposées par /metrics (function_startup{key=...})
+STARTUP = {'handler_import_seconds': HANDLER_IMPORT_SECONDS}
+if metrics is not None:
+    metrics.register_gauges('startup', lambda: STARTUP)
+
+
+class Headers(dict):
+    """En-têtes HTTP accessibles sans tenir compte de la casse"""
+
+    def __init__(self, raw):
+        super().__init__((k.decode('latin-1').lower(), v.decode('latin-1')) for k, v in raw)
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+
+class Event:
+    def __init__(self, scope, body):
+        self.body = body
+        self.headers = Headers(scope['headers'])
+        self.method = scope['method']
+        # Valeurs décodées (%xx, '+'), première valeur d'un paramètre répété, comme wsgi.py
+        self.query = {}
+        for key, value in parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True):
+            self.query.setdefault(key, value)
+        self.path = scope['path']
+
+
+class Context:
+    def __init__(self):
+        self.hostname = os.getenv('HOSTNAME', 'localhost')
+
+
+def format_response(resp):
+    """(status, en-têtes, corps bytes) à partir du retour du handler"""
+    if resp is None:
+        return 200, [], b''
+    if not isinstance(resp, dict):
+        return 200, [], str(resp).encode()
+
+    status = resp.get('statusCode', 200)
+    headers = resp.get('headers') or {}
+    # Copie : les réponses constantes des handlers ne doivent pas être modifiées
+    headers = list(headers.items()) if isinstance(headers, dict) else list(headers)
+    body = resp.get('body', '')
+    if isinstance(body, dict):
+        body = json.dumps(body).encode()
+        headers.append(('Content-Type', 'application/json'))
+    elif isinstance(body, bytes) or hasattr(body, '__next__'):
+        # Corps déjà encodé par le handler (codec.py), ou générateur de bytes diffusé
+        if not any(k.lower() == 'content-type' for k, _ in headers):
+            headers.append(('Content-Type', 'application/json'))
+    else:
+        body = str(body).encode()
+    return status, headers, body
+
+
+async def read_body(receive):
+    chunks = []
+    more = True
+    while more:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def report_startup():
+    """Durée entre le premier import et le service prêt, journalisée une fois"""
+    STARTUP['ready_seconds'] = time.perf_counter() - _STARTED
+    if jsonlog is not None:
+        jsonlog.event(log, 'startup', handler_import_ms=round(HANDLER_IMPORT_SECONDS * 1000, 1),
+                      ready_ms=round(STARTUP['ready_seconds'] * 1000, 1))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            report_startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if is_async and hasattr(handler, 'shutdown'):
+                await handler.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def call_handler(event, context):
+    if is_async:
+        response_data = await handler.handle(event, context)
+    else:
+        loop = asyncio.get_running_loop()
+        # Copie du contexte : identifiant de requête, mesures et trace suivent dans le thread
+        handle = functools.partial(contextvars.copy_context().run, handler.handle)
+        response_data = await loop.run_in_executor(None, handle, event, context)
+    if tracing is not None:
+        with tracing.span('serialize'):
+            return format_response(response_data)
+    return format_response(response_data)
+
+
+async def send_metrics(send):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': metrics.render().encode()})
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if metrics is not None and scope['path'] == '/metrics' and scope['method'] == 'GET':
+        return await send_metrics(send)
+
+    start = time.perf_counter()
+    timings = metrics.start() if metrics is not None else None
+    event = Event(scope, await read_body(receive))
+    if jsonlog is not None:
+        jsonlog.bind_request(event.headers)
+    context = Context()
+    root = tracing.start_trace('call_handler', event.headers, method=event.method, path=event.path) \
+        if tracing is not None else None
+    if root is None:
+        status, headers, body = await call_handler(event, context)
+    else:
+        with root:
+            status, headers, body = await call_handler(event, context)
+            root.set('status', status)
+            if status >= 500:
+                root.status = 'error'
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers],
+        })
+        if isinstance(body, bytes):
+            await send({'type': 'http.response.body', 'body': body})
+        else:
+            await send_stream(send, body)
+    finally:
+        # Après le dernier morceau : les phases d'un corps diffusé comptent dans la mesure
+        if timings is not None:
+            metrics.finish(timings, status)
+        if jsonlog is not None:
+            jsonlog.event(log, 'http.request', level=logging.WARNING if status >= 500 else logging.INFO,
+                          method=event.method, path=event.path, status=status,
+                          duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+
+async def send_stream(send, chunks):
+    """Corps diffusé : chaque morceau est produit dans le pool de threads (le générateur peut attendre PostgreSQL)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    while True:
+        chunk = await loop.run_in_executor(None, context.run, next, chunks, None)
+        if chunk is None:
+            break
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000, log_level='warning',
+                backlog=int(os.getenv('ASGI_BACKLOG', '4096')))
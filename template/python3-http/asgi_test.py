@@ -0,0 +1,80 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import asgi
+from wsgi_test import echo
+
+
+def request(method='GET', path='/', query=b'', body=b'', headers=()):
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    }
+    # Corps reçu en deux messages, comme d'un client qui envoie par morceaux
+    messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, chunks = sent[0], sent[1:]
+    response_headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in chunks)
+
+
+class TestAsgi(unittest.TestCase):
+
+    @patch.object(asgi.handler, 'handle', echo)
+    def test_request_round_trip(self):
+        status, headers, body = request(
+            'POST', '/function/echo', query=b'name=Jos%C3%A9+M&empty=&flag&name=second', body=b'{"a": 1}',
+            headers=[('Content-Type', 'application/json'), ('X-Trace-Id', 'abc')])
+
+        self.assertEqual(status, 201)
+        self.assertEqual(headers['X-Echo'], '1')
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(body), {
+            "method": "POST",
+            "path": "/function/echo",
+            "query": {"name": "José M", "empty": "", "flag": ""},
+            "body": '{"a": 1}',
+            "content_type": "application/json",
+            "trace": "abc",
+        })
+
+    @patch.object(asgi.handler, 'handle', lambda event, context: {"body": iter([b'{"n":1}\n', b'{"n":2}\n'])})
+    def test_streamed_body(self):
+        status, headers, body = request()
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'{"n":1}\n{"n":2}\n')
+
+    def test_streamed_body_finishes_metrics_after_last_chunk(self):
+        events = []
+        metrics = MagicMock()
+        metrics.finish.side_effect = lambda timings, status: events.append(('finish', status))
+
+        def chunks():
+            for n in (1, 2):
+                events.append(('chunk', n))
+                yield b'{"n":%d}\n' % n
+
+        with patch('asgi.metrics', metrics), \
+                patch.object(asgi.handler, 'handle', lambda event, context: {"body": chunks()}):
+            status, headers, body = request()
+
+        self.assertEqual(body, b'{"n":1}\n{"n":2}\n')
+        self.assertEqual(events, [('chunk', 1), ('chunk', 2), ('finish', 200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,51 @@
 #!/usr/bin/env python
+import time
+_STARTED = time.perf_counter()  # démarrage à froid : mesuré dès le premier import
+
 from flask import Flask, request, jsonify
 from waitress import serve
+import logging
 import os
+import signal
+import sys
+
+# Les modules partagés du dossier function/ (db.py, ...) s'importent à plat
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'function'))
 
+_handler_started = time.perf_counter()
 from function import handler
+HANDLER_IMPORT_SECONDS = time.perf_counter() - _handler_started
+
+try:
+    import jsonlog  # function/jsonlog.py : journaux JSON via une file
+except ImportError:
+    jsonlog = None
+
+try:
+    import metrics  # function/metrics.py : histogrammes de latence par phase
+except ImportError:
+    metrics = None
+
+try:
+    import tracing  # function/tracing.py : traces par requête (TRACE_EXPORTER)
+except ImportError:
+    tracing = None
+
+if jsonlog is not None:
+    jsonlog.configure()
+log = logging.getLogger('index')
+
+# Rapport de démarrage : durées d'import exposées par /metrics (function_startup{key=...})
+STARTUP = {'handler_import_seconds': HANDLER_IMPORT_SECONDS}
+if metrics is not None:
+    metrics.register_gauges('startup', lambda: STARTUP)
+
+def report_startup():
+    """Durée entre le premier import et le service prêt, journalisée une fois"""
+    STARTUP['ready_seconds'] = time.perf_counter() - _STARTED
+    if jsonlog is not None:
+        jsonlog.event(log, 'startup', handler_import_ms=round(HANDLER_IMPORT_SECONDS * 1000, 1),
+                      ready_ms=round(STARTUP['ready_seconds'] * 1000, 1))
 
 app = Flask(__name__)
 
@@ -30,6 +72,12 @@ def format_body(resp):
         return ""
     elif type(resp['body']) == dict:
         return jsonify(resp['body'])
+    elif type(resp['body']) == bytes:
+        # Corps déjà encodé par le handler (codec.py)
+        return resp['body']
+    elif hasattr(resp['body'], '__next__'):
+        # Générateur de bytes : réponse diffusée au fil de l'eau (ex. NDJSON)
+        return resp['body']
     else:
         return str(resp['body'])
 
@@ -53,20 +101,88 @@ def format_response(resp):
         statusCode = format_status_code(resp)
         body = format_body(resp)
         headers = format_headers(resp)
+        if (type(body) == bytes or hasattr(body, '__next__')) and not any(k.lower() == 'content-type' for k, _ in headers):
+            headers = list(headers) + [('Content-Type', 'application/json')]
 
         return (body, statusCode, headers)
 
     return resp
 
+if metrics is not None:
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return (metrics.render(), 200, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+
+def response_status(resp):
+    return resp[1] if isinstance(resp, tuple) and len(resp) > 1 else 200
+
+class StreamedBody:
+    """
+    Corps diffusé (générateur) : `on_close` n'est appelé qu'à la fermeture de
+    l'itérateur par le serveur, après le dernier morceau, pour que les phases
+    exécutées pendant la diffusion comptent dans la mesure de la requête.
+    """
+
+    def __init__(self, chunks, on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        try:
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+        finally:
+            if on_close is not None:
+                on_close()
+
 @app.route('/', defaults={'path': ''}, methods=['GET', 'PUT', 'POST', 'PATCH', 'DELETE'])
 @app.route('/<path:path>', methods=['GET', 'PUT', 'POST', 'PATCH', 'DELETE'])
 def call_handler(path):
+    start = time.perf_counter()
+    timings = metrics.start() if metrics is not None else None
+    if jsonlog is not None:
+        jsonlog.bind_request(request.headers)
     event = Event()
     context = Context()
-    response_data = handler.handle(event, context)
-    
-    resp = format_response(response_data)
+    root = tracing.start_trace('call_handler', event.headers, method=event.method, path=event.path) \
+        if tracing is not None else None
+    if root is None:
+        resp = format_response(handler.handle(event, context))
+        status = response_status(resp)
+    else:
+        with root:
+            response_data = handler.handle(event, context)
+            with tracing.span('serialize'):
+                resp = format_response(response_data)
+            status = response_status(resp)
+            root.set('status', status)
+            if status >= 500:
+                root.status = 'error'
+
+    def done():
+        if timings is not None:
+            metrics.finish(timings, status)
+        if jsonlog is not None:
+            jsonlog.event(log, 'http.request', level=logging.WARNING if status >= 500 else logging.INFO,
+                          method=event.method, path=event.path, status=status,
+                          duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+    if isinstance(resp, tuple) and hasattr(resp[0], '__next__'):
+        return (StreamedBody(resp[0], done),) + resp[1:]
+    done()
     return resp
 
 if __name__ == '__main__':
-    serve(app, host='0.0.0.0', port=5000)
+    # SIGTERM (arrêt du pod) -> SystemExit : les hooks atexit des fonctions s'exécutent
+    # (ex. vidage du tampon d'activité d'authenticate-user)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    report_startup()
+    # Le pool de connexions (function/db.py) est dimensionné sur cette valeur
+    serve(app, host='0.0.0.0', port=5000, threads=int(os.getenv('WAITRESS_THREADS', '4')))
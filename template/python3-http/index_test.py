@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import index
+
+
+class TestIndex(unittest.TestCase):
+
+    def test_streamed_body_finishes_metrics_after_last_chunk(self):
+        """Mesure close à la fermeture du corps diffusé, pas au retour du handler"""
+        events = []
+        metrics = MagicMock()
+        metrics.finish.side_effect = lambda timings, status: events.append(('finish', status))
+
+        def chunks():
+            for n in (1, 2):
+                events.append(('chunk', n))
+                yield b'{"n":%d}\n' % n
+
+        with patch('index.metrics', metrics), \
+                patch.object(index.handler, 'handle', lambda event, context: {"body": chunks()}):
+            response = index.app.test_client().get('/function/bulk')
+            body = response.get_data()
+            response.close()
+
+        self.assertEqual(body, b'{"n":1}\n{"n":2}\n')
+        self.assertEqual(events, [('chunk', 1), ('chunk', 2), ('finish', 200)])
+
+    def test_buffered_body_finishes_metrics_on_return(self):
+        metrics = MagicMock()
+        with patch('index.metrics', metrics), \
+                patch.object(index.handler, 'handle', lambda event, context: {"statusCode": 201, "body": b'{}'}):
+            response = index.app.test_client().post('/', data=b'{}')
+        self.assertEqual(response.status_code, 201)
+        metrics.finish.assert_called_once_with(metrics.start.return_value, 201)
+
+
+if __name__ == '__main__':
+    unittest.main()
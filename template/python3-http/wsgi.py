@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+Point d'entrée WSGI minimal, alternative à index.py sans Flask ni Werkzeug.
+
+Une seule route attrape-tout : le routage, l'objet `request` et la
+construction de réponse de Flask ne servent à rien ici. Même contrat
+`handle(event, context)` qu'index.py ; en-têtes et paramètres de requête
+ne sont construits qu'au premier accès (la plupart des handlers ne lisent
+que `event.body`). Toujours servi par waitress (WAITRESS_THREADS).
+
+Activation : fprocess="python wsgi.py" (variable d'environnement de la fonction).
+Comparaison : `python benchmarks/bench_http_shim.py`.
+"""
+import time
+_STARTED = time.perf_counter()  # démarrage à froid : mesuré dès le premier import
+
+import json
+import logging
+import os
+import signal
+import sys
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'function'))
+
+_handler_started = time.perf_counter()
+from function import handler
+HANDLER_IMPORT_SECONDS = time.perf_counter() - _handler_started
+
+try:
+    import jsonlog  # function/jsonlog.py : journaux JSON via une file
+except ImportError:
+    jsonlog = None
+
+try:
+    import metrics  # function/metrics.py : histogrammes de latence par phase
+except ImportError:
+    metrics = None
+
+try:
+    import tracing  # function/tracing.py : traces par requête (TRACE_EXPORTER)
+except ImportError:
+    tracing = None
+
+if jsonlog is not None:
+    jsonlog.configure()
+log = logging.getLogger('wsgi')
+
+# Rapport de démarrage : durées d'import exposées par /metrics (function_startup{key=...})
+STARTUP = {'handler_import_seconds': HANDLER_IMPORT_SECONDS}
+if metrics is not None:
+    metrics.register_gauges('startup', lambda: STARTUP)
+
+# Lignes de statut WSGI ("200 OK"), calculées une fois
+_STATUS_LINES = {s.value: f"{s.value} {s.phrase}" for s in HTTPStatus}
+
+# Type par défaut des corps texte, comme Flask
+_TEXT_HTML = 'text/html; charset=utf-8'
+
+
+class Headers:
+    """En-têtes lus à la demande dans l'environnement WSGI, sans tenir compte de la casse"""
+
+    __slots__ = ('_environ',)
+
+    def __init__(self, environ):
+        self._environ = environ
+
+    @staticmethod
+    def _key(name):
+        key = name.upper().replace('-', '_')
+        return key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + key
+
+    def get(self, name, default=None):
+        return self._environ.get(self._key(name), default)
+
+    def __getitem__(self, name):
+        return self._environ[self._key(name)]
+
+    def __contains__(self, name):
+        return self._key(name) in self._environ
+
+    def items(self):
+        for key, value in self._environ.items():
+            if key.startswith('HTTP_'):
+                yield key[5:].replace('_', '-').title(), value
+            elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                yield key.replace('_', '-').title(), value
+
+    def __iter__(self):
+        return self.items()
+
+
+class Event:
+    __slots__ = ('body', 'method', 'path', '_environ', '_headers', '_query')
+
+    def __init__(self, environ):
+        length = environ.get('CONTENT_LENGTH')
+        self.body = environ['wsgi.input'].read(int(length)) if length else b''
+        self.method = environ['REQUEST_METHOD']
+        self.path = environ.get('PATH_INFO') or '/'
+        self._environ = environ
+        self._headers = None
+        self._query = None
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = Headers(self._environ)
+        return self._headers
+
+    @property
+    def query(self):
+        # Première valeur d'un paramètre répété, comme request.args.get de Flask
+        if self._query is None:
+            query = {}
+            for key, value in parse_qsl(self._environ.get('QUERY_STRING', ''), keep_blank_values=True):
+                query.setdefault(key, value)
+            self._query = query
+        return self._query
+
+
+class Context:
+    def __init__(self):
+        self.hostname = os.getenv('HOSTNAME', 'localhost')
+
+
+def format_response(resp):
+    """(status, en-têtes, corps bytes) à partir du retour du handler"""
+    if resp is None:
+        return 200, [('Content-Type', _TEXT_HTML)], b''
+    if not isinstance(resp, dict):
+        return 200, [('Content-Type', _TEXT_HTML)], str(resp).encode()
+
+    status = resp.get('statusCode', 200)
+    headers = resp.get('headers') or {}
+    # Copie : les réponses constantes des handlers ne doivent pas être modifiées
+    headers = list(headers.items()) if isinstance(headers, dict) else list(headers)
+    body = resp.get('body', '')
+    if isinstance(body, dict):
+        body = json.dumps(body).encode()
+        content_type = 'application/json'
+    elif isinstance(body, bytes) or hasattr(body, '__next__'):
+        # Corps déjà encodé par le handler (codec.py), ou générateur de bytes diffusé
+        content_type = 'application/json'
+    else:
+        body = str(body).encode()
+        content_type = _TEXT_HTML
+    if not any(k.lower() == 'content-type' for k, _ in headers):
+        headers.append(('Content-Type', content_type))
+    return status, headers, body
+
+
+def call_handler(event, context):
+    response_data = handler.handle(event, context)
+    if tracing is not None:
+        with tracing.span('serialize'):
+            return format_response(response_data)
+    return format_response(response_data)
+
+
+def report_startup():
+    """Durée entre le premier import et le service prêt, journalisée une fois"""
+    STARTUP['ready_seconds'] = time.perf_counter() - _STARTED
+    if jsonlog is not None:
+        jsonlog.event(log, 'startup', handler_import_ms=round(HANDLER_IMPORT_SECONDS * 1000, 1),
+                      ready_ms=round(STARTUP['ready_seconds'] * 1000, 1))
+
+
+def send(start_response, status, headers, body):
+    if isinstance(body, bytes):
+        headers.append(('Content-Length', str(len(body))))
+    start_response(_STATUS_LINES.get(status) or f"{status} Unknown",
+                   [(k, str(v)) for k, v in headers])
+    # Générateur : waitress envoie chaque morceau dès qu'il est produit (chunked)
+    return [body] if isinstance(body, bytes) else body
+
+
+class StreamedBody:
+    """
+    Corps diffusé (générateur) : `on_close` n'est appelé qu'à la fermeture de
+    l'itérateur par waitress, après le dernier morceau, pour que les phases
+    exécutées pendant la diffusion comptent dans la mesure de la requête.
+    """
+
+    __slots__ = ('_chunks', '_on_close')
+
+    def __init__(self, chunks, on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        try:
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+        finally:
+            if on_close is not None:
+                on_close()
+
+
+def app(environ, start_response):
+    if metrics is not None and environ.get('PATH_INFO') == '/metrics' and environ['REQUEST_METHOD'] == 'GET':
+        return send(start_response, 200, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')],
+                    metrics.render().encode())
+
+    start = time.perf_counter()
+    timings = metrics.start() if metrics is not None else None
+    event = Event(environ)
+    if jsonlog is not None:
+        jsonlog.bind_request(event.headers)
+    context = Context()
+    root = tracing.start_trace('call_handler', event.headers, method=event.method, path=event.path) \
+        if tracing is not None else None
+    if root is None:
+        status, headers, body = call_handler(event, context)
+    else:
+        with root:
+            status, headers, body = call_handler(event, context)
+            root.set('status', status)
+            if status >= 500:
+                root.status = 'error'
+
+    def done():
+        if timings is not None:
+            metrics.finish(timings, status)
+        if jsonlog is not None:
+            jsonlog.event(log, 'http.request', level=logging.WARNING if status >= 500 else logging.INFO,
+                          method=event.method, path=event.path, status=status,
+                          duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+    if isinstance(body, bytes):
+        done()
+    else:
+        body = StreamedBody(body, done)
+    return send(start_response, status, headers, body)
+
+
+if __name__ == '__main__':
+    from waitress import serve
+    # SIGTERM (arrêt du pod) -> SystemExit : les hooks atexit des fonctions s'exécutent
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    report_startup()
+    # Le pool de connexions (function/db.py) est dimensionné sur cette valeur
+    serve(app, host='0.0.0.0', port=5000, threads=int(os.getenv('WAITRESS_THREADS', '4')))
@@ -0,0 +1,99 @@
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+from wsgiref.util import setup_testing_defaults
+
+import wsgi
+
+
+def echo(event, context):
+    """Handler de test : renvoie ce que l'adaptateur lui a transmis"""
+    return {
+        "statusCode": 201,
+        "headers": {"X-Echo": "1"},
+        "body": {
+            "method": event.method,
+            "path": event.path,
+            "query": event.query,
+            "body": event.body.decode(),
+            "content_type": event.headers.get('content-type'),
+            "trace": event.headers.get('X-Trace-Id'),
+        },
+    }
+
+
+def request(method='GET', path='/', query='', body=b'', headers=None):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(body)) if body else '',
+        'wsgi.input': io.BytesIO(body),
+    }
+    for name, value in (headers or {}).items():
+        key = name.upper().replace('-', '_')
+        environ[key if key == 'CONTENT_TYPE' else 'HTTP_' + key] = value
+    setup_testing_defaults(environ)
+    started = {}
+
+    def start_response(status, response_headers):
+        started['status'] = status
+        started['headers'] = dict(response_headers)
+
+    chunks = wsgi.app(environ, start_response)
+    return started['status'], started['headers'], b''.join(chunks)
+
+
+class TestWsgi(unittest.TestCase):
+
+    @patch.object(wsgi.handler, 'handle', echo)
+    def test_request_round_trip(self):
+        status, headers, body = request(
+            'POST', '/function/echo', query='name=Jos%C3%A9+M&empty=&flag&name=second',
+            body=b'{"a": 1}', headers={'Content-Type': 'application/json', 'X-Trace-Id': 'abc'})
+
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(headers['X-Echo'], '1')
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertEqual(json.loads(body), {
+            "method": "POST",
+            "path": "/function/echo",
+            "query": {"name": "José M", "empty": "", "flag": ""},
+            "body": '{"a": 1}',
+            "content_type": "application/json",
+            "trace": "abc",
+        })
+
+    @patch.object(wsgi.handler, 'handle', lambda event, context: {"body": iter([b'{"n":1}\n', b'{"n":2}\n'])})
+    def test_streamed_body(self):
+        status, headers, body = request()
+        self.assertEqual(status, '200 OK')
+        self.assertNotIn('Content-Length', headers)
+        self.assertEqual(body, b'{"n":1}\n{"n":2}\n')
+
+    def test_streamed_body_finishes_metrics_after_last_chunk(self):
+        events = []
+        metrics = MagicMock()
+        metrics.finish.side_effect = lambda timings, status: events.append(('finish', status))
+
+        def chunks():
+            for n in (1, 2):
+                events.append(('chunk', n))
+                yield b'{"n":%d}\n' % n
+
+        with patch('wsgi.metrics', metrics), \
+                patch.object(wsgi.handler, 'handle', lambda event, context: {"body": chunks()}):
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'wsgi.input': io.BytesIO()}
+            setup_testing_defaults(environ)
+            response = wsgi.app(environ, lambda status, headers: None)
+            self.assertEqual(events, [])
+            self.assertEqual(b''.join(response), b'{"n":1}\n{"n":2}\n')
+            response.close()  # appelé par waitress après l'envoi
+
+        self.assertEqual(events, [('chunk', 1), ('chunk', 2), ('finish', 200)])
+
+
+if __name__ == '__main__':
+    unittest.main()